@@ -0,0 +1,334 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from flex_grid import (AVAILABILITY_INDEXES, AVAILABLE, RENDERED_TABLES, SLOTS, ReservationError, add_names,
+                       availability_frame, build_calendar, enable_copy_on_write, render_period)
+from flex_service import DEFAULT_LAYOUT, ENGINES, LAYOUTS, BookingService, make_store
+from flex_storage import ConcurrentModificationError, LocalBackend, MemoryBackend, S3Backend, make_s3_client
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+FLEX = "Bench"
+FILE_NAME = "FlexBench.xlsx"
+START_DATE = datetime.date(2030, 1, 7)  # A Monday
+
+# Synthetic calendars of growing size: name -> (number of offices, number of years)
+CALENDARS = {
+    "small": (6, 1),
+    "medium": (20, 4),
+    "large": (50, 10),
+}
+
+# Share of the cells already reserved in the synthetic calendars
+OCCUPANCY = 0.3
+
+# Operations of a simulated user session, in order
+OPERATIONS = ["load", "display", "book_day", "book_month", "cancel"]
+
+# Number of cells booked at once by the month form of a session
+MONTH_CELLS = 10
+
+# Allowed slowdown of a latency percentile or throughput before a comparison fails
+DEFAULT_TOLERANCE = 0.25
+
+
+#####################################################################
+# =========================== CALENDARS =========================== #
+#####################################################################
+
+def synthetic_calendar(offices_count, years, seed=0):
+    """
+    Build a reservation grid with random reservations.
+
+    Parameters:
+    - offices_count (int): Number of offices.
+    - years (int): Number of years covered, from START_DATE.
+    - seed (int, optional): Seed of the random reservations. Defaults to 0.
+
+    Returns:
+    - pandas.DataFrame: The grid, with about OCCUPANCY of its cells reserved.
+    """
+    offices = [f"Bureau {i + 1}" for i in range(offices_count)]
+    end_date = START_DATE + datetime.timedelta(days=365 * years - 1)
+    df = build_calendar(offices, START_DATE, end_date)
+    rng = np.random.default_rng(seed)
+    names = ["Alice", "Bruno", "Chloé", "David"]
+    add_names(df, names)
+    for office in offices:
+        reserved = rng.random(len(df)) < OCCUPANCY
+        df.loc[reserved, office] = rng.choice(names, reserved.sum())
+    return df
+
+
+#####################################################################
+# =========================== SESSIONS ============================ #
+#####################################################################
+
+def user_session(service, user, days, offices, timings):
+    """
+    Play the session of one user: load the file, display 15 days, book a day, book cells of
+    the month form, then cancel the day. The duration of every operation is appended to `timings`.
+
+    Parameters:
+    - service (BookingService): The service to benchmark.
+    - user (int): Number of the user, which chooses the days it books (distinct from the other users).
+    - days ([datetime.date]): Business days that are free in the grid, at least 2 per user.
+    - offices ([str]): The offices of the grid.
+    - timings (dict): Operation name -> list of durations in seconds, shared by the users.
+
+    Returns:
+    - int: Number of operations that failed (unavailable office or too many conflicts).
+    """
+    name = f"user{user}"
+    day, month_day = days[2 * user], days[2 * user + 1]
+    cells = [(month_day, slot, office) for office in offices for slot in SLOTS][:MONTH_CELLS]
+    steps = [
+        # Same date windows as the pages of the application
+        ("load", lambda: service.load(FLEX, day)),
+        ("display", lambda: render_period(service.load(FLEX, day, day + datetime.timedelta(days=15)), day, 15)),
+        ("book_day", lambda: service.book(FLEX, offices[0], day, "Journée", name)),
+        ("book_month", lambda: (availability_frame(service.load(FLEX, month_day, month_day + datetime.timedelta(days=30)),
+                                                   offices, month_day, month_day + datetime.timedelta(days=30)),
+                                service.book_cells(FLEX, cells, name))),
+        ("cancel", lambda: service.cancel(FLEX, offices[0], day, "Journée")),
+    ]
+    failures = 0
+    for operation, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except (ReservationError, ConcurrentModificationError):
+            failures += 1
+        timings[operation].append(time.perf_counter() - started)
+    return failures
+
+
+def run_benchmark(service, df, users, workers):
+    """
+    Run the sessions of concurrent users against a service and measure them.
+
+    Parameters:
+    - service (BookingService): The service to benchmark. `df` is saved as the file of FLEX first.
+    - df (pandas.DataFrame): The grid stored in the service.
+    - users (int): Number of simulated users.
+    - workers (int): Number of users running at the same time.
+
+    Returns:
+    - dict: Per operation, the count and the p50/p90/p99/max latencies in milliseconds, plus the
+      throughput (operations per second), the number of failures and the peak memory (MiB)
+      of a single session measured separately.
+    """
+    offices = [column for column in df.columns if column not in ('Date', 'Créneau')]
+    # One more session than the users, to measure the memory
+    first_days = pd.bdate_range(START_DATE, periods=2 * (users + 1))
+    if len(first_days) > len(df) // len(SLOTS):
+        raise ValueError(f"The calendar is too short for {users} users.")
+    # The first days are left free, so every user can book its own days
+    df.loc[df['Date'] <= first_days[-1], offices] = AVAILABLE
+    service.store.save(df, FILE_NAME)
+    days = [day.date() for day in first_days]
+
+    # Peak memory of one session (measured apart, tracemalloc slows the code down)
+    tracemalloc.start()
+    user_session(service, users, days, offices, {operation: [] for operation in OPERATIONS})
+    peak_memory = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+
+    timings = {operation: [] for operation in OPERATIONS}
+    lock = threading.Lock()
+
+    def session(user):
+        local = {operation: [] for operation in OPERATIONS}
+        failures = user_session(service, user, days, offices, local)
+        with lock:
+            for operation, durations in local.items():
+                timings[operation].extend(durations)
+        return failures
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        failures = sum(executor.map(session, range(users)))
+    elapsed = time.perf_counter() - started
+
+    results = {"operations": {}, "failures": failures, "peak_memory_mib": round(peak_memory, 1),
+               "throughput": round(sum(len(d) for d in timings.values()) / elapsed, 1)}
+    for operation, durations in timings.items():
+        milliseconds = np.array(durations) * 1000
+        results["operations"][operation] = {
+            "count": len(durations),
+            **{f"p{q}": round(float(np.percentile(milliseconds, q)), 2) for q in (50, 90, 99)},
+            "max": round(float(milliseconds.max()), 2),
+        }
+    return results
+
+
+#####################################################################
+# =========================== BACKENDS ============================ #
+#####################################################################
+
+@contextlib.contextmanager
+def open_backend(kind, s3_endpoint=None, bucket="flex-benchmark"):
+    """
+    Provide an empty storage backend of the given kind, removed afterwards.
+
+    Parameters:
+    - kind (str): "memory", "local" (a temporary folder, as used by flex_office_booking_myodata.py)
+      or "s3" (a moto server given by `s3_endpoint`, or moto in process if no endpoint is given).
+    - s3_endpoint (str, optional): Endpoint of an S3 stand-in.
+    - bucket (str, optional): Name of the bucket created for the benchmark.
+
+    Yields:
+    - (StorageBackend, str): The backend, and a temporary folder for the SQLite database.
+    """
+    folder = tempfile.mkdtemp(prefix="flex-benchmark-")
+    try:
+        if kind == "memory":
+            yield MemoryBackend(), folder
+        elif kind == "local":
+            yield LocalBackend(os.path.join(folder, "flexoffice")), folder
+        elif s3_endpoint:
+            client = make_s3_client(endpoint_url=s3_endpoint, region_name="us-east-1")
+            client.create_bucket(Bucket=bucket)
+            yield S3Backend(client, bucket), folder
+        else:
+            from moto import mock_aws  # Development dependency, only needed for the in-process stand-in
+            with mock_aws():
+                client = make_s3_client(region_name="us-east-1")
+                client.create_bucket(Bucket=bucket)
+                yield S3Backend(client, bucket), folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+#####################################################################
+# ============================ REPORT ============================= #
+#####################################################################
+
+def print_report(results):
+    """
+    Print the results of the benchmark as a table.
+    """
+    print(f"{'scenario':<34}{'operation':<12}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for scenario, result in results.items():
+        for operation, stats in result["operations"].items():
+            print(f"{scenario:<34}{operation:<12}{stats['count']:>7}{stats['p50']:>10}{stats['p90']:>10}"
+                  f"{stats['p99']:>10}{stats['max']:>10}")
+        print(f"{scenario:<34}{'total':<12} {result['throughput']} op/s, {result['failures']} failure(s), "
+              f"peak memory of a session {result['peak_memory_mib']} MiB")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with a previous run of the benchmark.
+
+    Parameters:
+    - results (dict): Results of this run, scenario -> result.
+    - baseline (dict): Results of the reference run, in the same format.
+    - tolerance (float, optional): Allowed relative slowdown. Defaults to DEFAULT_TOLERANCE.
+
+    Returns:
+    - [str]: The regressions found: p50/p99 latencies or throughput worse than the baseline beyond
+      the tolerance, and failures that the baseline did not have. Scenarios missing from the baseline are ignored.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        reference = baseline.get(scenario)
+        if reference is None:
+            continue
+        for operation, stats in result["operations"].items():
+            for percentile in ("p50", "p99"):
+                before = reference["operations"].get(operation, {}).get(percentile)
+                if before and stats[percentile] > before * (1 + tolerance):
+                    regressions.append(f"{scenario} {operation} {percentile}: {before} ms -> {stats[percentile]} ms")
+        if result["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario} throughput: {reference['throughput']} -> {result['throughput']} op/s")
+        if result["failures"] > reference["failures"]:
+            regressions.append(f"{scenario} failures: {reference['failures']} -> {result['failures']}")
+    return regressions
+
+
+def main():
+    """
+    Benchmark the booking flows on synthetic calendars, against a local S3 stand-in and local files.
+
+    Usage:
+    python benchmark_booking.py --users 50 --workers 50
+    python benchmark_booking.py --backends local s3 --calendars small large --output bench.json
+    python benchmark_booking.py --compare bench.json
+    python benchmark_booking.py --backends s3 --s3-endpoint http://localhost:5000
+    python benchmark_booking.py --backends s3 --engines events snapshot --write-behind
+    """
+    parser = argparse.ArgumentParser(description="Measure the latency, throughput and memory of the booking flows.")
+    parser.add_argument("--users", type=int, default=50, help="Number of simulated user sessions")
+    parser.add_argument("--workers", type=int, default=50, help="Number of sessions running at the same time")
+    parser.add_argument("--backends", nargs="+", default=["local", "s3"], choices=["memory", "local", "s3"])
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=ENGINES)
+    parser.add_argument("--calendars", nargs="+", default=["small", "medium"], choices=list(CALENDARS))
+    parser.add_argument("--format", default="parquet")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, choices=LAYOUTS)
+    parser.add_argument("--s3-endpoint", help="Endpoint of an S3 stand-in (e.g., a moto server)")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="Acknowledge the modifications once in a local journal (not for the sqlite engine)")
+    parser.add_argument("--output", help="Save the results as JSON, to compare a later run with them")
+    parser.add_argument("--compare", help="Results of a previous run: exit with an error on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    results = {}
+    for calendar in args.calendars:
+        offices_count, years = CALENDARS[calendar]
+        df = synthetic_calendar(offices_count, years)
+        for backend_kind in args.backends:
+            for engine in args.engines:
+                if args.write_behind and engine == "sqlite":
+                    continue
+                scenario = f"{calendar}/{backend_kind}/{engine}" + ("+journal" if args.write_behind else "")
+                # The versions of two stores can be equal: nothing derived from another scenario must be reused
+                RENDERED_TABLES.clear()
+                AVAILABILITY_INDEXES.clear()
+                with open_backend(backend_kind, args.s3_endpoint) as (backend, folder):
+                    store = make_store(backend, fmt=args.format, engine=engine,
+                                       sqlite_path=os.path.join(folder, "flexoffice.db"), layout=args.layout,
+                                       journal_path=os.path.join(folder, "flexjournal.db") if args.write_behind else None)
+                    config = {FLEX: {"excel": FILE_NAME, "offices": [c for c in df.columns if c not in ('Date', 'Créneau')]}}
+                    results[scenario] = run_benchmark(BookingService(store, config), df.copy(), args.users, args.workers)
+                    if args.write_behind:
+                        store.close()  # Uploads the last modifications before the backend is removed
+                print(f"{scenario}: {results[scenario]['throughput']} op/s", file=sys.stderr)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from flex_grid import AVAILABLE, SLOTS, ReservationError, book_slots, build_calendar, enable_copy_on_write
+from flex_service import DEFAULT_ENGINE, DEFAULT_LAYOUT, ENGINES, LAYOUTS, make_store
+from flex_storage import ConcurrentModificationError, MemoryBackend, PrefixedBackend, S3Backend, make_s3_client
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+FILE_NAME = "FlexCheck.xlsx"
+OFFICES = ["Bureau 1", "Bureau 2", "Bureau 3", "Bureau 4", "Bureau 5", "Bureau 6"]
+START_DATE = datetime.date(2030, 1, 7)  # A Monday
+
+# The engines checked by default: the default one and the local database, the two that ship
+CHECKED_ENGINES = (DEFAULT_ENGINE, "sqlite")
+
+
+#####################################################################
+# ============================ HARNESS ============================ #
+#####################################################################
+
+def run_concurrent_bookings(store, users, workers):
+    """
+    Fire concurrent reservations at a store and check that none of them is lost.
+
+    Every user books a distinct cell of the grid, and every user also tries to book
+    the same contended cell: exactly one of them must get it.
+
+    Parameters:
+    - store (FrameStore, EventLogStore or SQLiteStore): The store to test (see `make_store`), holding nothing
+      under FILE_NAME yet.
+    - users (int): Number of simulated users.
+    - workers (int): Number of threads sending the reservations.
+
+    Returns:
+    - ([str], int): The problems found, empty if every accepted reservation was kept, and the number of
+      reservations given up because the file kept changing.
+
+    Notes:
+    A reservation given up with ConcurrentModificationError is what a user sees as "réessayez": it is not
+    a problem under heavy contention, as long as it left the cell untouched.
+    """
+    days = pd.bdate_range(START_DATE, periods=users // (len(OFFICES) * len(SLOTS)) + 2)
+    store.save(build_calendar(OFFICES, days[0], days[-1]), FILE_NAME)
+    cells = [(day.date(), slot, office) for day in days[1:] for slot in SLOTS for office in OFFICES][:users]
+    contended = (days[0].date(), SLOTS[0], OFFICES[0])
+
+    def attempt(cell, name):
+        # "accepted", "refused" (the cell is taken) or "busy" (the file kept changing, nothing was written)
+        date, slot, office = cell
+        try:
+            store.update(FILE_NAME, lambda df: book_slots(df, date, slot, office, name))
+            return "accepted"
+        except ReservationError:
+            return "refused"
+        except ConcurrentModificationError:
+            return "busy"
+
+    def book(user):
+        name = f"user{user}"
+        return attempt(cells[user], name), attempt(contended, name)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(book, range(users)))
+
+    df = store.load(FILE_NAME).set_index(['Date', 'Créneau'])
+    problems = []
+    for user, ((date, slot, office), (outcome, _)) in enumerate(zip(cells, outcomes)):
+        value = df.at[(pd.Timestamp(date), slot), office]
+        expected = f"user{user}" if outcome == "accepted" else AVAILABLE
+        if value != expected:
+            problems.append(f"Reservation of user{user} on {date} {slot} {office} {outcome} but found {value!r}")
+    winners = [f"user{user}" for user, (_, outcome) in enumerate(outcomes) if outcome == "accepted"]
+    contended_value = df.at[(pd.Timestamp(contended[0]), contended[1]), contended[2]]
+    if len(winners) > 1 or contended_value != (winners[0] if winners else AVAILABLE):
+        problems.append(f"Contended cell booked by {winners}, final value {contended_value!r}")
+    busy = sum(outcome == "busy" for pair in outcomes for outcome in pair)
+    return problems, busy
+
+def main():
+    """
+    Run the concurrency check against an in-memory store or a (local stand-in of an) S3 bucket, with the
+    stores built by `make_store` for each engine checked.
+
+    Usage:
+    python concurrency_check.py --users 50 --workers 16
+    python concurrency_check.py --engines events snapshot sqlite --layout single
+    python concurrency_check.py --s3-endpoint http://localhost:5000 --bucket test-bucket
+    """
+    parser = argparse.ArgumentParser(description="Check that concurrent reservations are never lost.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--format", default="parquet")
+    parser.add_argument("--s3-endpoint", help="Endpoint of an S3 stand-in (e.g., a moto server)")
+    parser.add_argument("--bucket", default="flex-concurrency-check")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(CHECKED_ENGINES))
+    parser.add_argument("--layout", choices=LAYOUTS, default=DEFAULT_LAYOUT)
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    failed = False
+    for engine in args.engines:
+        if args.s3_endpoint:
+            client = make_s3_client(endpoint_url=args.s3_endpoint, region_name="us-east-1")
+            if engine == args.engines[0]:
+                client.create_bucket(Bucket=args.bucket)
+            # One prefix per engine: each check starts from an empty file
+            backend = PrefixedBackend(S3Backend(client, args.bucket), f"{engine}/")
+        else:
+            backend = MemoryBackend()
+        with tempfile.TemporaryDirectory() as folder:
+            store = make_store(backend, fmt=args.format, engine=engine, layout=args.layout,
+                               sqlite_path=os.path.join(folder, "flexcheck.db"))
+            problems, busy = run_concurrent_bookings(store, args.users, args.workers)
+        for problem in problems:
+            print(problem)
+        print(f"{engine}/{args.layout}, {args.users} concurrent users: "
+              f"{'OK' if not problems else f'{len(problems)} problem(s)'}, {busy} reservation(s) to try again")
+        failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+
+import pandas as pd
+import pytest
+
+from flex_grid import book_slots, build_calendar
+from flex_storage import FrameStore, MemoryBackend
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Grid of the tests: two weeks of two offices, across two months
+FILE_NAME = "FlexTest.xlsx"
+OFFICES = ["B1", "B2"]
+MONDAY = datetime.date(2025, 1, 27)
+WEEK = [MONDAY + datetime.timedelta(days=i) for i in range(5)]
+FEBRUARY = datetime.date(2025, 2, 4)
+LAST_DAY = MONDAY + datetime.timedelta(days=13)
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def grid():
+    return build_calendar(OFFICES, MONDAY, LAST_DAY)
+
+@pytest.fixture
+def backend(grid):
+    # An in-memory storage holding the grid as a single file, as saved by FrameStore
+    backend = MemoryBackend()
+    FrameStore(backend).save(grid, FILE_NAME)
+    return backend
+
+
+#####################################################################
+# ============================ HELPERS ============================ #
+#####################################################################
+
+def book(store, day, office="B1", name="Alice", period="Matin"):
+    """
+    Reserve an office through any reservation store, with the same call as the booking service.
+    """
+    store.update_range(FILE_NAME, day, day, lambda df: book_slots(df, day, period, office, name))
+
+def cell(df, day, office="B1", slot="Matin"):
+    """
+    Return the content of a cell of a grid.
+    """
+    return df.loc[(df['Date'] == pd.Timestamp(day)) & (df['Créneau'] == slot), office].iat[0]
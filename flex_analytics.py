@@ -0,0 +1,204 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import numpy as np
+import pandas as pd
+
+from flex_grid import AVAILABLE, NAMES, SLOTS, RenderCache, name_codes
+from flex_recurring import WEEKDAYS
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of business days of the rolling utilization, about four weeks
+ROLLING_BUSINESS_DAYS = 20
+
+# Number of reports kept in memory (one per flex office, period and data version), and of archived years
+ANALYTICS_CACHE_SIZE = 32
+ARCHIVE_CACHE_SIZE = 32
+
+
+#####################################################################
+# ============================ REPORTS ============================ #
+#####################################################################
+
+def occupancy_report(history, offices, events=None):
+    """
+    Compute the occupancy statistics of a reservation grid, with array operations over every cell at once.
+
+    Parameters:
+    - history (pandas.DataFrame): The grid (e.g., the archived years and the current grid concatenated),
+      one row per business-day slot.
+    - offices ([str]): The office columns.
+    - events (pandas.DataFrame, optional): The reservation events (see EventLogStore.audit_trail), to
+      follow the late cancellations. Defaults to none.
+
+    Returns:
+    - dict: The report, with French column names for the display:
+      - "rate" (float): Share of the office slots reserved over the grid, None without slots.
+      - "offices" (pandas.DataFrame): Per office, the half-days reserved and the occupancy rate.
+      - "weekdays" (pandas.DataFrame): Occupancy rate per office (rows) and day of the week (columns).
+      - "slots" (pandas.DataFrame): Occupancy rate per office (rows) and slot (columns).
+      - "daily" (pandas.DataFrame): Per day, the occupancy rate and its rolling mean over ROLLING_BUSINESS_DAYS.
+      - "people" (pandas.DataFrame): Per person, the half-days and days reserved, their favourite office
+        and their first and last reservations, the most active first.
+      - "late_cancellations" (pandas.DataFrame or None): Per week, the reservations and the cancellations
+        made on the reserved day or after it (the offices booked but not used), None without events.
+
+    Notes:
+    The cells are compared as the integer codes of the shared dictionary of names, and every aggregate
+    is a group-by over the boolean matrix of the reserved cells: nothing loops over the rows.
+    The empty cells of an office missing from a part of the history are not counted in its rates.
+    """
+    history = history.dropna(subset=['Date'])
+    days = history['Date'].to_numpy().astype('datetime64[D]')
+    codes = name_codes(history, offices)
+    # An empty cell (code -1) is an office that was not in the grid yet, e.g. in an archived year: it is
+    # neither reserved nor available, and left out of the rates
+    exists = codes >= 0
+    reserved = exists & (codes != NAMES.code(AVAILABLE))
+    cells = pd.DataFrame(np.where(exists, reserved, np.nan), columns=offices)
+
+    # Day 0 of datetime64 is Thursday 1970-01-01
+    weekdays = pd.Series((days.astype('int64') + 3) % 7).map(dict(enumerate(WEEKDAYS)))
+    by_weekday = cells.groupby(weekdays.to_numpy()).mean().T
+    by_weekday = by_weekday.reindex(columns=[day for day in WEEKDAYS if day in by_weekday.columns])
+    by_slot = cells.groupby(history['Créneau'].astype(str).to_numpy()).mean().T
+    by_slot = by_slot.reindex(columns=[slot for slot in SLOTS if slot in by_slot.columns])
+
+    daily = cells.groupby(days).mean().mean(axis=1)
+    daily = pd.DataFrame({
+        "Taux d'occupation": daily,
+        "Moyenne glissante": daily.rolling(ROLLING_BUSINESS_DAYS, min_periods=1).mean(),
+    })
+    daily.index = pd.to_datetime(daily.index).rename("Date")
+
+    return {
+        "rate": float(reserved.sum() / exists.sum()) if exists.any() else None,
+        "offices": pd.DataFrame({
+            "Demi-journées réservées": reserved.sum(axis=0),
+            "Taux d'occupation": cells.mean(axis=0).fillna(0).to_numpy(),
+        }, index=pd.Index(offices, name="Bureau")),
+        "weekdays": by_weekday.rename_axis("Bureau"),
+        "slots": by_slot.rename_axis("Bureau"),
+        "daily": daily,
+        "people": people_stats(codes, reserved, days, offices),
+        "late_cancellations": late_cancellations(events) if events is not None else None,
+    }
+
+def people_stats(codes, reserved, days, offices):
+    """
+    Aggregate the reserved cells per person.
+
+    Parameters:
+    - codes (numpy.ndarray): The name codes of the cells, one row per slot and one column per office.
+    - reserved (numpy.ndarray): True for the reserved cells. The empty cells (code -1) are ignored.
+    - days (numpy.ndarray): The day of each row, as datetime64[D].
+    - offices ([str]): The office of each column.
+
+    Returns:
+    - pandas.DataFrame: One row per person, the most active first.
+    """
+    rows, columns = np.nonzero(reserved & (codes >= 0))
+    cells = pd.DataFrame({"name": codes[rows, columns], "office": columns, "day": days[rows]})
+    if cells.empty:
+        return pd.DataFrame(columns=["Demi-journées", "Jours", "Bureau favori", "Première réservation",
+                                     "Dernière réservation"], index=pd.Index([], name="Nom"))
+    people = cells.groupby("name").agg(half_days=("day", "size"), days=("day", "nunique"),
+                                       first=("day", "min"), last=("day", "max"))
+    favourite = cells.groupby(["name", "office"]).size().groupby(level=0).idxmax().str[1]
+    names = NAMES.dtype().categories
+    people = pd.DataFrame({
+        "Demi-journées": people["half_days"].to_numpy(),
+        "Jours": people["days"].to_numpy(),
+        "Bureau favori": np.asarray(offices, dtype=object)[favourite.loc[people.index].to_numpy()],
+        "Première réservation": pd.to_datetime(people["first"]).to_numpy(),
+        "Dernière réservation": pd.to_datetime(people["last"]).to_numpy(),
+    }, index=pd.Index(names[people.index.to_numpy()], name="Nom"))
+    return people.sort_values(["Demi-journées", "Jours"], ascending=False, kind="stable")
+
+def late_cancellations(events):
+    """
+    Count per week the reservations, and the cancellations made on the reserved day or after it.
+
+    Parameters:
+    - events (pandas.DataFrame): The reservation events, with the "timestamp", "action" and "date" columns.
+
+    Returns:
+    - pandas.DataFrame: Per week (its Monday), the reservations, the late cancellations and their share.
+
+    Notes:
+    The reservations do not record who actually came: an office canceled on the day itself is the
+    closest trace of an office booked and not used.
+    """
+    columns = ["Réservations", "Annulations tardives", "Part tardive"]
+    if events.empty:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="Semaine"))
+    dates = pd.to_datetime(events["date"])
+    made = pd.to_datetime(events["timestamp"]).dt.normalize()
+    weeks = (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).rename("Semaine")
+    counts = pd.DataFrame({
+        "Réservations": events["action"].eq("book"),
+        "Annulations tardives": events["action"].eq("cancel") & (made >= dates),
+    }).groupby(weeks).sum()
+    counts["Part tardive"] = (counts["Annulations tardives"] / counts["Réservations"].where(counts["Réservations"] > 0))
+    return counts.sort_index()
+
+def within(dates, start_date=None, end_date=None):
+    """
+    Return the mask of the dates of a period, e.g. to keep the rows of a grid or the events counted by a report.
+
+    Parameters:
+    - dates (pandas.Series): The dates, as datetime64.
+    - start_date (datetime.date, optional): First day kept. No lower bound if None.
+    - end_date (datetime.date, optional): Last day kept (included). No upper bound if None.
+
+    Returns:
+    - numpy.ndarray: True for the dates of the period.
+    """
+    days = dates.to_numpy().astype('datetime64[D]')
+    mask = ~np.isnat(days)
+    if start_date is not None:
+        mask &= days >= np.datetime64(start_date, 'D')
+    if end_date is not None:
+        mask &= days <= np.datetime64(end_date, 'D')
+    return mask
+
+def report_json(report):
+    """
+    Convert a report of `occupancy_report` to JSON-compatible values, e.g. for the HTTP API.
+
+    Returns:
+    - dict: The same keys; the tables as {row: {column: value}}, the dates as YYYY-MM-DD and the rates
+      rounded to 4 decimals.
+    """
+    def table(df):
+        if df is None:
+            return None
+        df = df.copy()
+        if isinstance(df.index, pd.DatetimeIndex):
+            df.index = df.index.strftime('%Y-%m-%d')
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = df[column].dt.strftime('%Y-%m-%d')
+            elif pd.api.types.is_float_dtype(df[column]):
+                df[column] = df[column].round(4).astype(object).where(df[column].notna(), None)
+        return {str(row): {column: (value.item() if isinstance(value, np.generic) else value)
+                           for column, value in values.items()} for row, values in df.to_dict("index").items()}
+
+    return {key: (round(value, 4) if isinstance(value, float) else table(value) if key != "rate" else value)
+            for key, value in report.items()}
+
+
+#####################################################################
+# ============================= CACHE ============================= #
+#####################################################################
+
+# Reports keyed by (file, data version, period): a new reservation changes the version, so a report is never stale
+REPORTS = RenderCache(ANALYTICS_CACHE_SIZE)
+
+# Archived years keyed by (file, year, version of the archive file): they only change when the calendar rolls
+ARCHIVED_YEARS = RenderCache(ARCHIVE_CACHE_SIZE)
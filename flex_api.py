@@ -0,0 +1,331 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import asyncio
+import datetime
+import hmac
+import json
+import os
+
+from flex_analytics import report_json
+from flex_grid import FULL_DAY, ReservationError, enable_copy_on_write
+from flex_metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, span
+from flex_service import DEFAULT_ENGINE, DEFAULT_LAYOUT, ENGINES, LAYOUTS, parse_date
+from flex_sites import DEFAULT_SITE, SiteDirectory
+from flex_storage import DEFAULT_FORMAT, FORMATS, ConcurrentModificationError, LocalBackend, S3Backend, make_s3_client
+
+try:
+    from aiohttp import web
+except ImportError:  # Optional dependency, only needed to serve the API
+    web = None
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Environment variable holding the token expected in the "Authorization: Bearer <token>" header
+TOKEN_VARIABLE = "FLEX_API_TOKEN"
+
+# Longest date range returned by a single availability request
+MAX_RANGE_DAYS = 366
+
+
+#####################################################################
+# ============================== API ============================== #
+#####################################################################
+
+class BookingAPI:
+    """
+    HTTP/JSON interface of a BookingService, for calendar integrations and bulk clients.
+
+    Parameters:
+    - service (BookingService): The reservation operations.
+    - token (str, optional): Token expected in the "Authorization: Bearer <token>" header. No authentication if None.
+
+    Notes:
+    Routes:
+    - GET /flex: the flex offices and their offices.
+    - GET /flex/{flex}/availability?start=YYYY-MM-DD&end=YYYY-MM-DD&period=Journée: free and reserved offices per slot.
+    - GET /search?start=YYYY-MM-DD&end=YYYY-MM-DD&period=Journée: the free offices of every flex office, the most available first.
+    - POST /flex/{flex}/reservations {"office", "date", "period", "name"}: reserve an office.
+    - POST /flex/{flex}/reservations/batch {"name", "cells": [{"date", "slot", "office"}]}: reserve cells, all or nothing.
+    - DELETE /flex/{flex}/reservations/{office}/{date}?period=Journée: cancel a reservation; the released slots
+      with a waitlist are given to the first person waiting ("assigned").
+    - POST /flex/{flex}/waitlist {"office", "date", "period", "name", "contact"}: queue for an office reserved
+      by someone else, answers the position for each slot.
+    - DELETE /flex/{flex}/waitlist/{office}/{date}?period=Journée&name=<name>: leave the queue.
+    - GET /flex/{flex}/rules: the recurring reservation rules.
+    - POST /flex/{flex}/rules {"office", "weekdays": [0-4], "period", "start", "end", "name", "exceptions",
+      "skip_conflicts"}: reserve an office every week, in one write; refused with the unavailable cells unless
+      "skip_conflicts" is true.
+    - DELETE /flex/{flex}/rules/{rule_id}?from=YYYY-MM-DD: delete a rule and cancel its reservations from a date.
+    - GET /flex/{flex}/changes?since=<version>: the current version, and the reservations and cancellations
+      made since a version ("reload": true when they are not known and the availability must be fetched again).
+    - GET /flex/{flex}/analytics?start=YYYY-MM-DD&end=YYYY-MM-DD: the occupancy statistics per office, weekday,
+      slot, day and person, and the late cancellations, over the whole history (archived years included) by default.
+    - GET /metrics: the metrics in the Prometheus text format (not protected by the token).
+    A reservation that cannot be made answers 409 with the French message of the error, and a file that
+    kept changing answers 503. The service is synchronous: it runs in worker threads, so a slow storage
+    never blocks the other requests.
+    """
+
+    def __init__(self, service, token=None):
+        self.service = service
+        self.token = token
+
+    def routes(self):
+        return [
+            web.get("/flex", self.list_flexes),
+            web.get("/flex/{flex}/availability", self.availability),
+            web.get("/search", self.search),
+            web.post("/flex/{flex}/reservations", self.book),
+            web.post("/flex/{flex}/reservations/batch", self.book_batch),
+            web.delete("/flex/{flex}/reservations/{office}/{date}", self.cancel),
+            web.post("/flex/{flex}/waitlist", self.join_waitlist),
+            web.delete("/flex/{flex}/waitlist/{office}/{date}", self.leave_waitlist),
+            web.get("/flex/{flex}/rules", self.list_rules),
+            web.post("/flex/{flex}/rules", self.add_rule),
+            web.delete("/flex/{flex}/rules/{rule_id}", self.delete_rule),
+            web.get("/flex/{flex}/changes", self.changes),
+            web.get("/flex/{flex}/analytics", self.analytics),
+            web.get("/metrics", self.metrics),
+        ]
+
+    @staticmethod
+    def _error(http_error, message):
+        # aiohttp HTTP exceptions are also responses: they can be raised or returned
+        return http_error(text=json.dumps({"error": message}, ensure_ascii=False), content_type="application/json")
+
+    async def handle(self, request, handler):
+        """
+        Check the token, run the handler and turn the errors of the service into JSON responses.
+        """
+        if self.token and request.path != "/metrics":
+            header = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(header.encode("utf-8"), f"Bearer {self.token}".encode("utf-8")):
+                return self._error(web.HTTPUnauthorized, "Authentification requise.")
+        resource = request.match_info.route.resource
+        try:
+            with span("api.request", route=resource.canonical if resource else "unknown", method=request.method):
+                return await handler(request)
+        except ReservationError as e:
+            return self._error(web.HTTPConflict, str(e))
+        except ConcurrentModificationError:
+            response = self._error(web.HTTPServiceUnavailable,
+                                   "Le planning est modifié par d'autres utilisateurs en ce moment. Veuillez réessayer.")
+            response.headers["Retry-After"] = "1"
+            return response
+
+    def _flex(self, request):
+        flex = request.match_info["flex"]
+        if flex not in self.service.flexes():
+            raise self._error(web.HTTPNotFound, f"Le flex office {flex} n'existe pas.")
+        return flex
+
+    def _date(self, value, field):
+        if not value:
+            raise self._error(web.HTTPBadRequest, f"Le champ {field} est obligatoire.")
+        try:
+            return parse_date(value)
+        except ReservationError as e:
+            raise self._error(web.HTTPBadRequest, str(e)) from None
+
+    async def _body(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, dict):
+            raise self._error(web.HTTPBadRequest, "Le corps de la requête doit être un objet JSON.")
+        return body
+
+    async def metrics(self, request):
+        return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    async def list_flexes(self, request):
+        return web.json_response({flex: self.service.offices(flex) for flex in self.service.flexes()})
+
+    def _range(self, request):
+        start_date = self._date(request.query.get("start", datetime.date.today().isoformat()), "start")
+        end_date = self._date(request.query.get("end", start_date.isoformat()), "end")
+        if not 0 <= (end_date - start_date).days < MAX_RANGE_DAYS:
+            raise self._error(web.HTTPBadRequest, f"La période doit compter entre 1 et {MAX_RANGE_DAYS} jours.")
+        return start_date, end_date
+
+    async def availability(self, request):
+        flex = self._flex(request)
+        start_date, end_date = self._range(request)
+        slots = await asyncio.to_thread(self.service.availability, flex, start_date, end_date,
+                                        request.query.get("period", FULL_DAY))
+        return web.json_response({"flex": flex, "slots": slots})
+
+    async def search(self, request):
+        start_date, end_date = self._range(request)
+        offices = await asyncio.to_thread(self.service.search, start_date, end_date,
+                                          request.query.get("period", FULL_DAY))
+        return web.json_response({"start": start_date.isoformat(), "end": end_date.isoformat(), "offices": offices})
+
+    async def book(self, request):
+        flex = self._flex(request)
+        body = await self._body(request)
+        date = self._date(body.get("date"), "date")
+        period = body.get("period", FULL_DAY)
+        await asyncio.to_thread(self.service.book, flex, body.get("office"), date, period, body.get("name"))
+        return web.json_response({"flex": flex, "office": body.get("office"), "date": date.isoformat(),
+                                  "period": period, "name": body.get("name")}, status=201)
+
+    async def book_batch(self, request):
+        flex = self._flex(request)
+        body = await self._body(request)
+        cells = [(self._date(cell.get("date"), "date"), cell.get("slot"), cell.get("office"))
+                 for cell in body.get("cells") or []]
+        await asyncio.to_thread(self.service.book_cells, flex, cells, body.get("name"))
+        return web.json_response({"flex": flex, "booked": len(cells), "name": body.get("name")}, status=201)
+
+    async def cancel(self, request):
+        flex = self._flex(request)
+        office = request.match_info["office"]
+        date = self._date(request.match_info["date"], "date")
+        released, assigned = await asyncio.to_thread(self.service.cancel, flex, office, date,
+                                                     request.query.get("period", FULL_DAY))
+        return web.json_response({"flex": flex, "office": office, "date": date.isoformat(), "released": released,
+                                  "assigned": assigned})
+
+    async def join_waitlist(self, request):
+        flex = self._flex(request)
+        body = await self._body(request)
+        date = self._date(body.get("date"), "date")
+        positions = await asyncio.to_thread(self.service.join_waitlist, flex, body.get("office"), date,
+                                            body.get("period", FULL_DAY), body.get("name"), body.get("contact"))
+        return web.json_response({"flex": flex, "office": body.get("office"), "date": date.isoformat(),
+                                  "positions": positions}, status=201)
+
+    async def leave_waitlist(self, request):
+        flex = self._flex(request)
+        office = request.match_info["office"]
+        date = self._date(request.match_info["date"], "date")
+        left = await asyncio.to_thread(self.service.leave_waitlist, flex, office, date,
+                                       request.query.get("period", FULL_DAY), request.query.get("name"))
+        return web.json_response({"flex": flex, "office": office, "date": date.isoformat(), "left": left})
+
+    async def list_rules(self, request):
+        flex = self._flex(request)
+        rules = await asyncio.to_thread(self.service.list_rules, flex)
+        return web.json_response({"flex": flex, "rules": rules})
+
+    async def add_rule(self, request):
+        flex = self._flex(request)
+        body = await self._body(request)
+        start_date = self._date(body.get("start"), "start")
+        end_date = self._date(body.get("end"), "end")
+        exceptions = [self._date(day, "exceptions") for day in body.get("exceptions") or []]
+        rule, booked, skipped = await asyncio.to_thread(
+            self.service.add_rule, flex, body.get("office"), body.get("weekdays") or [], body.get("period", FULL_DAY),
+            start_date, end_date, body.get("name"), exceptions, bool(body.get("skip_conflicts")))
+        return web.json_response({"flex": flex, "rule": rule, "booked": booked,
+                                  "skipped": [{"date": date.isoformat(), "slot": slot, "office": office}
+                                              for date, slot, office in skipped]}, status=201)
+
+    async def delete_rule(self, request):
+        flex = self._flex(request)
+        from_date = self._date(request.query.get("from", datetime.date.today().isoformat()), "from")
+        released = await asyncio.to_thread(self.service.delete_rule, flex, request.match_info["rule_id"], from_date)
+        return web.json_response({"flex": flex, "rule": request.match_info["rule_id"], "released": released})
+
+    async def changes(self, request):
+        flex = self._flex(request)
+        since = request.query.get("since")
+        if not since:
+            version = await asyncio.to_thread(self.service.version, flex)
+            return web.json_response({"flex": flex, "version": version})
+        events, version = await asyncio.to_thread(self.service.changes, flex, since)
+        if events is None:
+            return web.json_response({"flex": flex, "version": version, "reload": True})
+        return web.json_response({"flex": flex, "version": version, "events": events})
+
+    async def analytics(self, request):
+        flex = self._flex(request)
+        start_date = self._date(request.query["start"], "start") if "start" in request.query else None
+        end_date = self._date(request.query["end"], "end") if "end" in request.query else None
+        if start_date and end_date and end_date < start_date:
+            raise self._error(web.HTTPBadRequest, "La date de fin doit suivre la date de début.")
+        report = await asyncio.to_thread(lambda: report_json(self.service.analytics(flex, start_date, end_date)))
+        return web.json_response({"flex": flex, "start": start_date and start_date.isoformat(),
+                                  "end": end_date and end_date.isoformat(), **report})
+
+
+def create_app(service, token=None):
+    """
+    Build the aiohttp application serving a booking service.
+
+    Parameters:
+    - service (BookingService): The reservation operations.
+    - token (str, optional): Token expected in the "Authorization: Bearer <token>" header. No authentication if None.
+
+    Returns:
+    - aiohttp.web.Application: The application, to run with `aiohttp.web.run_app`.
+
+    Raises:
+    - ImportError: If aiohttp is not installed.
+    """
+    if web is None:
+        raise ImportError("The HTTP API needs aiohttp: pip install aiohttp")
+    api = BookingAPI(service, token)
+
+    @web.middleware
+    async def service_errors(request, handler):
+        return await api.handle(request, handler)
+
+    app = web.Application(middlewares=[service_errors])
+    app.add_routes(api.routes())
+    return app
+
+
+#####################################################################
+# =========================== API SERVER ========================== #
+#####################################################################
+
+def main():
+    """
+    Serve the reservations of a folder or an S3 bucket over HTTP.
+
+    Usage:
+    python flex_api.py --bucket bucketflexoffice --port 8080
+    python flex_api.py --folder flexoffice --engine snapshot
+    python flex_api.py --bucket bucketflexoffice --site lyon --port 8081
+    """
+    parser = argparse.ArgumentParser(description="Serve the flex office reservations as an HTTP/JSON API.")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the reservation files")
+    location.add_argument("--bucket", help="S3 bucket holding the reservation files")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=list(FORMATS))
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, choices=ENGINES)
+    parser.add_argument("--sqlite-path", default="flexoffice.db", help="Database of the sqlite engine")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, choices=LAYOUTS)
+    parser.add_argument("--waitlist-path", default="flexwaitlist.db", help="Database of the waitlists")
+    parser.add_argument("--site", default=DEFAULT_SITE, help="Site whose flex offices are served")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    service = SiteDirectory(backend).service(args.site, fmt=args.format, engine=args.engine,
+                                             sqlite_path=args.sqlite_path, layout=args.layout,
+                                             waitlist_path=args.waitlist_path)
+    web_app = create_app(service, token=os.environ.get(TOKEN_VARIABLE))
+    web.run_app(web_app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import datetime
+import os
+import random
+import time
+
+import pandas as pd
+
+from flex_grid import build_calendar, concat_grids, enable_copy_on_write, encode_grid
+from flex_metrics import span
+from flex_storage import (RETRY_BACKOFF_SECONDS, UPDATE_RETRIES, ConcurrentModificationError, LocalBackend, S3Backend,
+                          deserialize_frame, make_s3_client, serialize_frame)
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of days ahead of today for which the grids always have rows
+HORIZON_DAYS = 365
+
+# Number of past months kept in the grids besides the current one, e.g. to correct last month's reservations
+KEEP_PAST_MONTHS = 1
+
+# The archive is written once and rarely read: a slower codec that compresses better is worth it
+ARCHIVE_FORMAT = "parquet"
+ARCHIVE_COMPRESSION = "zstd"
+ARCHIVE_CONTENT_TYPE = "application/vnd.apache.parquet"
+
+
+#####################################################################
+# ============================ HOLIDAYS =========================== #
+#####################################################################
+
+def easter_sunday(year):
+    """
+    Compute the date of Easter Sunday (anonymous Gregorian algorithm).
+
+    Parameters:
+    - year (int): The year.
+
+    Returns:
+    - datetime.date: Easter Sunday of that year.
+    """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+def french_holidays(year):
+    """
+    List the public holidays of France for a year.
+
+    Parameters:
+    - year (int): The year.
+
+    Returns:
+    - [datetime.date]: The 11 public holidays, in chronological order.
+    """
+    easter = easter_sunday(year)
+    return sorted([
+        datetime.date(year, 1, 1),  # Jour de l'an
+        easter + datetime.timedelta(days=1),  # Lundi de Pâques
+        datetime.date(year, 5, 1),  # Fête du travail
+        datetime.date(year, 5, 8),  # Victoire 1945
+        easter + datetime.timedelta(days=39),  # Ascension
+        easter + datetime.timedelta(days=50),  # Lundi de Pentecôte
+        datetime.date(year, 7, 14),  # Fête nationale
+        datetime.date(year, 8, 15),  # Assomption
+        datetime.date(year, 11, 1),  # Toussaint
+        datetime.date(year, 11, 11),  # Armistice
+        datetime.date(year, 12, 25),  # Noël
+    ])
+
+def closed_days(start_date, end_date, closures=()):
+    """
+    List the days without reservations between two dates, besides the weekends.
+
+    Parameters:
+    - start_date (datetime.date): First day of the period.
+    - end_date (datetime.date): Last day of the period (included).
+    - closures ([datetime.date or str], optional): Days the flex office is closed (e.g., the "closures"
+      of its configuration, as YYYY-MM-DD). Defaults to none.
+
+    Returns:
+    - [datetime.date]: The public holidays and closures of the period.
+    """
+    days = {day for year in range(start_date.year, end_date.year + 1) for day in french_holidays(year)}
+    days.update(pd.Timestamp(day).date() for day in closures)
+    return sorted(day for day in days if start_date <= day <= end_date)
+
+
+#####################################################################
+# ============================ ARCHIVE ============================ #
+#####################################################################
+
+class ArchiveStore:
+    """
+    Compressed store of the past rows of the reservation grids, one file per flex office and year.
+
+    The grids only keep the current period, so loading and saving them does not pay for the history;
+    the past reservations stay available here, e.g. for the statistics.
+
+    Parameters:
+    - backend (StorageBackend): Where the archive files are stored, as "archive/<name>/<year>.parquet".
+
+    Notes:
+    Appending rows merges them into the file of their year with a conditional write, and a row
+    already archived is replaced by the new copy: archiving the same rows twice changes nothing.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _key(self, file_name, year):
+        return f"archive/{os.path.splitext(file_name)[0]}/{year}.parquet"
+
+    def append(self, file_name, rows, retries=UPDATE_RETRIES):
+        """
+        Add past rows of a reservation grid to the archive.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - rows (pandas.DataFrame): The rows to archive, with the 'Date', 'Créneau' and office columns.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - [int]: The years whose archive file was written.
+
+        Raises:
+        - ConcurrentModificationError: If an archive file kept changing during every attempt.
+        """
+        rows = rows.dropna(subset=['Date'])
+        years = []
+        for year, year_rows in rows.groupby(rows['Date'].dt.year, sort=True):
+            key = self._key(file_name, int(year))
+            for attempt in range(retries + 1):
+                try:
+                    data, version = self.backend.read(key)
+                    archived = deserialize_frame(data, ARCHIVE_FORMAT)
+                except FileNotFoundError:
+                    archived, version = None, None
+                merged = concat_grids([archived, year_rows] if archived is not None else [year_rows])
+                merged = merged.drop_duplicates(subset=['Date', 'Créneau'], keep='last')
+                merged = merged.sort_values('Date', kind='stable', ignore_index=True)
+                with span("storage.serialize", fmt=ARCHIVE_FORMAT):
+                    data = serialize_frame(merged, ARCHIVE_FORMAT, compression=ARCHIVE_COMPRESSION)
+                try:
+                    with span("storage.write"):
+                        self.backend.write(key, data, ARCHIVE_CONTENT_TYPE, if_match=version,
+                                           if_none_match=version is None)
+                    break
+                except ConcurrentModificationError:
+                    time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+            else:
+                raise ConcurrentModificationError(f"File {key} kept changing, the rows were not archived.")
+            years.append(int(year))
+        return years
+
+    def load(self, file_name, year):
+        """
+        Load the archived rows of a reservation grid for a year.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - year (int): The year.
+
+        Returns:
+        - pandas.DataFrame: The archived rows, sorted by date.
+
+        Raises:
+        - FileNotFoundError: If nothing was archived for that year.
+        """
+        data, _ = self.backend.read(self._key(file_name, year))
+        return encode_grid(deserialize_frame(data, ARCHIVE_FORMAT))
+
+    def version(self, file_name, year):
+        """
+        Return the version of the archive file of a year, without reading it (e.g. to memoize its rows).
+
+        Raises:
+        - FileNotFoundError: If nothing was archived for that year.
+        """
+        return self.backend.head(self._key(file_name, year))
+
+    def years(self, file_name):
+        """
+        List the years archived for a reservation grid.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - [int]: The archived years, in chronological order.
+        """
+        prefix = self._key(file_name, "")[:-len(".parquet")]
+        return sorted(int(key[len(prefix):].split(".")[0]) for key in self.backend.list_keys(prefix))
+
+
+#####################################################################
+# ========================= ROLLING HORIZON ======================= #
+#####################################################################
+
+def roll_calendar(store, file_name, offices, today, archive=None, closures=(),
+                  horizon_days=HORIZON_DAYS, keep_past_months=KEEP_PAST_MONTHS):
+    """
+    Keep the grid of a flex office a fixed size: add the business days up to the horizon, and move the past months to the archive.
+
+    Parameters:
+    - store (FrameStore, PartitionedFrameStore, EventLogStore or SQLiteStore): The reservation store.
+    - file_name (str): Name of the file as declared in the flex configuration.
+    - offices ([str]): The offices of the flex office.
+    - today (datetime.date): The current date.
+    - archive (ArchiveStore, optional): Where the past rows go. They are kept in the grid if None.
+    - closures ([datetime.date or str], optional): Days the flex office is closed, besides the weekends
+      and the public holidays. Defaults to none.
+    - horizon_days (int, optional): Number of days ahead of today covered by the grid. Defaults to HORIZON_DAYS.
+    - keep_past_months (int, optional): Number of past months kept besides the current one. Defaults to KEEP_PAST_MONTHS.
+
+    Returns:
+    - (int, int): The number of rows added and the number of rows archived.
+
+    Notes:
+    Both steps are idempotent, so the function can run at every start of the application or from
+    a daily job: it only writes when a day entered the horizon or a month left the kept period.
+    The past rows are handed to the archive before they are removed from the grid. The grid of a flex
+    office without a file yet (e.g., a floor just added to a site) is created empty.
+    """
+    end_date = today + datetime.timedelta(days=horizon_days)
+    with span("calendar.extend"):
+        rows = build_calendar(offices, today, end_date, closed_days(today, end_date, closures))
+        try:
+            added, _ = store.extend(file_name, rows)
+        except FileNotFoundError:
+            # A flex office just added to the configuration: its grid starts with the calendar rows
+            store.save(rows, file_name)
+            added = len(rows)
+
+    archived = 0
+    if archive is not None:
+        month_index = today.year * 12 + today.month - 1 - keep_past_months
+        cutoff = datetime.date(month_index // 12, month_index % 12 + 1, 1)
+        with span("calendar.archive"):
+            removed, _ = store.truncate(file_name, cutoff, lambda past_rows: archive.append(file_name, past_rows))
+        archived = len(removed)
+    return added, archived
+
+
+#####################################################################
+# ========================== CALENDAR CLI ========================= #
+#####################################################################
+
+def main():
+    """
+    Extend the grids of every flex office of every site up to the horizon and archive their past months, e.g. from a daily job.
+
+    Usage:
+    python flex_calendar.py --bucket bucketflexoffice
+    python flex_calendar.py --folder flexoffice --engine snapshot --horizon-days 180
+    """
+    from flex_service import DEFAULT_ENGINE, DEFAULT_LAYOUT, ENGINES, LAYOUTS
+    from flex_sites import SiteDirectory
+    from flex_storage import DEFAULT_FORMAT, FORMATS
+
+    parser = argparse.ArgumentParser(description="Roll the flex office calendars forward and archive the past months.")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the reservation files")
+    location.add_argument("--bucket", help="S3 bucket holding the reservation files")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=list(FORMATS))
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, choices=ENGINES)
+    parser.add_argument("--sqlite-path", default="flexoffice.db", help="Database of the sqlite engine")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, choices=LAYOUTS)
+    parser.add_argument("--horizon-days", type=int, default=HORIZON_DAYS)
+    parser.add_argument("--keep-past-months", type=int, default=KEEP_PAST_MONTHS)
+    parser.add_argument("--today", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="Reference date (YYYY-MM-DD). Defaults to today")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    directory = SiteDirectory(backend)
+    for site in directory.sites():
+        service = directory.service(site, fmt=args.format, engine=args.engine, sqlite_path=args.sqlite_path,
+                                    layout=args.layout)
+        for flex in service.flexes():
+            added, archived = service.roll_calendar(flex, args.today, args.horizon_days, args.keep_past_months)
+            print(f"{site}/{flex}: {added} row(s) added, {archived} row(s) archived")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,512 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from flex_grid import AVAILABLE, NAMES, RenderCache, name_codes, shared_copy
+from flex_metrics import span
+from flex_storage import RETRY_BACKOFF_SECONDS, UPDATE_RETRIES, ConcurrentModificationError
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of event batches after the last snapshot that triggers a compaction
+COMPACT_EVERY = 100
+
+# Number of materialized grids (flex office, date window and snapshot) kept for every session of the process
+MATERIALIZED_CACHE_SIZE = 64
+
+# Number of event batches kept in memory: the batches after the snapshots of about 20 flex offices, the older
+# ones are folded into the snapshots and only read again for the audit trail
+BATCH_CACHE_SIZE = 2048
+
+# Number of audit trails (flex offices) kept in memory, each brought up to date with the batches recorded since
+TRAIL_CACHE_SIZE = 16
+
+BOOK = "book"
+CANCEL = "cancel"
+
+EVENT_COLUMNS = ["timestamp", "action", "office", "date", "slot", "name"]
+
+
+#####################################################################
+# ============================ EVENTS ============================= #
+#####################################################################
+
+def diff_events(before, after, offices):
+    """
+    Compute the reservation events turning a grid into another one.
+
+    Parameters:
+    - before (pandas.DataFrame): The grid before the modification.
+    - after (pandas.DataFrame): The grid after the modification, with the same rows.
+    - offices ([str]): The office columns to compare.
+
+    Returns:
+    - [dict]: One 'book' event per newly reserved cell, one 'cancel' event per freed cell.
+
+    Notes:
+    An empty cell (e.g. an office missing from a month, see `concat_grids`) made available is a
+    'cancel' event without name: nobody's reservation was canceled. A cell emptied is not an event.
+    """
+    # The codes are shared by every grid, so the cells are compared as integers
+    old_codes = name_codes(before, offices)
+    new_codes = name_codes(after, offices)
+    names = NAMES.dtype().categories
+    available = NAMES.code(AVAILABLE)
+    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+    events = []
+    for row, col in zip(*np.nonzero(old_codes != new_codes)):
+        old_code, new_code = old_codes[row, col], new_codes[row, col]
+        if new_code < 0:
+            continue  # The cell left the grid, nobody booked nor canceled it
+        events.append({
+            "timestamp": timestamp,
+            "action": CANCEL if new_code == available else BOOK,
+            "office": offices[col],
+            "date": after['Date'].iat[row].strftime('%Y-%m-%d'),
+            "slot": after['Créneau'].iat[row],
+            # For a cancellation, keep the name of the person whose reservation was canceled (-1 is an empty cell)
+            "name": (names[old_code] if old_code >= 0 else None) if new_code == available else names[new_code],
+        })
+    return events
+
+def fold_events(df, events):
+    """
+    Apply reservation events to a grid, in place and in order.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - events ([dict]): The events to apply, oldest first.
+
+    Returns:
+    - pandas.DataFrame: The same grid, for chaining.
+
+    Notes:
+    Events on cells that are not in the grid anymore (archived day, removed office) are ignored.
+    """
+    if not events:
+        return df
+    rows = {(date.strftime('%Y-%m-%d'), slot): i for i, (date, slot) in enumerate(zip(df['Date'], df['Créneau']))}
+    # The cells are written as integer codes, once the new names are in the dictionary
+    dtype = NAMES.dtype([event["name"] for event in events if event["action"] == BOOK])
+    codes = {}
+    for event in events:
+        row = rows.get((event["date"], event["slot"]))
+        if row is None or event["office"] not in df.columns:
+            continue
+        if event["office"] not in codes:
+            codes[event["office"]] = name_codes(df, [event["office"]])[:, 0].astype(np.int32)
+        codes[event["office"]][row] = NAMES.code(event["name"] if event["action"] == BOOK else AVAILABLE)
+    for office, office_codes in codes.items():
+        df[office] = pd.Categorical.from_codes(office_codes, dtype=dtype)
+    return df
+
+
+#####################################################################
+# ============================= STORE ============================= #
+#####################################################################
+
+class EventLogStore:
+    """
+    Reservation store recording every booking and cancellation as a small append-only event.
+
+    Each reservation or cancellation writes one small object holding its events, numbered with
+    a gapless sequence, instead of rewriting the whole file. The grid is materialized by folding
+    the events recorded after the last snapshot into it, and a compaction regularly saves the
+    materialized grid as the new snapshot. Events are never deleted: they form the audit trail.
+
+    Parameters:
+    - snapshots (FrameStore): Store holding the snapshots of the grids (the historical files).
+    - compact_every (int, optional): Number of event batches after the snapshot that triggers a compaction. Defaults to COMPACT_EVERY.
+
+    Notes:
+    Exposes the same `load`, `load_range`, `version`, `changes`, `save`, `update`, `update_range`, `extend`
+    and `truncate` methods as FrameStore. A batch is created with a conditional "create only" write on the next
+    sequence number: two users modifying the grid at the same moment compete for the same number, and
+    the loser applies its modification again on the fresh grid, exactly like the compare-and-swap of
+    FrameStore.update.
+
+    The materialized grids are kept and shared by every session of the process: a load only folds
+    the batches recorded since the last one, and hands out a copy of the grid (see `shared_copy`).
+    """
+
+    def __init__(self, snapshots, compact_every=COMPACT_EVERY):
+        self.snapshots = snapshots
+        self.backend = snapshots.backend
+        self.compact_every = compact_every
+        self._batches = RenderCache(BATCH_CACHE_SIZE)  # Batches are immutable: kept until evicted
+        self._trails = RenderCache(TRAIL_CACHE_SIZE)  # file name -> (last batch read, events as a DataFrame)
+        # (file name, window, snapshot version) -> (last batch folded, number of batches folded, grid)
+        self._materialized = RenderCache(MATERIALIZED_CACHE_SIZE)
+
+    def _prefix(self, file_name):
+        return f"events/{os.path.splitext(file_name)[0]}/"
+
+    def _batch_key(self, file_name, sequence):
+        return f"{self._prefix(file_name)}{sequence:012d}.json"
+
+    def _watermark_key(self, file_name):
+        return f"events/{os.path.splitext(file_name)[0]}.snapshot.json"
+
+    def _watermark(self, file_name):
+        # Key of the last batch included in the snapshot, and version of that snapshot
+        try:
+            data, _ = self.backend.read(self._watermark_key(file_name))
+        except FileNotFoundError:
+            return {"last_batch": None, "snapshot": None}
+        return json.loads(data)
+
+    def _read_events(self, keys, keep=True):
+        # The batches not seen yet are downloaded at the same time, e.g. after a restart. With `keep` False
+        # (e.g. the old batches of the audit trail), they are not cached, so they do not evict the recent ones
+        batches = {key: self._batches.get(key) for key in keys}
+        missing = [key for key, batch in batches.items() if batch is None]
+        for key, (data, _) in self.backend.read_many(missing).items():
+            batches[key] = json.loads(data)
+            if keep:
+                self._batches.put(key, batches[key])
+        events = []
+        for key in keys:
+            if batches[key] is None:
+                raise FileNotFoundError(f"Event batch {key} not found")
+            events.extend(batches[key])
+        return events
+
+    def _materialize(self, file_name, window=None):
+        # With a (start date, end date) window, only the months of the snapshot covering it are loaded
+        def load_snapshot():
+            if window is None:
+                return self.snapshots.load_versioned(file_name)
+            return self.snapshots.load_range(file_name, *window)
+
+        watermark = self._watermark(file_name)
+        df, snapshot_version = load_snapshot()
+        if watermark["snapshot"] and watermark["snapshot"] != snapshot_version:
+            # The cached snapshot may predate the last compaction
+            self.snapshots.invalidate(file_name)
+            df, snapshot_version = load_snapshot()
+        # A grid materialized on the same snapshot only misses the batches recorded since then
+        cache_key = (file_name, window, snapshot_version)
+        last_batch, pending = watermark["last_batch"], 0
+        entry = self._materialized.get(cache_key)
+        if entry is not None:
+            last_batch, pending, df = entry
+            df = shared_copy(df)
+        # If the snapshot is still newer than the watermark (compaction interrupted), folding the
+        # events once more on top of it leaves it unchanged
+        with span("events.list"):
+            keys = self.backend.list_keys(self._prefix(file_name), start_after=last_batch)
+        if keys:
+            with span("events.fold"):
+                fold_events(df, self._read_events(keys))
+            last_batch, pending = keys[-1], pending + len(keys)
+        if entry is None or keys:
+            self._materialized.put(cache_key, (last_batch, pending, shared_copy(df)))
+        return df, snapshot_version, last_batch, pending
+
+    def load_versioned(self, file_name):
+        """
+        Materialize the grid of a reservation file.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - (pandas.DataFrame, str): The grid and its version (snapshot version and last batch folded).
+        """
+        df, snapshot_version, last_batch, _ = self._materialize(file_name)
+        return df, f"{snapshot_version}:{last_batch or ''}"
+
+    def load_range(self, file_name, start_date, end_date):
+        """
+        Materialize the part of the grid of a reservation file needed for a date range.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date): Last day of the range (included).
+
+        Returns:
+        - (pandas.DataFrame, str): The rows loaded by the snapshot store for the range (the whole
+          months with PartitionedFrameStore), and the version of the grid.
+        """
+        df, snapshot_version, last_batch, _ = self._materialize(file_name, (start_date, end_date))
+        return df, f"{snapshot_version}:{last_batch or ''}"
+
+    def load(self, file_name):
+        """
+        Materialize the grid of a reservation file.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - pandas.DataFrame: The grid with every recorded event applied.
+        """
+        return self.load_versioned(file_name)[0]
+
+    def _snapshot_version(self, file_name):
+        # Watermark and current version of the snapshot, without loading it
+        watermark = self._watermark(file_name)
+        snapshot_version = self.snapshots.version(file_name)
+        if watermark["snapshot"] and watermark["snapshot"] != snapshot_version:
+            # The cached version may predate the last compaction
+            self.snapshots.invalidate(file_name)
+            snapshot_version = self.snapshots.version(file_name)
+        return watermark, snapshot_version
+
+    def version(self, file_name):
+        """
+        Return the current version of the grid of a reservation file, without materializing it.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - str: The version `load_versioned` and `load_range` would return (snapshot version and last batch).
+        """
+        watermark, snapshot_version = self._snapshot_version(file_name)
+        with span("events.list"):
+            keys = self.backend.list_keys(self._prefix(file_name), start_after=watermark["last_batch"])
+        return f"{snapshot_version}:{keys[-1] if keys else watermark['last_batch'] or ''}"
+
+    def changes(self, file_name, since):
+        """
+        Return the reservations and cancellations recorded since a version of a grid.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - since (str): A version returned by `load_versioned`, `load_range` or `version`.
+
+        Returns:
+        - ([dict] or None, str): The events recorded since that version, oldest first, and the current
+          version. The events are None when the snapshot changed, and the grid must be loaded again.
+
+        Notes:
+        Only the batches after the last one of `since` are listed and read: the grid of a client can be
+        brought up to date with `fold_events`. A new snapshot may not be a compaction (new calendar days,
+        archived months, imported grid), so the events do not describe it.
+        """
+        snapshot_since, _, last_batch = since.partition(":")
+        _, snapshot_version = self._snapshot_version(file_name)
+        if snapshot_version != snapshot_since:
+            return None, self.version(file_name)
+        with span("events.list"):
+            keys = self.backend.list_keys(self._prefix(file_name), start_after=last_batch or None)
+        return self._read_events(keys), f"{snapshot_version}:{keys[-1] if keys else last_batch}"
+
+    def update(self, file_name, mutate, retries=UPDATE_RETRIES):
+        """
+        Apply a modification to a grid by recording the corresponding events.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - mutate (callable): Receives the DataFrame and modifies it in place. Its return value is
+          returned by `update`. Any exception it raises aborts the update without recording anything.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - The value returned by `mutate` for the attempt that was recorded.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another modification.
+        """
+        return self._update(file_name, mutate, retries)
+
+    def update_range(self, file_name, start_date, end_date, mutate, retries=UPDATE_RETRIES):
+        """
+        Same as `update`, but `mutate` only receives the part of the grid needed for a date range.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the modified range.
+        - end_date (datetime.date): Last day of the modified range (included).
+        - mutate (callable): Receives the DataFrame and modifies it in place.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - The value returned by `mutate` for the attempt that was recorded.
+        """
+        return self._update(file_name, mutate, retries, (start_date, end_date))
+
+    def _update(self, file_name, mutate, retries, window=None):
+        for attempt in range(retries + 1):
+            df, snapshot_version, last_batch, pending = self._materialize(file_name, window)
+            before = shared_copy(df)
+            result = mutate(df)
+            offices = [column for column in df.columns if column not in ('Date', 'Créneau')]
+            events = diff_events(before, df, offices)
+            if not events:
+                return result
+
+            sequence = int(os.path.basename(last_batch).split(".")[0]) + 1 if last_batch else 1
+            key = self._batch_key(file_name, sequence)
+            try:
+                self.backend.write(key, json.dumps(events, ensure_ascii=False).encode("utf-8"),
+                                   "application/json", if_none_match=True)
+            except ConcurrentModificationError:
+                # Someone else recorded this batch number first: try again on the fresh grid
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+                continue
+            self._batches.put(key, events)
+            # The modified grid is the materialized grid of the new batch: the next loads start from it
+            self._materialized.put((file_name, window, snapshot_version), (key, pending + 1, shared_copy(df)))
+
+            if pending + 1 >= self.compact_every:
+                self.compact(file_name)
+            return result
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the update was not recorded.")
+
+    def save(self, df, file_name):
+        """
+        Replace the grid of a reservation file, e.g. after an import.
+
+        Parameters:
+        - df (pandas.DataFrame): The new grid.
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        None
+        """
+        keys = self.backend.list_keys(self._prefix(file_name))
+        self._write_snapshot(df, file_name, keys[-1] if keys else None)
+
+    def compact(self, file_name):
+        """
+        Save the materialized grid as the new snapshot, so the next loads fold fewer events.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        None
+
+        Notes:
+        The snapshot is written before the watermark: if the process stops in between, the events
+        are folded once more on top of the new snapshot, which leaves the grid unchanged. The snapshot
+        is written conditionally, so two concurrent compactions cannot replace a newer snapshot with an older one.
+        """
+        df, snapshot_version, last_batch, pending = self._materialize(file_name)
+        if pending:
+            try:
+                self._write_snapshot(df, file_name, last_batch, if_match=snapshot_version)
+            except ConcurrentModificationError:
+                pass  # Another compaction won, it covers at least the same events
+
+    def _write_snapshot(self, df, file_name, last_batch, if_match=None):
+        snapshot_version = self.snapshots.save(df, file_name, if_match=if_match)
+        if last_batch:
+            watermark = {"last_batch": last_batch, "snapshot": snapshot_version}
+            self.backend.write(self._watermark_key(file_name), json.dumps(watermark).encode("utf-8"), "application/json")
+
+    def archive(self, file_name, before_date):
+        """
+        Move the months before a date out of the hot set of the snapshot (see PartitionedFrameStore.archive).
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The months strictly before the month of this date are archived.
+
+        Returns:
+        - [str]: The archived months, as "YYYY-MM".
+
+        Notes:
+        Archiving changes the version of the snapshot but not its content, so the watermark is
+        moved to the new version: the loads do not take the snapshot for a stale cached copy.
+        """
+        watermark = self._watermark(file_name)
+        moved, snapshot_version = self.snapshots.archive(file_name, before_date)
+        if moved:
+            self._move_watermark(file_name, watermark, snapshot_version)
+        return moved
+
+    def _move_watermark(self, file_name, watermark, snapshot_version):
+        # The snapshot changed without folding events: the batches it covers are the same as before
+        if watermark["last_batch"]:
+            watermark = {"last_batch": watermark["last_batch"], "snapshot": snapshot_version}
+            self.backend.write(self._watermark_key(file_name), json.dumps(watermark).encode("utf-8"), "application/json")
+
+    def extend(self, file_name, rows):
+        """
+        Add calendar rows to the snapshot of a reservation file (see FrameStore.extend).
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - rows (pandas.DataFrame): The rows to add. The (date, slot) rows already in the grid are left as they are.
+
+        Returns:
+        - (int, str): The number of rows added, and the version of the snapshot.
+
+        Notes:
+        New days have no reservation, so no event is recorded: the rows go straight to the snapshot.
+        """
+        watermark = self._watermark(file_name)
+        added, snapshot_version = self.snapshots.extend(file_name, rows)
+        if added:
+            self._move_watermark(file_name, watermark, snapshot_version)
+        return added, snapshot_version
+
+    def truncate(self, file_name, before_date, archive=None):
+        """
+        Remove the months before a date from the snapshot of a reservation file (see FrameStore.truncate).
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The months strictly before the month of this date are removed.
+        - archive (callable, optional): Receives the removed rows, with the events not compacted yet applied,
+          before the snapshot is saved without them.
+
+        Returns:
+        - (pandas.DataFrame, str): The removed rows, and the version of the snapshot.
+
+        Notes:
+        The events of the removed days stay in the log: they are part of the audit trail, and
+        folding them is a no-op once their rows are gone.
+        """
+        watermark = self._watermark(file_name)
+        events = self._read_events(self.backend.list_keys(self._prefix(file_name), start_after=watermark["last_batch"]))
+
+        def archive_materialized(rows):
+            fold_events(rows, events)
+            if archive is not None:
+                archive(rows)
+
+        removed, snapshot_version = self.snapshots.truncate(file_name, before_date, archive_materialized)
+        if not removed.empty:
+            self._move_watermark(file_name, watermark, snapshot_version)
+        return removed, snapshot_version
+
+    def audit_trail(self, file_name):
+        """
+        Return every event recorded for a reservation file.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - pandas.DataFrame: One row per event, oldest first.
+
+        Notes:
+        The trail read last is kept: only the batches recorded since then are listed and read, without
+        going through the cache of the batches, so the whole history is downloaded once per process.
+        """
+        entry = self._trails.get(file_name)
+        last_batch, trail = entry if entry is not None else (None, pd.DataFrame(columns=EVENT_COLUMNS))
+        with span("events.list"):
+            keys = self.backend.list_keys(self._prefix(file_name), start_after=last_batch)
+        if keys:
+            events = pd.DataFrame(self._read_events(keys, keep=False), columns=EVENT_COLUMNS)
+            trail = pd.concat([trail, events], ignore_index=True) if len(trail) else events
+            self._trails.put(file_name, (keys[-1], trail))
+        return shared_copy(trail)
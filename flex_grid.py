@@ -0,0 +1,810 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from flex_metrics import span
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+AVAILABLE = "Disponible"
+SLOTS = ["Matin", "Après-midi"]
+FULL_DAY = "Journée"
+
+# Background colors of the available and reserved cells
+AVAILABLE_COLOR = "#29AB87"
+RESERVED_COLOR = "#ff8C00"
+
+# Number of rendered tables kept in memory
+RENDER_CACHE_SIZE = 256
+
+# Number of availability indexes kept in memory (one per file and data version)
+INDEX_CACHE_SIZE = 32
+
+
+#####################################################################
+# =========================== EXCEPTIONS ========================== #
+#####################################################################
+
+class ReservationError(Exception):
+    """
+    Raised when a reservation or a cancellation cannot be applied to the grid.
+    The message is meant to be displayed to the user as is.
+    """
+
+
+#####################################################################
+# ============================ ENCODING =========================== #
+#####################################################################
+
+def grid_offices(df):
+    """
+    Return the office columns of a grid, i.e. every column but 'Date' and 'Créneau'.
+    """
+    return [column for column in df.columns if column not in ('Date', 'Créneau')]
+
+
+class NameDictionary:
+    """
+    Thread-safe, append-only dictionary of the names found in the grids, shared by the whole process.
+
+    The office columns are categorical columns whose categories are this dictionary (AVAILABLE is
+    code 0): a code means the same name in every column of every grid, whatever the flex office or
+    the month it was loaded from.
+
+    Notes:
+    A name is never removed nor moved, so the categories of a column loaded earlier are a prefix
+    of the current ones: bringing the column up to date keeps its codes as they are. The dictionary
+    grows with the number of people who ever booked, a few hundred names.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {AVAILABLE: 0}
+        self._dtype = pd.CategoricalDtype([AVAILABLE])
+        # Categories of every dtype handed out, i.e. every prefix in use (pandas copies the dtypes, not their categories)
+        self._issued = {id(self._dtype.categories): self._dtype.categories}
+
+    def dtype(self, names=()):
+        """
+        Return the categorical type of the office columns, after adding the names that are not known yet.
+
+        Parameters:
+        - names ([str], optional): Names about to be stored in a grid. Missing values are ignored.
+
+        Returns:
+        - pandas.CategoricalDtype: The current dictionary. The same object is returned until a name is added.
+        """
+        new_names = [name for name in dict.fromkeys(names) if name not in self._codes and not pd.isna(name)]
+        if not new_names:
+            return self._dtype
+        with self._lock:
+            new_names = [name for name in new_names if name not in self._codes]
+            if new_names:
+                for name in new_names:
+                    self._codes[name] = len(self._codes)
+                self._dtype = pd.CategoricalDtype(self._dtype.categories.append(pd.Index(new_names, dtype=object)))
+                self._issued[id(self._dtype.categories)] = self._dtype.categories
+            return self._dtype
+
+    def code(self, name):
+        """
+        Return the code of a known name (0 for AVAILABLE).
+
+        Raises:
+        - KeyError: If the name was never added to the dictionary.
+        """
+        return self._codes[name]
+
+    def is_current(self, dtype):
+        """
+        Return True if a type is the current dictionary, i.e. a column of this type accepts every known name.
+        """
+        return isinstance(dtype, pd.CategoricalDtype) and dtype.categories is self._dtype.categories
+
+    def is_prefix(self, dtype):
+        """
+        Return True if a type is a version of the dictionary, so that the codes of its columns are valid.
+        """
+        if not isinstance(dtype, pd.CategoricalDtype):
+            return False
+        categories = dtype.categories
+        return self._issued.get(id(categories)) is categories or \
+            self._dtype.categories[:len(categories)].equals(categories)
+
+
+NAMES = NameDictionary()
+
+SLOTS_DTYPE = pd.CategoricalDtype(SLOTS)
+
+def encode_names(column, dtype=None):
+    """
+    Convert an office column to codes of the shared dictionary of names.
+
+    Parameters:
+    - column (pandas.Series): Names and AVAILABLE, as text or already categorical.
+    - dtype (pandas.CategoricalDtype, optional): Current type of NAMES. Looked up if None.
+
+    Returns:
+    - pandas.Categorical: The column. If it already uses a prefix of the dictionary, its codes are kept as they are.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype) and NAMES.is_prefix(column.dtype):
+        dtype = dtype or NAMES.dtype()
+        if column.dtype.categories is dtype.categories:
+            return column.array
+        return pd.Categorical.from_codes(column.array.codes, dtype=dtype, validate=False)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Only the categories are looked up, the codes are translated with them
+        dtype = NAMES.dtype(column.cat.categories)
+        translation = np.append(dtype.categories.get_indexer(column.cat.categories), -1)
+        return pd.Categorical.from_codes(translation[column.array.codes], dtype=dtype, validate=False)
+    values = column.to_numpy(dtype=object)
+    return pd.Categorical(values, dtype=NAMES.dtype(pd.unique(values)))
+
+def encode_grid(df):
+    """
+    Convert a grid to its compact in-memory representation.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid, e.g. as read from a file. It is not modified.
+
+    Returns:
+    - pandas.DataFrame: The encoded grid, with the same index. `df` itself if it is already encoded.
+
+    Notes:
+    'Date' becomes a datetime64 column, 'Créneau' and the office columns become categorical: every
+    cell holds a small integer code, and the names are stored once in NAMES for the whole process.
+    The filters on the slots and on the availability are integer comparisons, and the grids cached
+    for every session take a fraction of the memory of the text. Columns already encoded are kept
+    as they are.
+    """
+    columns = {}
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        columns['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    if not isinstance(df['Créneau'].dtype, pd.CategoricalDtype):
+        values = df['Créneau'].to_numpy(dtype=object)
+        extra = [slot for slot in pd.unique(values) if slot not in SLOTS and not pd.isna(slot)]
+        dtype = pd.CategoricalDtype(SLOTS + extra) if extra else SLOTS_DTYPE
+        columns['Créneau'] = pd.Categorical.from_codes(dtype.categories.get_indexer(values), dtype=dtype, validate=False)
+    text = []
+    for office, dtype in df.dtypes.items():
+        if office in ('Date', 'Créneau') or NAMES.is_prefix(dtype):
+            continue
+        if isinstance(dtype, pd.CategoricalDtype):
+            columns[office] = encode_names(df[office])
+        else:
+            text.append(office)
+    if text:
+        # The text columns are looked up in the dictionary together, in a single pass
+        values = df[text].to_numpy(dtype=object)
+        dtype = NAMES.dtype(pd.unique(values.ravel()))
+        codes = dtype.categories.get_indexer(values.ravel()).reshape(values.shape)
+        for i, office in enumerate(text):
+            columns[office] = pd.Categorical.from_codes(codes[:, i], dtype=dtype, validate=False)
+    if not columns:
+        return df
+    # Built at once: replacing the columns one by one makes pandas split its blocks at every step
+    return pd.DataFrame({column: columns.get(column, df[column]) for column in df.columns}, index=df.index)
+
+def name_codes(df, offices):
+    """
+    Return the codes of office columns of a grid in NAMES.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - offices ([str]): The office columns.
+
+    Returns:
+    - numpy.ndarray: One row per row of the grid and one column per office. Equal codes mean equal
+      names, whatever the grids the columns come from.
+    """
+    codes = []
+    for office in offices:
+        column = df[office]
+        codes.append(column.array.codes if NAMES.is_prefix(column.dtype) else encode_names(column).codes)
+    return np.column_stack(codes) if codes else np.empty((len(df), 0), dtype=np.int16)
+
+def decode_grid(df):
+    """
+    Convert the categorical columns of a grid back to text, e.g. before writing it to a file.
+
+    Parameters:
+    - df (pandas.DataFrame): The grid.
+
+    Returns:
+    - pandas.DataFrame: The grid with object columns instead of the categorical ones (the grid itself
+      if it has none).
+    """
+    categorical = [column for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    columns = {}
+    for column in categorical:
+        codes = df[column].array.codes
+        values = df[column].dtype.categories.to_numpy(dtype=object).take(codes)
+        values[codes == -1] = np.nan
+        columns[column] = values
+    return pd.DataFrame({column: columns.get(column, df[column]) for column in df.columns}, index=df.index)
+
+def add_names(df, names, offices=None):
+    """
+    Make names assignable to office columns of a grid, in place.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - names ([str]): The names about to be written in the grid.
+    - offices ([str], optional): The columns they are written to. Defaults to every office column.
+
+    Returns:
+    None
+
+    Notes:
+    Only the columns whose categories miss one of the names are brought up to date with NAMES.
+    """
+    dtype = NAMES.dtype(names)
+    for office in grid_offices(df) if offices is None else offices:
+        column = df[office]
+        if isinstance(column.dtype, pd.CategoricalDtype) and not NAMES.is_current(column.dtype) \
+                and not all(name in column.dtype.categories for name in names):
+            df[office] = encode_names(column, dtype)
+
+def concat_grids(frames):
+    """
+    Concatenate grids (e.g. monthly partitions) and keep the compact representation.
+
+    Parameters:
+    - frames ([pandas.DataFrame]): The grids.
+
+    Returns:
+    - pandas.DataFrame: A new grid with a fresh index.
+
+    Notes:
+    The codes mean the same name in every grid, so the office columns are concatenated as arrays
+    of codes: pandas would turn categorical columns whose categories differ into text, which is the
+    case of the grids loaded before a name was added to NAMES.
+    """
+    frames = [encode_grid(frame) for frame in frames]
+    columns = list(frames[0].columns)
+    if any(list(frame.columns) != columns for frame in frames[1:]) \
+            or any(frame['Créneau'].dtype != frames[0]['Créneau'].dtype for frame in frames[1:]):
+        # Different offices or slots: concatenated as text, then encoded again
+        return encode_grid(pd.concat([decode_grid(frame) for frame in frames], ignore_index=True))
+    if len(frames) == 1:
+        # Its codes are valid as they are, even if names were added to NAMES since it was encoded
+        return frames[0].reset_index(drop=True)
+    dtype = NAMES.dtype()  # Once every frame is encoded, so it has all their names
+    data = {}
+    for column in columns:
+        if column == 'Date':
+            data[column] = np.concatenate([frame[column].to_numpy() for frame in frames])
+        else:
+            codes = np.concatenate([frame[column].array.codes for frame in frames])
+            data[column] = pd.Categorical.from_codes(codes, dtype=frames[0][column].dtype if column == 'Créneau' else dtype,
+                                                     validate=False)
+    # Every array was just built, there is nothing to copy
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+#####################################################################
+# ============================= GRID ============================== #
+#####################################################################
+
+def slots_for(period):
+    """
+    Return the slots covered by a period.
+
+    Parameters:
+    - period (str): 'Matin' (Morning), 'Après-midi' (Afternoon) or 'Journée' (Day).
+
+    Returns:
+    - [str]: The slots of the period.
+    """
+    return list(SLOTS) if period == FULL_DAY else [period]
+
+def build_calendar(offices, start_date, end_date, holidays=()):
+    """
+    Build an empty reservation grid: one row per business day and slot, every office available.
+
+    Parameters:
+    - offices ([str]): Names of the offices, used as columns.
+    - start_date (datetime.date): First day of the grid.
+    - end_date (datetime.date): Last day of the grid (included).
+    - holidays ([datetime.date], optional): Days without rows, besides the weekends. Defaults to none.
+
+    Returns:
+    - pandas.DataFrame: Grid with the 'Date', 'Créneau' and office columns, encoded (see `encode_grid`).
+    """
+    days = pd.bdate_range(start_date, end_date, freq='C', holidays=list(holidays))
+    df = pd.DataFrame({
+        'Date': days.repeat(len(SLOTS)),
+        'Créneau': SLOTS * len(days),
+    })
+    for office in offices:
+        df[office] = AVAILABLE
+    return encode_grid(df)
+
+def missing_rows(df, rows):
+    """
+    Select the rows whose (date, slot) is not in the grid yet.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - rows (pandas.DataFrame): Candidate rows, e.g. from `build_calendar`.
+
+    Returns:
+    - pandas.DataFrame: The new rows, with the columns of the grid (offices missing from `rows` are available).
+    """
+    existing = pd.MultiIndex.from_frame(df[['Date', 'Créneau']])
+    new_rows = rows[~pd.MultiIndex.from_frame(rows[['Date', 'Créneau']]).isin(existing)]
+    if len(df.columns):
+        new_rows = new_rows.reindex(columns=df.columns, fill_value=AVAILABLE)
+    return new_rows.reset_index(drop=True)
+
+def append_rows(df, rows):
+    """
+    Add rows to a grid and keep it sorted by date.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - rows (pandas.DataFrame): The rows to add, with the same columns (see `missing_rows`).
+
+    Returns:
+    - pandas.DataFrame: A new grid. The sort is stable, so the slots of a day keep their order.
+    """
+    return concat_grids([df, rows]).sort_values('Date', kind='stable', ignore_index=True)
+
+def book_slots(df, date, period, office, name):
+    """
+    Reserve an office for every slot of a period on a given date, in place.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - date (datetime.date): The day of the reservation.
+    - period (str): 'Matin', 'Après-midi' or 'Journée'.
+    - office (str): The office to reserve.
+    - name (str): The name under which the reservation is made.
+
+    Returns:
+    None
+
+    Raises:
+    - ReservationError: If the date is not in the grid or the office is not available for one of the slots.
+      Nothing is modified in that case.
+    """
+    date_mask = (df['Date'] == pd.Timestamp(date))
+    if not date_mask.any():
+        raise ReservationError("Aucune case disponible ne correspond à vos critères de sélection.")
+
+    masks = []
+    for slot in slots_for(period):
+        slot_mask = date_mask & (df['Créneau'] == slot)
+        # Check if the office is available for reservations
+        if AVAILABLE not in df.loc[slot_mask, office].values:
+            raise ReservationError(f"Le bureau {office} n'est pas disponible pour {slot} le {date.strftime('%d/%m/%Y')}.")
+        masks.append(slot_mask)
+
+    # All the slots are available: mark them as reserved
+    add_names(df, [name], [office])
+    for slot_mask in masks:
+        df.loc[slot_mask, office] = name
+
+def book_cells(df, cells, name, partial=False):
+    """
+    Reserve a batch of cells of the grid at once, in place, all or nothing.
+
+    The cells are located with a single index lookup and their availability is checked
+    in one pass, so booking many half-days costs about the same as booking one.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - cells ([(datetime.date, str, str)]): The (date, slot, office) cells to reserve.
+    - name (str): The name under which the reservations are made.
+    - partial (bool, optional): Reserve the available cells and return the others instead of raising.
+      The cells already reserved under `name` are left as they are. Defaults to False.
+
+    Returns:
+    - [(datetime.date, str, str)]: With `partial`, the cells that are not in the grid or not available. Empty otherwise.
+
+    Raises:
+    - ReservationError: Listing every requested cell that is not in the grid or not available.
+      Nothing is modified in that case.
+    """
+    if not cells:
+        return []
+    requested = pd.DataFrame(list(cells), columns=['Date', 'Créneau', 'office'])
+    requested['Date'] = pd.to_datetime(requested['Date'])
+    rows = pd.MultiIndex.from_frame(df[['Date', 'Créneau']]).get_indexer(
+        pd.MultiIndex.from_frame(requested[['Date', 'Créneau']]))
+
+    # Check every requested cell before modifying anything
+    unavailable = rows < 0
+    held = np.zeros(len(requested), dtype=bool)
+    for office, positions in requested.groupby('office').indices.items():
+        found = rows[positions] >= 0
+        values = df[office].to_numpy()[rows[positions[found]]]
+        unavailable[positions[found]] = values != AVAILABLE
+        if partial:
+            held[positions[found]] = values == name
+    if partial:
+        skipped = unavailable & ~held
+        conflicts = [(date.date(), slot, office) for date, slot, office in requested[skipped].itertuples(index=False)]
+        requested, rows = requested[~unavailable], rows[~unavailable]
+    elif unavailable.any():
+        details = ", ".join(f"{office} ({slot} le {date.strftime('%d/%m/%Y')})"
+                            for date, slot, office in requested[unavailable].itertuples(index=False))
+        raise ReservationError(f"Les bureaux suivants ne sont pas disponibles : {details}.")
+    else:
+        conflicts = []
+
+    if len(requested):
+        add_names(df, [name], list(requested['office'].unique()))
+    for office, positions in requested.groupby('office').indices.items():
+        df.iloc[rows[positions], df.columns.get_loc(office)] = name
+    return conflicts
+
+def release_cells(df, cells, name):
+    """
+    Cancel a batch of reservations made under a name, in place.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - cells ([(datetime.date, str, str)]): The (date, slot, office) cells to free.
+    - name (str): The name of the reservations: the cells reserved by someone else are left as they are.
+
+    Returns:
+    - int: The number of cells freed.
+    """
+    if not cells:
+        return 0
+    requested = pd.DataFrame(list(cells), columns=['Date', 'Créneau', 'office'])
+    requested['Date'] = pd.to_datetime(requested['Date'])
+    rows = pd.MultiIndex.from_frame(df[['Date', 'Créneau']]).get_indexer(
+        pd.MultiIndex.from_frame(requested[['Date', 'Créneau']]))
+    released = 0
+    for office, positions in requested.groupby('office').indices.items():
+        office_rows = rows[positions]
+        office_rows = office_rows[office_rows >= 0]
+        office_rows = office_rows[df[office].to_numpy()[office_rows] == name]
+        if len(office_rows):
+            df.iloc[office_rows, df.columns.get_loc(office)] = AVAILABLE
+            released += len(office_rows)
+    return released
+
+def availability_frame(df, offices, start_date, end_date):
+    """
+    Build the editable availability grid of a period: one boolean column per office.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - offices ([str]): The office columns to include.
+    - start_date (datetime.date): First day of the period.
+    - end_date (datetime.date): Last day of the period (included).
+
+    Returns:
+    - pandas.DataFrame: Business days of the period with the formatted 'Date', the 'Créneau' and, for each
+      office, False when it is available (a box to tick) or <NA> when it is already reserved.
+      The index is the one of `df`, so the ticked boxes can be mapped back to the grid.
+    """
+    index = availability_index(df)
+    rows = index.rows_between(start_date, end_date)
+    period_data = index.frame(df[['Date', 'Créneau']], rows)
+    free = index.free_matrix(rows, offices)
+    grid = pd.DataFrame({office: pd.arrays.BooleanArray(np.zeros(len(rows), dtype=bool), ~free[:, col])
+                         for col, office in enumerate(offices)}, index=period_data.index)
+    grid.insert(0, 'Créneau', period_data['Créneau'])
+    grid.insert(0, 'Date', period_data['Date'].dt.strftime('%A %d %B %Y'))
+    return grid
+
+def checked_cells(df, edited, offices):
+    """
+    Turn the boxes ticked in an availability grid into the cells to reserve.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid the availability grid was built from.
+    - edited (pandas.DataFrame): The availability grid, as edited by the user.
+    - offices ([str]): The office columns of the availability grid.
+
+    Returns:
+    - [(pandas.Timestamp, str, str)]: The (date, slot, office) cells whose box is ticked.
+    """
+    rows, cols = edited[offices].fillna(False).to_numpy(dtype=bool).nonzero()
+    labels = edited.index[rows]
+    return list(zip(df.loc[labels, 'Date'], df.loc[labels, 'Créneau'], [offices[col] for col in cols]))
+
+def release_slots(df, date, period, office):
+    """
+    Make an office available again for every slot of a period on a given date, in place.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+    - date (datetime.date): The day of the reservation to cancel.
+    - period (str): 'Matin', 'Après-midi' or 'Journée'.
+    - office (str): The office whose reservation is canceled.
+
+    Returns:
+    - [str]: The slots that were reserved and are now available.
+
+    Raises:
+    - ReservationError: If the date is not in the grid.
+    """
+    date_mask = (df['Date'] == pd.Timestamp(date))
+    if not date_mask.any():
+        raise ReservationError("Aucune réservation ne correspond à vos critères de sélection.")
+
+    released = []
+    for slot in slots_for(period):
+        slot_mask = date_mask & (df['Créneau'] == slot) & (df[office] != AVAILABLE)
+        if slot_mask.any():  # The office is currently reserved
+            df.loc[slot_mask, office] = AVAILABLE
+            released.append(slot)
+    return released
+
+
+#####################################################################
+# ============================= INDEX ============================= #
+#####################################################################
+
+class AvailabilityIndex:
+    """
+    Availability of every office for every business-day slot of a grid, computed once.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid.
+
+    Notes:
+    The availability is a boolean matrix (business-day slots x offices), sorted by date, with a
+    (date, slot) -> row map. Checking a cell is a dictionary lookup and a date range is located by
+    binary search, instead of scanning and comparing the whole grid. The index describes one version
+    of the grid: it must be built again when the grid is modified (see `availability_index`).
+    """
+
+    def __init__(self, df):
+        self.offices = grid_offices(df)
+        days = df['Date'].to_numpy(dtype='datetime64[D]')
+        positions = np.flatnonzero(np.is_busday(days))  # Weekends are never bookable
+        self.positions = positions[np.argsort(days[positions], kind='stable')]
+        self.days = days[self.positions]
+        self.slots = df['Créneau'].to_numpy(dtype=object)[self.positions]
+        # Compares the integer codes of the office columns
+        self.free = (name_codes(df, self.offices) == NAMES.code(AVAILABLE))[self.positions]
+        self._rows = {cell: row for row, cell in enumerate(zip(self.days.tolist(), self.slots.tolist()))}
+        self._columns = {office: col for col, office in enumerate(self.offices)}
+
+    def row(self, date, slot):
+        """
+        Return the row of a (date, slot) cell, or None if it is not a business-day slot of the grid.
+        """
+        return self._rows.get((pd.Timestamp(date).date(), slot))
+
+    def is_free(self, date, slot, office):
+        """
+        Return True if the office is available for the slot of the date.
+        """
+        row = self.row(date, slot)
+        return row is not None and bool(self.free[row, self._columns[office]])
+
+    def free_offices(self, date, period=FULL_DAY):
+        """
+        Return the offices available for every slot of a period on a given date.
+
+        Parameters:
+        - date (datetime.date): The day to check.
+        - period (str, optional): 'Matin', 'Après-midi' or 'Journée'. Defaults to 'Journée'.
+
+        Returns:
+        - [str]: The available offices, in the order of the grid.
+        """
+        rows = [self.row(date, slot) for slot in slots_for(period)]
+        if None in rows:
+            return []
+        free = self.free[rows].all(axis=0)
+        return [office for office, is_free in zip(self.offices, free) if is_free]
+
+    def rows_between(self, start_date, end_date, period=FULL_DAY):
+        """
+        Return the rows of the business-day slots of a period.
+
+        Parameters:
+        - start_date (datetime.date): First day of the period.
+        - end_date (datetime.date): Last day of the period (included).
+        - period (str, optional): 'Matin', 'Après-midi' or 'Journée' (both slots). Defaults to 'Journée'.
+
+        Returns:
+        - numpy.ndarray: The rows, in date order.
+        """
+        first = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start_date).date(), 'D'), side='left')
+        last = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end_date).date(), 'D'), side='right')
+        rows = np.arange(first, last)
+        if period != FULL_DAY:
+            rows = rows[self.slots[first:last] == period]
+        return rows
+
+    def free_matrix(self, rows, offices):
+        """
+        Return the availability of some offices for some rows, as a boolean matrix.
+        """
+        return self.free[np.ix_(rows, [self._columns[office] for office in offices])]
+
+    def frame(self, df, rows):
+        """
+        Return the lines of the grid the index was built from that correspond to some rows of the index.
+        """
+        return df.iloc[self.positions[rows]]
+
+
+def availability_index(df):
+    """
+    Return the availability index of a grid, built once per file and data version.
+
+    Parameters:
+    - df (pandas.DataFrame): The reservation grid. If `df.attrs['data_key']` holds the file name and
+      data version, the index is shared by every session of the server until the data changes.
+
+    Returns:
+    - AvailabilityIndex: The index of the grid.
+    """
+    data_key = df.attrs.get('data_key')
+    index = AVAILABILITY_INDEXES.get(data_key) if data_key else None
+    if index is None:
+        index = AvailabilityIndex(df)
+        if data_key:
+            AVAILABILITY_INDEXES.put(data_key, index)
+    return index
+
+
+#####################################################################
+# ============================ DISPLAY ============================ #
+#####################################################################
+
+def grid_styles(frame, available_color=AVAILABLE_COLOR, reserved_color=RESERVED_COLOR):
+    """
+    Compute the CSS of every cell of a grid at once.
+
+    Parameters:
+    - frame (pandas.DataFrame): The grid to style, with the 'Date', 'Créneau' and office columns.
+    - available_color (str, optional): Background color of the available cells. Defaults to AVAILABLE_COLOR.
+    - reserved_color (str, optional): Background color of the reserved cells. Defaults to RESERVED_COLOR.
+
+    Returns:
+    - pandas.DataFrame: CSS strings with the shape of `frame`. The date and slot columns are not styled.
+    """
+    styles = pd.DataFrame('', index=frame.index, columns=frame.columns)
+    offices = grid_offices(frame)
+    styles[offices] = np.where(frame[offices].eq(AVAILABLE).to_numpy(),
+                               f'background-color: {available_color}',
+                               f'background-color: {reserved_color}')
+    return styles
+
+def render_grid_html(frame):
+    """
+    Render a grid as a styled HTML table.
+
+    Parameters:
+    - frame (pandas.DataFrame): The grid to render, with the dates already formatted.
+
+    Returns:
+    - str: The HTML of the table, without the index. The cells and headers are escaped: the names are
+      typed by the users, and the table is displayed as raw HTML.
+    """
+    with span("render.style"):
+        styler = frame.style.format(escape="html").format_index(escape="html", axis=1)
+        return styler.apply(grid_styles, axis=None).hide(axis="index").to_html()
+
+def render_period(df, start_date, days_count, period=FULL_DAY):
+    """
+    Render the data of a period and slot type as a styled HTML table.
+
+    Parameters:
+    - df (pandas.DataFrame): The DataFrame containing the data to display.
+    - start_date (datetime.date): The start date of the period to display.
+    - days_count (int): The number of days from the start date to include in the display.
+    - period (str, optional): 'Matin' (Morning), 'Après-midi' (Afternoon) or 'Journée' (Day). Defaults to 'Journée' (Day).
+
+    Returns:
+    - str: The HTML of the table, or an empty string if no data is available for the period.
+    """
+    # Calculate the last date based on the number of days
+    end_date = start_date + datetime.timedelta(days=days_count - 1)
+
+    # Business-day slots of the selected days and time of day ('Day' includes both 'Morning' and 'Afternoon'),
+    # located in the availability index instead of filtering the whole file
+    index = availability_index(df)
+    data_period = index.frame(df, index.rows_between(start_date, end_date, period))
+
+    if data_period.empty:
+        return ""
+
+    # Format dates for display, then style every cell at once based on its column and content
+    # (the styler reads the cells one by one, which is cheaper on text than on categorical columns)
+    data_period = decode_grid(data_period.assign(Date=data_period['Date'].dt.strftime('%A %d %B %Y')))
+    return render_grid_html(data_period)
+
+
+class RenderCache:
+    """
+    Thread-safe LRU cache of what is derived from the data (rendered tables, availability indexes),
+    shared by every session of the server.
+
+    Parameters:
+    - maxsize (int, optional): Number of entries kept. Defaults to RENDER_CACHE_SIZE.
+
+    Notes:
+    Keys must include the version of the data, so a new reservation never shows a stale table.
+    """
+
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value stored under `key`, or None.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """
+        Store a value under `key`, evicting the least recently used one if needed.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every entry, e.g. when another store is used in the same process.
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+RENDERED_TABLES = RenderCache()
+AVAILABILITY_INDEXES = RenderCache(INDEX_CACHE_SIZE)
+
+
+#####################################################################
+# ========================= SHARED GRIDS ========================== #
+#####################################################################
+
+def enable_copy_on_write():
+    """
+    Turn on pandas copy-on-write for the whole process, so the grids shared by the sessions are handed out
+    without copying them (see `shared_copy`).
+
+    Returns:
+    None
+
+    Notes:
+    It changes the semantics of pandas for every module of the process: it is called by the entry points
+    (the Streamlit application, the HTTP API, the command lines), never when a module is imported.
+    """
+    pd.set_option("mode.copy_on_write", True)
+
+def shared_copy(df):
+    """
+    Copy a grid kept in a cache shared by the sessions, before handing it out or keeping it.
+
+    Parameters:
+    - df (pandas.DataFrame): The grid.
+
+    Returns:
+    - pandas.DataFrame: A copy the caller can modify in place without affecting `df`: a lazy one, which only
+      copies the columns modified, with copy-on-write (see `enable_copy_on_write`), a deep one otherwise.
+    """
+    return df.copy(deep=pd.get_option("mode.copy_on_write") is not True)
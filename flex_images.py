@@ -0,0 +1,158 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import os
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+IMG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+CACHE_FOLDER = "cache"
+
+# How each kind of image is prepared: height ratio applied to the banners (reduced by 33%),
+# and maximum width, beyond which the browser would only scale the image down
+VARIANTS = {
+    "banner": {"height_ratio": 0.67, "max_width": 1600},
+    "sidebar": {"height_ratio": 1, "max_width": 640},
+}
+
+# Quality of the lossy WebP encoding used for photos; drawings (PNG) are encoded losslessly
+WEBP_QUALITY = 80
+
+
+#####################################################################
+# ============================ VARIANTS =========================== #
+#####################################################################
+
+def variant_path(img_name, kind, img_path=IMG_PATH):
+    """
+    Return the path of the prepared variant of an image.
+
+    Parameters:
+    - img_name (str): The name of the source image in the images folder.
+    - kind (str): The kind of variant, one of VARIANTS.
+    - img_path (str, optional): The images folder. Defaults to IMG_PATH.
+
+    Returns:
+    - str: Path of the WebP file in the cache subfolder.
+    """
+    return os.path.join(img_path, CACHE_FOLDER, f"{img_name}.{kind}.webp")
+
+def build_variant(img_name, kind, img_path=IMG_PATH):
+    """
+    Resize and recompress an image once, and store the result in the cache subfolder.
+
+    Parameters:
+    - img_name (str): The name of the source image in the images folder.
+    - kind (str): The kind of variant, one of VARIANTS.
+    - img_path (str, optional): The images folder. Defaults to IMG_PATH.
+
+    Returns:
+    - str: Path of the prepared variant.
+
+    Raises:
+    - FileNotFoundError: If the source image does not exist.
+    """
+    source = os.path.join(img_path, img_name)
+    target = variant_path(img_name, kind, img_path)
+    settings = VARIANTS[kind]
+
+    with Image.open(source) as image:
+        width, height = image.size
+        new_width = min(width, settings["max_width"])
+        new_height = int(height * settings["height_ratio"] * new_width / width)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        image = image.resize((new_width, new_height), Image.LANCZOS)
+
+        buffer = BytesIO()
+        if img_name.lower().endswith(".png"):
+            image.save(buffer, "WEBP", lossless=True, method=6)
+        else:
+            image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, target)
+    return target
+
+def build_all(img_path=IMG_PATH):
+    """
+    Prepare every variant of every image of the folder (build step).
+
+    Parameters:
+    - img_path (str, optional): The images folder. Defaults to IMG_PATH.
+
+    Returns:
+    - [str]: Paths of the prepared variants.
+    """
+    built = []
+    for img_name in sorted(os.listdir(img_path)):
+        if img_name.lower().endswith((".png", ".jpg", ".jpeg")):
+            for kind in VARIANTS:
+                built.append(build_variant(img_name, kind, img_path))
+    return built
+
+@lru_cache(maxsize=64)
+def _variant_bytes(img_name, kind, img_path, source_mtime):
+    target = variant_path(img_name, kind, img_path)
+    if not os.path.exists(target) or os.path.getmtime(target) < source_mtime:
+        build_variant(img_name, kind, img_path)
+    with open(target, "rb") as f:
+        return f.read()
+
+def image_bytes(img_name, kind, img_path=IMG_PATH):
+    """
+    Return the encoded bytes of the prepared variant of an image, from memory when possible.
+
+    Parameters:
+    - img_name (str): The name of the source image in the images folder.
+    - kind (str): The kind of variant, one of VARIANTS.
+    - img_path (str, optional): The images folder. Defaults to IMG_PATH.
+
+    Returns:
+    - bytes: The WebP image, ready to be sent to the browser.
+
+    Raises:
+    - FileNotFoundError: If the source image does not exist.
+
+    Notes:
+    The variant is built on first use if the build step was not run, and rebuilt if the source image
+    is newer. The bytes are then kept in an in-process LRU, so displaying an image costs a dictionary lookup.
+    """
+    source = os.path.join(img_path, img_name)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"The image {img_name} does not exist in the folder {img_path}.")
+    return _variant_bytes(img_name, kind, img_path, os.path.getmtime(source))
+
+
+#####################################################################
+# =========================== BUILD CLI =========================== #
+#####################################################################
+
+def main():
+    """
+    Prepare the resized and recompressed images ahead of the deployment.
+
+    Usage:
+    python flex_images.py
+    """
+    parser = argparse.ArgumentParser(description="Prepare the resized WebP variants of the images.")
+    parser.add_argument("--folder", default=IMG_PATH, help="Folder holding the source images")
+    args = parser.parse_args()
+
+    for target in build_all(args.folder):
+        print(f"{target} ({os.path.getsize(target)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
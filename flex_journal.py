@@ -0,0 +1,340 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import atexit
+import datetime
+import json
+import sqlite3
+import threading
+
+from flex_events import diff_events, fold_events
+from flex_grid import enable_copy_on_write, shared_copy
+from flex_metrics import LOGGER, span
+from flex_sqlite import BUSY_TIMEOUT_MS
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of seconds the modifications wait in the journal before being uploaded together
+FLUSH_INTERVAL_SECONDS = 2
+
+# Number of modifications waiting in the journal that triggers an upload before the interval
+FLUSH_MAX_ENTRIES = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_name TEXT NOT NULL,
+    events TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_file ON journal (file_name, id);
+"""
+
+
+#####################################################################
+# ========================= JOURNAL STORE ========================= #
+#####################################################################
+
+class JournalStore:
+    """
+    Write-behind reservation store: the modifications are acknowledged once recorded in a local durable
+    journal, and uploaded to the remote store in the background, several at a time.
+
+    A booking costs a small local transaction instead of a remote write (an event batch, or the
+    serialization and upload of the months of a grid). A background thread folds the modifications
+    waiting in the journal into one `update_range` of the remote store per flex office.
+
+    Parameters:
+    - store (FrameStore, PartitionedFrameStore or EventLogStore): The remote store the journal is uploaded to.
+    - path (str): The journal, a SQLite database in WAL mode with synchronous commits: a modification
+      is on disk when it is acknowledged.
+    - flush_interval (float, optional): Number of seconds between two uploads. Defaults to FLUSH_INTERVAL_SECONDS.
+    - max_entries (int, optional): Number of waiting modifications uploaded at once, before the interval.
+      Defaults to FLUSH_MAX_ENTRIES.
+
+    Notes:
+    Exposes the same `load`, `load_range`, `version`, `changes`, `save`, `update`, `update_range`, `extend`
+    and `truncate` methods as the store; the other attributes are the ones of the store. The grids returned
+    include the waiting modifications, and their version is the version of the store followed by the last
+    journal entry ("<version>#<id>").
+
+    The availability checks of a booking are made on the grid of this process, so the journal assumes a
+    single server writes the reservations (as the "sqlite" engine does). The modifications are kept in the
+    journal until the remote store has them: a journal left by a crash is uploaded again at the next start,
+    and uploading a modification twice changes nothing, since the events set the final state of their cells.
+    """
+
+    def __init__(self, store, path, flush_interval=FLUSH_INTERVAL_SECONDS, max_entries=FLUSH_MAX_ENTRIES):
+        self.store = store
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file_locks = {}  # file name -> RLock serializing the modifications of a grid
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # file name -> [(journal id, events)], the entries not removed from the journal yet
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        for entry_id, file_name, events in conn.execute("SELECT id, file_name, events FROM journal ORDER BY id"):
+            self._pending.setdefault(file_name, []).append((entry_id, json.loads(events)))
+        if self._pending:
+            # A journal left by a crash: uploaded at once, the grids include it in the meantime
+            LOGGER.warning(json.dumps({"event": "journal.replay", "entries": self.pending_count()}))
+            self._wake.set()
+        self._flusher = threading.Thread(target=self._run, name="flex-journal", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        # The methods specific to a store (audit trail, archive, cache...) are the ones of the remote store
+        if name == "store":
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads: one per thread (i.e. per Streamlit session)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # FULL syncs the WAL at every commit: an acknowledged modification survives a power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    def _file_lock(self, file_name):
+        with self._lock:
+            return self._file_locks.setdefault(file_name, threading.RLock())
+
+    def _waiting(self, file_name):
+        # The entries are read before the store, so a flush in between only makes them folded twice
+        with self._lock:
+            entries = list(self._pending.get(file_name, ()))
+        return (entries[-1][0] if entries else 0), [event for _, events in entries for event in events]
+
+    def _with_journal(self, df, version, waiting):
+        last_id, events = waiting
+        if events:
+            df = fold_events(shared_copy(df), events)
+        return df, f"{version}#{last_id}"
+
+    def pending_count(self):
+        """
+        Return the number of modifications waiting to be uploaded.
+        """
+        with self._lock:
+            return sum(len(entries) for entries in self._pending.values())
+
+    def load_versioned(self, file_name):
+        """
+        Load a grid with the waiting modifications applied (see the `load_versioned` of the store).
+        """
+        waiting = self._waiting(file_name)
+        return self._with_journal(*self.store.load_versioned(file_name), waiting)
+
+    def load_range(self, file_name, start_date, end_date):
+        """
+        Load the part of a grid needed for a date range with the waiting modifications applied (see the
+        `load_range` of the store).
+        """
+        waiting = self._waiting(file_name)
+        return self._with_journal(*self.store.load_range(file_name, start_date, end_date), waiting)
+
+    def load(self, file_name):
+        return self.load_versioned(file_name)[0]
+
+    def version(self, file_name):
+        """
+        Return the version `load_versioned` and `load_range` would return, without loading the grid.
+        """
+        last_id, _ = self._waiting(file_name)
+        return f"{self.store.version(file_name)}#{last_id}"
+
+    def changes(self, file_name, since):
+        """
+        Return the reservations and cancellations made since a version of a grid (see the `changes` of the store).
+
+        Returns:
+        - ([dict] or None, str): The events since that version, then every waiting modification, and the
+          current version. The events are None when the grid must be loaded again.
+
+        Notes:
+        A waiting modification may be returned again once uploaded: applied in order, the events set
+        the same final state.
+        """
+        store_since = since.rpartition("#")[0] or since
+        last_id, waiting = self._waiting(file_name)
+        events, version = self.store.changes(file_name, store_since)
+        if events is None:
+            return None, f"{version}#{last_id}"
+        return events + waiting, f"{version}#{last_id}"
+
+    def _record(self, file_name, events):
+        with span("journal.append"):
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                entry_id = conn.execute("INSERT INTO journal (file_name, events, created) VALUES (?, ?, ?)",
+                                        (file_name, json.dumps(events, ensure_ascii=False),
+                                         datetime.datetime.now().isoformat(timespec='seconds'))).lastrowid
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        with self._lock:
+            self._pending.setdefault(file_name, []).append((entry_id, events))
+        if self.pending_count() >= self.max_entries:
+            self._wake.set()
+
+    def _modify(self, file_name, load, mutate):
+        # The check and the journal entry of a modification are atomic for the grid in this process
+        with self._file_lock(file_name):
+            df, _ = load()
+            before = shared_copy(df)
+            result = mutate(df)
+            offices = [column for column in df.columns if column not in ('Date', 'Créneau')]
+            events = diff_events(before, df, offices)
+            if events:
+                self._record(file_name, events)
+            return result
+
+    def update(self, file_name, mutate, retries=None):
+        """
+        Apply a modification to a grid and record it in the journal (see the `update` of the store).
+
+        Returns:
+        - The value returned by `mutate`. The modification is durable, and uploaded by the next flush.
+        """
+        return self._modify(file_name, lambda: self.load_versioned(file_name), mutate)
+
+    def update_range(self, file_name, start_date, end_date, mutate, retries=None):
+        """
+        Same as `update`, but `mutate` only receives the part of the grid needed for a date range.
+        """
+        return self._modify(file_name, lambda: self.load_range(file_name, start_date, end_date), mutate)
+
+    def _flushed(self, file_name, operation):
+        # The calendar operations replace rows of the store: the waiting modifications are uploaded first,
+        # and the grid takes no new one until the operation is done. The locks are always taken in the
+        # order flush, grid, pending entries
+        with self._flush_lock, self._file_lock(file_name):
+            self._flush_file(file_name)
+            return operation()
+
+    def save(self, df, file_name, *args, **kwargs):
+        return self._flushed(file_name, lambda: self.store.save(df, file_name, *args, **kwargs))
+
+    def extend(self, file_name, rows, *args, **kwargs):
+        return self._flushed(file_name, lambda: self.store.extend(file_name, rows, *args, **kwargs))
+
+    def truncate(self, file_name, before_date, archive=None, *args, **kwargs):
+        return self._flushed(file_name, lambda: self.store.truncate(file_name, before_date, archive, *args, **kwargs))
+
+    def _flush_file(self, file_name):
+        with self._lock:
+            entries = list(self._pending.get(file_name, ()))
+        if not entries:
+            return 0
+        events = [event for _, events in entries for event in events]
+        dates = [datetime.date.fromisoformat(event["date"]) for event in events]
+        with span("journal.flush"):
+            self.store.update_range(file_name, min(dates), max(dates), lambda df: fold_events(df, events))
+        last_id = entries[-1][0]
+        # The store has the entries: they leave the journal, under the lock of the grid so a
+        # modification never loads the store before the upload and the journal after it
+        with self._file_lock(file_name):
+            self._connection().execute("DELETE FROM journal WHERE file_name = ? AND id <= ?", (file_name, last_id))
+            with self._lock:
+                self._pending[file_name] = [entry for entry in self._pending[file_name] if entry[0] > last_id]
+        return len(entries)
+
+    def flush(self, file_name=None):
+        """
+        Upload the waiting modifications to the store, one `update_range` per grid.
+
+        Parameters:
+        - file_name (str, optional): Only upload the modifications of this grid. Defaults to every grid.
+
+        Returns:
+        - int: The number of journal entries uploaded.
+
+        Raises:
+        - ConcurrentModificationError: If the file of the store kept changing. The entries stay in the journal.
+        """
+        with self._flush_lock:
+            with self._lock:
+                file_names = [file_name] if file_name else list(self._pending)
+            return sum(self._flush_file(name) for name in file_names)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Kept in the journal: the next flush tries again
+                LOGGER.exception("Upload of the reservation journal failed")
+
+    def close(self):
+        """
+        Stop the background uploads and upload the waiting modifications, e.g. when the server stops.
+        """
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+
+#####################################################################
+# ========================== JOURNAL CLI ========================== #
+#####################################################################
+
+def main():
+    """
+    Upload the journal left by a stopped server to the storage, e.g. before moving the application to another host.
+
+    Usage:
+    python flex_journal.py --bucket bucketflexoffice --journal-path flexjournal.db
+    python flex_journal.py --folder flexoffice --journal-path flexjournal.db --engine snapshot
+    """
+    from flex_service import DEFAULT_ENGINE, DEFAULT_LAYOUT, ENGINES, LAYOUTS
+    from flex_sites import SiteDirectory
+    from flex_storage import DEFAULT_FORMAT, FORMATS, LocalBackend, S3Backend, make_s3_client
+
+    parser = argparse.ArgumentParser(description="Upload the reservation journal of the write-behind mode.")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the reservation files")
+    location.add_argument("--bucket", help="S3 bucket holding the reservation files")
+    parser.add_argument("--journal-path", required=True, help="Journal of the server")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=list(FORMATS))
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, choices=[engine for engine in ENGINES if engine != "sqlite"])
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, choices=LAYOUTS)
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    directory = SiteDirectory(backend)
+    for site in directory.sites():
+        store = directory.service(site, fmt=args.format, engine=args.engine, layout=args.layout,
+                                  journal_path=args.journal_path).store
+        waiting = store.pending_count()
+        store.close()
+        print(f"{site}: {waiting} modification(s) uploaded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Upper bounds (in seconds) of the buckets of the duration histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+SPAN_METRIC = "flex_span_seconds"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Environment variables configuring the exposition of the metrics and the structured logs
+PORT_VARIABLE = "FLEX_METRICS_PORT"
+FILE_VARIABLE = "FLEX_METRICS_FILE"
+LOG_LEVEL_VARIABLE = "FLEX_LOG_LEVEL"
+
+LOGGER = logging.getLogger("flex")
+if os.environ.get(LOG_LEVEL_VARIABLE):
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    LOGGER.addHandler(_handler)
+    LOGGER.setLevel(os.environ[LOG_LEVEL_VARIABLE].upper())
+
+
+#####################################################################
+# ============================ REGISTRY =========================== #
+#####################################################################
+
+class Registry:
+    """
+    Thread-safe store of counters and histograms, rendered in the Prometheus text format.
+
+    Notes:
+    Metrics are identified by their name and their labels. Gauges computed at render time
+    (e.g., cache statistics) are added with `register_collector`.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value (a duration in seconds) in a histogram.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def register_collector(self, collect):
+        """
+        Add a function called at every rendering, returning [(name, labels dict, value)] gauges.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def reset(self):
+        """
+        Forget every recorded value (the collectors are kept).
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+        - str: The metrics, one sample per line.
+        """
+        def labels_text(labels):
+            if not labels:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                          for key, h in self._histograms.items()}
+            collectors = list(self._collectors)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{labels_text(labels)} {value}" for (metric, labels), value in sorted(counters.items())
+                      if metric == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{labels_text(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_bucket{labels_text(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{labels_text(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{labels_text(labels)} {histogram['count']}")
+        gauges = {}
+        for collect in collectors:
+            for name, labels, value in collect():
+                gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{name}{labels_text(labels)} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+#####################################################################
+# ============================= SPANS ============================= #
+#####################################################################
+
+_local = threading.local()
+
+
+def start_trace():
+    """
+    Start recording the spans of the current thread, e.g. at the beginning of a Streamlit rerun.
+    """
+    _local.trace = []
+    _local.depth = 0
+    _local.started = time.perf_counter()
+
+
+def current_trace():
+    """
+    Return the spans recorded in the current thread since `start_trace`.
+
+    Returns:
+    - ([dict], float): The spans in the order they started, as {"span", "depth", "ms", "labels"}
+      (depth 0 for the outermost ones), and the milliseconds elapsed since the trace started.
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return [], 0.0
+    return [dict(record) for record in trace], (time.perf_counter() - _local.started) * 1000
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Time a block of code.
+
+    The duration is recorded in the SPAN_METRIC histogram, logged as a JSON line at DEBUG level
+    on the "flex" logger, and added to the trace of the current thread if one is started.
+
+    Parameters:
+    - name (str): Name of the timed operation, e.g. "storage.read".
+    - labels: Additional labels of the histogram. Keep their values few (no dates nor names).
+    """
+    trace = getattr(_local, "trace", None)
+    record = {"span": name, "depth": getattr(_local, "depth", 0), "ms": None, "labels": labels}
+    if trace is not None:
+        trace.append(record)
+    _local.depth = record["depth"] + 1
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - started
+        _local.depth = record["depth"]
+        record["ms"] = round(seconds * 1000, 3)
+        REGISTRY.observe(SPAN_METRIC, seconds, span=name, **labels)
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(json.dumps({"event": "span", "span": name, "ms": record["ms"], **labels},
+                                    ensure_ascii=False, default=str))
+
+
+def timed(name, **labels):
+    """
+    Decorator timing every call of a function with `span`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+#####################################################################
+# =========================== EXPOSITION ========================== #
+#####################################################################
+
+def write_metrics(path, registry=REGISTRY):
+    """
+    Write the metrics to a file, e.g. for the textfile collector of the Prometheus node exporter.
+
+    Parameters:
+    - path (str): Path of the file. It is replaced atomically.
+    - registry (Registry, optional): The metrics to write. Defaults to REGISTRY.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def serve_metrics(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Expose the metrics on http://host:port/metrics, from a background thread.
+
+    Parameters:
+    - port (int): Port to listen on.
+    - host (str, optional): Interface to listen on. Defaults to the local one.
+    - registry (Registry, optional): The metrics to expose. Defaults to REGISTRY.
+
+    Returns:
+    - ThreadingHTTPServer: The running server (call `shutdown` to stop it).
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are not worth a log line
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="flex-metrics", daemon=True).start()
+    return server
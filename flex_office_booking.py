@@ -4,11 +4,17 @@
 
 import streamlit as st
 import pandas as pd
-from PIL import Image
 import datetime
 import os
-import boto3
-from io import BytesIO
+from flex_images import image_bytes
+from flex_partitions import month_bounds
+from flex_storage import ConcurrentModificationError, S3Backend, make_s3_client
+from flex_grid import (RENDERED_TABLES, ReservationError, availability_frame, availability_index, checked_cells,
+                       enable_copy_on_write, render_period)
+from flex_recurring import WEEKDAYS, conflict_message
+from flex_sites import SiteDirectory
+from flex_metrics import (FILE_VARIABLE, LOGGER, PORT_VARIABLE, REGISTRY, current_trace, serve_metrics, start_trace,
+                          timed, write_metrics)
 
 
 #####################################################################
@@ -18,16 +24,27 @@ from io import BytesIO
 GENERAL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/"
 IMG_PATH = os.path.join(GENERAL_PATH, "images/")
 BUCKET_NAME = "bucketflexoffice"
+STORAGE_FORMAT = "parquet"  # "xlsx" keeps the historical workbooks as the stored files
+STORAGE_ENGINE = "events"  # "events": append-only reservation log, "snapshot": whole-file rewrites, "sqlite": local database
+STORAGE_LAYOUT = "monthly"  # "monthly": one file per month, past months archived out of the hot set; "single": one file
+SQLITE_PATH = os.path.join(GENERAL_PATH, "flexoffice.db")  # Used by the "sqlite" engine, seeded from the bucket
+WAITLIST_PATH = os.path.join(GENERAL_PATH, "flexwaitlist.db")  # Waitlists of the reserved offices and their notifications
+WRITE_BEHIND = False  # True: reservations acknowledged once in the local journal, uploaded in the background (single server)
+JOURNAL_PATH = os.path.join(GENERAL_PATH, "flexjournal.db")  # Journal of the write-behind mode
 PASSWORD = st.secrets["APP_MDP"]
+ADMIN_PASSWORD = st.secrets.get("ADMIN_MDP")  # Unlocks the diagnostic panel of the sidebar, disabled if not set
+BUSY_MESSAGE = "Le planning est modifié par d'autres utilisateurs en ce moment. Veuillez réessayer."
+LIVE_REFRESH_SECONDS = 10  # The displayed reservations are brought up to date at this interval, without rerunning the page
+ANALYTICS_DAYS = 90  # Default period of the statistics, up to today
 
 
 #####################################################################
 # ========================= GENERAL INFO ========================== #
 #####################################################################
 
-s3 = boto3.resource('s3',
-                  aws_access_key_id=st.secrets['AWS_ACCESS_KEY_ID'],
-                  aws_secret_access_key=st.secrets['AWS_SECRET_ACCESS_KEY'])
+# One thread-safe client for every session, with a tuned connection pool and adaptive retries
+s3 = make_s3_client(aws_access_key_id=st.secrets['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=st.secrets['AWS_SECRET_ACCESS_KEY'])
 
 
 #####################################################################
@@ -36,151 +53,193 @@ s3 = boto3.resource('s3',
 
 # ========================================================================================================================================
 # DATA LOADING
-def load_file_from_s3(bucket_name, file_name):
+@st.cache_resource
+def get_sites(bucket_name):
     """
-    Load a file from a specified S3 bucket and convert it to a pandas DataFrame.
+    Return the index of the sites and their flex offices, read from the bucket once per server.
 
     Parameters:
-    - bucket_name (str): The name of the S3 bucket where the file is stored.
-    - file_name (str): The name of the file to load.
+    - bucket_name (str): The name of the S3 bucket holding the site definitions and the reservation files.
 
     Returns:
-    - pandas.DataFrame: A DataFrame containing the data from the loaded file.
+    - SiteDirectory: The sites, their flex offices and the storage partition of their files.
 
-    Raises:
-    - FileNotFoundError: If the specified file does not exist in the S3 bucket.
-    - Exception: For any other errors encountered while accessing the S3 file.
+    Notes:
+    Without "sites/index.json" in the bucket, the definitions shipped in the "sites/" folder are used.
     """
-    # Verify if the object exists in the bucket
-    obj = s3.Object(bucket_name, file_name)
-    try:
-        # Try to retrieve the object
-        obj.load()
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == "404":
-            # The object does not exist
-            raise FileNotFoundError(f"File {file_name} not found in S3 bucket {bucket_name}")
-        else:
-            # Something else went wrong
-            raise
+    return SiteDirectory(S3Backend(s3, bucket_name))
 
-    # Read the Excel file into a DataFrame
-    with BytesIO(obj.get()['Body'].read()) as bIO:
-        df = pd.read_excel(bIO)
+@st.cache_resource
+def get_service(bucket_name, site):
+    """
+    Return the booking service of a site, shared by every session of the Streamlit server.
 
-    return df
+    Parameters:
+    - bucket_name (str): The name of the S3 bucket where the reservation files are stored.
+    - site (str): The site, as declared in the index of the sites.
 
-def load_image(img_name):
+    Returns:
+    - BookingService: The reservation operations on the files of the site.
+
+    Notes:
+    With the "events" engine, every booking or cancellation is recorded as a small event next to the
+    files, which then only hold the periodic snapshots of the grids. With the "sqlite" engine, the
+    reservations live in a local database, imported from the bucket the first time a flex office is used.
+    With WRITE_BEHIND, a reservation is acknowledged once recorded in the local journal, and uploaded to the
+    bucket in the background with the others made in the meantime.
     """
-    Load and display an image from the images folder, adjusting its size.
+    service = get_sites(bucket_name).service(site, fmt=STORAGE_FORMAT, engine=STORAGE_ENGINE, sqlite_path=SQLITE_PATH,
+                                             layout=STORAGE_LAYOUT, waitlist_path=WAITLIST_PATH,
+                                             journal_path=JOURNAL_PATH if WRITE_BEHIND else None)
+    # Statistics of the cache of the parsed files, exported with the other metrics
+    REGISTRY.register_collector(lambda: [(f"flex_file_cache_{name}", {"bucket": bucket_name, "site": site}, value)
+                                         for name, value in file_cache_stats(service.store).items()])
+    return service
+
+@st.cache_resource(max_entries=1)
+def roll_calendars(bucket_name, day):
+    """
+    Add the business days entering the horizon to the grids and archive their past months, once per day and server.
 
     Parameters:
-    - img_name (str): The name of the image to load and display.
+    - bucket_name (str): The name of the S3 bucket where the reservation files are stored.
+    - day (datetime.date): The current date, so that the calendars are rolled again the next day.
 
     Returns:
-    None
+    - dict: Site -> rows added and archived per flex office, None for a site whose calendars could not be rolled.
 
     Notes:
-    Displays a warning if the specified image does not exist in the images folder.
+    A failure is only logged: the pages keep working on the current grids, and the next day tries again.
+    It is called once authenticated, so an anonymous visitor never triggers storage writes; the daily
+    job of flex_calendar.py can roll the calendars instead.
     """
-    img_path = os.path.join(IMG_PATH, img_name)  # Construct the full path to the image
-    if os.path.exists(img_path):
-        image = Image.open(img_path)  # Open the image file
-        
-        # Get the original dimensions of the image
-        width, height = image.size
-        
-        # Calculate the new height
-        new_height = int(height * 0.67)  # Reduce height by 33% which is equivalent to multiplying by 0.67
-        
-        # Resize the image
-        image_resized = image.resize((width, new_height))
-        
-        # Display the resized image using Streamlit
-        st.image(image_resized, use_column_width=True)
-    else:
-        # Display a warning if the image does not exist
-        st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")
+    rolled = {}
+    for site in get_sites(bucket_name).sites():
+        try:
+            rolled[site] = get_service(bucket_name, site).roll_calendars(day)
+        except Exception as e:
+            LOGGER.warning(f"The calendars of site {site} could not be rolled: {e}")
+            rolled[site] = None
+    return rolled
+
+def file_cache_stats(store):
+    """
+    Return the statistics of the cache of the parsed files used by a reservation store.
 
-def load_image_sidebar(img_name):
+    Parameters:
+    - store (FrameStore, EventLogStore or SQLiteStore): The store of the booking service.
+
+    Returns:
+    - dict: Hits, misses, revalidations and entries of the cache (see DataFrameCache.stats).
     """
-    Load and display an image in the sidebar of the Streamlit application.
+    frames = getattr(store, "snapshots", None) or getattr(store, "seed", None) or store
+    return frames.cache.stats()
+
+@st.cache_resource
+def start_metrics_server():
+    """
+    Expose the metrics in the Prometheus format on http://127.0.0.1:<FLEX_METRICS_PORT>/metrics, once per server.
+
+    Returns:
+    - ThreadingHTTPServer or None: The metrics server, None if FLEX_METRICS_PORT is not set.
+    """
+    port = os.environ.get(PORT_VARIABLE)
+    return serve_metrics(int(port)) if port else None
+
+@timed("app.load_file")
+def load_file_from_s3(bucket_name, site, flex, start_date, end_date=None):
+    """
+    Load the reservations of a flex office needed for a date range from a specified S3 bucket as a pandas DataFrame.
 
     Parameters:
-    - img_name (str): The name of the image to load and display in the sidebar.
+    - bucket_name (str): The name of the S3 bucket where the file is stored.
+    - site (str): The site of the flex office.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - start_date (datetime.date): The first day displayed or modified by the page.
+    - end_date (datetime.date, optional): The last day displayed or modified by the page. Defaults to `start_date`.
 
     Returns:
-    None
+    - pandas.DataFrame: A DataFrame containing the months of the file overlapping the dates.
+
+    Raises:
+    - FileNotFoundError: If the specified file does not exist in the S3 bucket.
+    - Exception: For any other errors encountered while accessing the S3 file.
 
     Notes:
-    Displays a warning if the specified image does not exist in the images folder.
+    The file is stored by month in STORAGE_FORMAT, so a page only downloads the months it shows, whatever
+    the length of the history; the Excel workbook is converted on first access if needed.
+    The parsed months are kept in a process-wide cache. It is served as is for a few seconds,
+    then revalidated with a HEAD request on its ETag, so the file is only downloaded when it changed.
+    The file name and data version are kept in `df.attrs['data_key']` to memoize what is derived from the data.
     """
-    img_path = os.path.join(IMG_PATH, img_name)  # Construct the full path to the image
-    if os.path.exists(img_path):
-        image = Image.open(img_path)  # Open the image file
-        st.sidebar.image(image, use_column_width=True)  # Display the image in the sidebar using Streamlit
-    else:
-        st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")  # Display a warning if the image does not exist
+    return get_service(bucket_name, site).load(flex, start_date, end_date)
 
-# ========================================================================================================================================
-# SAVE
-def save_df_to_s3(df, bucket_name, file_name):
+@timed("app.refresh_file")
+def refresh_file_from_s3(bucket_name, site, flex, df):
     """
-    Save a pandas DataFrame to an Excel file and store it in an S3 bucket.
+    Bring the reservations of a flex office loaded by `load_file_from_s3` up to date.
 
     Parameters:
-    - df (pandas.DataFrame): The DataFrame to save.
-    - bucket_name (str): The name of the S3 bucket where the file will be stored.
-    - file_name (str): The name under which the file will be stored in the S3 bucket.
+    - bucket_name (str): The name of the S3 bucket where the file is stored.
+    - site (str): The site of the flex office.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - df (pandas.DataFrame): A DataFrame returned by `load_file_from_s3` (or by this function) for this flex office.
 
     Returns:
-    None
+    - pandas.DataFrame: `df` itself if nothing changed, otherwise the same months with the latest reservations.
 
     Notes:
-    The file is saved in Excel format (xlsx).
+    The version of the data is shared by every session of the server and checked with the bucket at most
+    once per few seconds. When it changed, only the reservations and cancellations made since the version
+    of `df` are fetched and applied to it (see BookingService.refresh).
     """
-    # Create a buffer to store the Excel file
-    excel_buffer = BytesIO()
+    return get_service(bucket_name, site).refresh(flex, df)
 
-    # Write the DataFrame to the buffer using an Excel writer
-    with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False)
+@timed("app.load_image")
+def load_image(img_name):
+    """
+    Display a banner image from the images folder, reduced in height.
 
-    # Reset the buffer position to the beginning
-    excel_buffer.seek(0)
+    Parameters:
+    - img_name (str): The name of the image to load and display.
 
-    # Get the S3 bucket object
-    bucket = s3.Bucket(bucket_name)
+    Returns:
+    None
 
-    # Store the Excel file in S3
-    bucket.put_object(
-        Key=file_name,
-        Body=excel_buffer.read(),
-        ContentType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    Notes:
+    The resized variant is prepared once (see flex_images.py) and its bytes are kept in memory,
+    so displaying the banner does not decode nor resize the image again.
+    Displays a warning if the specified image does not exist in the images folder.
+    """
+    try:
+        st.image(image_bytes(img_name, "banner", IMG_PATH), width="stretch")
+    except FileNotFoundError:
+        # Display a warning if the image does not exist
+        st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")
 
-# ========================================================================================================================================
-# GRAPH AND DISPLAY
-def apply_custom_styles(cell_contents, available_color='#29AB87'):
+@timed("app.load_image_sidebar")
+def load_image_sidebar(img_name):
     """
-    Apply custom styles to each cell in a DataFrame based on its content.
+    Load and display an image in the sidebar of the Streamlit application.
 
     Parameters:
-    - cell_contents (various): The content of the cell to which the style will be applied.
-    - available_color (str, optional): The color to use for cells marked as 'Available'. Defaults to '#29AB87'.
+    - img_name (str): The name of the image to load and display in the sidebar.
 
     Returns:
-    - str: A CSS string describing the style to apply to the cell.
-    """
-    if cell_contents == 'Disponible':  # 'Disponible' means 'Available'
-        return f'background-color: {available_color}'
-    elif cell_contents in ["Matin", "Après-midi"]:  # 'Morning' or 'Afternoon' slots
-        return ''  # No specific style for these cells
-    elif any(year in str(cell_contents) for year in ["2023", "2024", "2025"]):  # Check for specific years in the content
-        return ''  # No style for these cases, could specify further if needed
-    else:
-        return f'background-color: #ff8C00'  # Orange background for other cells
+    None
+
+    Notes:
+    The recompressed variant is prepared once (see flex_images.py) and its bytes are kept in memory.
+    Displays a warning if the specified image does not exist in the images folder.
+    """
+    try:
+        st.sidebar.image(image_bytes(img_name, "sidebar", IMG_PATH), width="stretch")
+    except FileNotFoundError:
+        st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")  # Display a warning if the image does not exist
 
+# ========================================================================================================================================
+# GRAPH AND DISPLAY
+@timed("app.display")
 def display_selected_data(df, start_date, days_count, period='Journée'):
     """
     Display data for a selected period and slot type, with custom styles.
@@ -196,6 +255,8 @@ def display_selected_data(df, start_date, days_count, period='Journée'):
 
     Notes:
     Displays an error if the start date is in the past or if no data is available for the selected period.
+    The rendered table is memoized per (file, data version, start date, number of days, slot), so showing
+    the same view again skips the filtering and the styling.
     """
     try:
         # Check if the start date is in the past
@@ -203,41 +264,60 @@ def display_selected_data(df, start_date, days_count, period='Journée'):
             st.error("La date de début ne peut pas être dans le passé. Veuillez sélectionner une date valide.")
             return
 
-        # Calculate the end date based on the number of days
-        end_date = start_date + datetime.timedelta(days=days_count)
-
-        # Filter data for the selected days
-        mask = (df['Date'] >= pd.Timestamp(start_date)) & (df['Date'] < pd.Timestamp(end_date))
-        data_period = df.loc[mask]
+        data_key = df.attrs.get('data_key')
+        cache_key = (data_key, start_date, days_count, period) if data_key else None
+        html = RENDERED_TABLES.get(cache_key) if cache_key else None
+        if html is None:
+            html = render_period(df, start_date, days_count, period)
+            if cache_key:
+                RENDERED_TABLES.put(cache_key, html)
 
-        # Filter out weekends
-        data_period = data_period[~data_period['Date'].dt.weekday.isin([5, 6])]
-
-        # Filter for the specific time of day, if specified
-        if period != 'Journée':  # 'Day' includes both 'Morning' and 'Afternoon'
-            data_period = data_period[data_period['Créneau'] == period]
-
-        # Format dates in the DataFrame for display
-        data_period['Date'] = data_period['Date'].dt.strftime('%A %d %B %Y')
-
-        if not data_period.empty:
-            # Apply specific styles to cells based on their content
-            styled_data = data_period.style.applymap(apply_custom_styles)
-            # Hide the index and display the styled DataFrame
-            st.table(styled_data)
+        if html:
+            st.markdown(html, unsafe_allow_html=True)
         else:
             st.warning("Aucune donnée disponible pour la période sélectionnée.")
 
     except Exception as e:
         st.error(f"Une erreur s'est produite lors de l'affichage des données: {e}")
 
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_display(flex, site, start_date, days_count, end_date=None):
+    """
+    Display the reservations of a period and keep them up to date while the page stays open.
+
+    Parameters:
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
+    - start_date (datetime.date): The start date of the period to display.
+    - days_count (int): The number of days from the start date to include in the display.
+    - end_date (datetime.date, optional): The last day to load. Defaults to `start_date`.
+
+    Returns:
+    None
+
+    Notes:
+    The fragment is rerun alone every LIVE_REFRESH_SECONDS, without the rest of the page. The grid of the
+    session is kept between the runs and only the changes made since its version are applied to it: while
+    nothing changes, no file is read, and the table is taken from the rendered tables of the server.
+    """
+    held = st.session_state.get("live_grid")
+    months = month_bounds(start_date, end_date or start_date)
+    if held is not None and held[:3] == (site, flex, months):
+        df = refresh_file_from_s3(BUCKET_NAME, site, flex, held[3])
+        if df is not held[3]:
+            st.toast("Le planning vient d'être mis à jour.")
+    else:
+        df = load_file_from_s3(BUCKET_NAME, site, flex, start_date, end_date)
+    st.session_state.live_grid = (site, flex, months, df)
+    display_selected_data(df, start_date, days_count)
 
-def visualize_data(df, today):
+def visualize_data(flex, site, today):
     """
     Allows the user to choose a data visualization period and displays the corresponding data.
 
     Parameters:
-    - df (pandas.DataFrame): The DataFrame containing the data to visualize.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
     - today (datetime.date): The current date, used as a starting point for date selections.
 
     Returns:
@@ -245,6 +325,7 @@ def visualize_data(df, today):
 
     Notes:
     Offers the user the choice between visualizing data for a specific day or for the next 15 days.
+    The displayed reservations follow the changes of the other users without reloading the page.
     """
     option = st.radio(
         "Choisissez une période de visualisation des données",  # User chooses the data visualization period
@@ -257,47 +338,100 @@ def visualize_data(df, today):
         with sel_period:
             selected_date = st.date_input("Sélectionnez une date", value=today)  # Date picker for a specific day
         if selected_date:
-            display_selected_data(df, selected_date, 1)  # Display data for the chosen day
+            live_display(flex, site, selected_date, 1)  # Display data for the chosen day, only its month is loaded
     elif option == "Dans les 15 jours":
-        display_selected_data(df, today, 15)  # Display data for the next 15 days
+        live_display(flex, site, today, 15, today + datetime.timedelta(days=15))  # Display data for the next 15 days
 
 # ========================================================================================================================================
-# CALCULATIONS
-def is_weekend(date):
+# SEARCH
+@timed("app.search_form")
+def search_free_offices(today, site):
     """
-    Determines if a given date is a weekend.
+    Search the free offices of every flex office of the site for a day or a range of days, and book one of them.
 
     Parameters:
-    - date (datetime.date): The date to check.
+    - today (datetime.date): The current date, used as a starting point for date selections.
+    - site (str): The site whose flex offices are searched.
 
     Returns:
-    - bool: True if the date is a Saturday or Sunday, False otherwise.
+    None
+
+    Notes:
+    The flex offices are searched at once (see BookingService.search): the offices free for the whole
+    period come first. An office free for the selected day can be booked directly from the results.
     """
-    return date.weekday() >= 5  # 5 for Saturday, 6 for Sunday
+    col_start, col_end, col_slot = st.columns([1, 1, 1])
+    with col_start:
+        start_date = st.date_input("Du", value=today, key="search_start")
+    with col_end:
+        end_date = st.date_input("Au", value=start_date, min_value=start_date,
+                                 max_value=start_date + datetime.timedelta(days=30), key="search_end")
+    with col_slot:
+        period = st.radio("Quel créneau souhaitez-vous ?", ("Matin", "Après-midi", "Journée"), index=2,
+                          key="search_period")
+
+    results = get_service(BUCKET_NAME, site).search(start_date, end_date, period)
+    if not results:
+        st.write("Aucun bureau n'est disponible sur cette période.")
+        return
+    st.dataframe(pd.DataFrame({
+        "Flex office": [result["flex"] for result in results],
+        "Bureau": [result["office"] for result in results],
+        "Créneaux libres": [f"{result['free_slots']}/{result['slots']}" for result in results],
+        "Toute la période": [result["whole_period"] for result in results],
+    }), hide_index=True, width="stretch")
+
+    # A booking from the results is made for a single day, like the "1 jour spécifique" form
+    free = [(result["flex"], result["office"]) for result in results if result["whole_period"]]
+    if start_date != end_date or not free:
+        return
+    with st.form(key="search_reservation"):
+        col_office, col_name, _ = st.columns([1, 1, 2])
+        with col_office:
+            flex, office = st.selectbox("Bureau à réserver", free, format_func=lambda choice: f"{choice[1]} ({choice[0]})")
+        with col_name:
+            name = st.text_input("Entrez votre nom pour la réservation")
+        submitted = st.form_submit_button("Réserver")
+
+    if submitted:
+        if not name:  # Check that the name is not empty
+            st.warning("Veuillez entrer votre nom pour effectuer une réservation.")
+            return
+        try:
+            get_service(BUCKET_NAME, site).book(flex, office, start_date, period, name)
+        except ReservationError as e:
+            st.error(str(e))
+            return
+        except ConcurrentModificationError:
+            st.error(BUSY_MESSAGE)
+            return
+        st.success("Réservation effectuée avec succès.")
+        st.rerun()
 
 # ========================================================================================================================================
 # CREATION AND MODIFICATION     
-def reserve_office(df, today, offices, excel):
+@timed("app.reserve_form")
+def reserve_office(today, offices, flex, site):
     """
     Allows the user to reserve an office for a specific date or within the current month.
     The user can choose a date, a period (morning, afternoon, full day), and a specific office for the reservation.
 
     Parameters:
-    - df (pandas.DataFrame): DataFrame containing the office booking data.
     - today (datetime.date): The current date, used as a reference for reservations.
     - offices ([str]): List of offices available for reservation.
-    - excel (str): The name of the Excel file in the S3 bucket where booking data is stored.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
 
     Returns:
     None
 
     Notes:
     After the user submits the reservation form, the function checks the availability of the selected office
-    for the given period and updates the DataFrame and the Excel file on S3 accordingly.
+    for the given period on the latest version of the file on S3 and updates it accordingly.
     """
     option = st.radio(
         "Choisissez une période de visualisation des données",
-            ("1 jour spécifique", "Dans le mois"))
+            ("1 jour spécifique", "Dans le mois", "Chaque semaine"))
             
     if option == "1 jour spécifique":
         with st.form(key='reservation_form1'):
@@ -311,12 +445,16 @@ def reserve_office(df, today, offices, excel):
             with col_office:
                 office = st.radio("Quel bureau préférez vous ?", tuple(offices))
 
+            df = load_file_from_s3(BUCKET_NAME, site, flex, selected_date)
             display_selected_data(df, selected_date, 1, period)
                     
             # Input for the name under which the reservation will be made
-            col_name, _ = st.columns([1,3])
+            col_name, col_contact, _ = st.columns([1, 1, 2])
             with col_name:
                 name = st.text_input("Entrez votre nom pour la réservation")
+            with col_contact:
+                contact = st.text_input("E-mail pour être prévenu (liste d'attente)")
+            wait = st.checkbox("M'inscrire sur la liste d'attente si le bureau est déjà réservé")
 
             submitted = st.form_submit_button("Réserver")
 
@@ -324,68 +462,53 @@ def reserve_office(df, today, offices, excel):
             if submitted:
                 if name:  # Check that the name is not empty
                     try:
-                        # Create a mask for the rows corresponding to the selected date and period.
-                        mask = (df['Date'] == pd.Timestamp(selected_date))
-            
-                        if period != 'Journée':
-                            mask &= (df['Créneau'] == period)
-                        
-                        # Find lines that match our criteria
-                        matching_rows = df.loc[mask]
-            
-                        if not matching_rows.empty:
-                            # If the period is "Journée", we want to check availability for each segment of the day.
-                            if period == 'Journée':
-                                periods_to_check = ['Matin', 'Après-midi']
-                            else:
-                                periods_to_check = [period]  # # Otherwise, we only check the specific period selected.
-            
-                            for period_segment in periods_to_check:
-                                specific_mask = (matching_rows['Créneau'] == period_segment)
-                                # Check if the office is available for reservations
-                                if 'Disponible' in matching_rows.loc[specific_mask, office].values:
-                                    # Office available, so updated to indicate it is now reserved.
-                                    df.loc[mask & specific_mask, office] = name
-                                else:
-                                    # If the desktop is not available (i.e. the value is not "Disponible"), we display an error.
-                                    st.error(f"Le bureau {office} n'est pas disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
-                                    return  # We return here to avoid trying to save changes or other operations.
-                            
-                            # If we are here, this means that all the necessary reservations are available and have been updated.
-                            # We'll now save the updated DataFrame.
-                            save_df_to_s3(df, BUCKET_NAME, excel)
-                            st.success("Réservation effectuée avec succès.")
-                            st.experimental_rerun()
+                        # Check the availability and reserve every slot of the period on the latest version of the file.
+                        # If someone else saved the file in the meantime, the check is done again on their version.
+                        get_service(BUCKET_NAME, site).book(flex, office, selected_date, period, name)
+                        st.success("Réservation effectuée avec succès.")
+                        st.rerun()
+                    except ReservationError as e:
+                        if not wait:
+                            st.error(str(e))
                         else:
-                            st.warning("Aucune case disponible ne correspond à vos critères de sélection.")
-            
+                            join_waitlist(flex, office, selected_date, period, name, contact, site)
+                    except ConcurrentModificationError:
+                        st.error(BUSY_MESSAGE)
                     except Exception as e:
                         st.error(f"Une erreur s'est produite lors de la mise à jour de la réservation : {e}")
                 else:
                     st.warning("Veuillez entrer votre nom pour effectuer une réservation.")
         
+    if option == "Chaque semaine":
+        reserve_recurring(today, offices, flex, site)
+        return
+
     if option == "Dans le mois":
-                       
+        display_mode = st.radio("Affichage", ("Grille compacte", "Cases à cocher"), horizontal=True)
+        start_date = datetime.date.today()
+        end_date = start_date + datetime.timedelta(days=30)  # or any other logic to define the period
+        df = load_file_from_s3(BUCKET_NAME, site, flex, start_date, end_date)
+        if display_mode == "Grille compacte":
+            reserve_with_grid(df, offices, flex, site)
+            return
+
         # Define column names corresponding to offices
         office_columns = offices
         
         # Create a form to submit reservations
         with st.form(key='reservation_form2'):
             st.write("Veuillez sélectionner les créneaux de réservation")
-            
-            start_date = datetime.date.today()
-            end_date = start_date + datetime.timedelta(days=30)  # or any other logic to define the period
         
             # You must ensure that the dates selected are valid (the end date must come after the start date).
             if start_date > end_date:
                 st.error("La date de fin doit venir après la date de début.")
             else:
-                # Filter reservation data for selected dates
-                mask = (df['Date'] >= pd.to_datetime(start_date)) & (df['Date'] <= pd.to_datetime(end_date))
-                filtered_data = df.loc[mask]
+                # Locate the business-day slots of the selected dates in the availability index
+                index = availability_index(df)
+                rows = index.rows_between(start_date, end_date)
         
                 # If no data is available for the selected period, display a message.
-                if filtered_data.empty:
+                if len(rows) == 0:
                     st.write("Aucune donnée de réservation disponible pour la période sélectionnée.")
                 else:
                     # Create a row for column headers
@@ -395,33 +518,30 @@ def reserve_office(df, today, offices, excel):
                     for i, office in enumerate(office_columns, start=2):
                         header_cols[i].write(office)
                             
-                    # Create a dictionary to store user selections
+                    # Create a dictionary to store user selections, keyed by (date, slot, office)
                     user_selections = {}
+                    free = index.free_matrix(rows, office_columns)
         
-                    for index, row in filtered_data.iterrows():
-                        current_date = row['Date']  # Make sure 'Date' is a datetime object
-                        if not is_weekend(current_date):
-                            date_str = current_date.strftime('%A %d %B %Y')
-                            period = row['Créneau']
-                            user_selections[f"{date_str}-{period}"] = {}
-                            
-                            cols = st.columns(len(office_columns)+2)
-                            cols[0].write(date_str)
-                            cols[1].write(period)
-                
-                            for i, office in enumerate(office_columns, start=2):
-                                is_available = row[office] == 'Disponible'
-                                if is_available:
-                                    # If the desktop is available, create a checkbox and save the status in the dictionary
-                                    checkbox_checked = cols[i].checkbox('', key=f"{date_str}-{period}-{office}")
-                                    user_selections[f"{date_str}-{period}"][office] = checkbox_checked
-                                else:
-                                    # If the desktop is not available, deactivate the checkbox
-                                    cols[i].write(' -')
-                                    user_selections[f"{date_str}-{period}"][office] = False  # Non disponible ou non sélectionné
-                            
-                            if period == "Après-midi":
-                                st.write("---")
+                    for row, is_available_row in zip(rows, free):
+                        current_date = pd.Timestamp(index.days[row])
+                        date_str = current_date.strftime('%A %d %B %Y')
+                        period = index.slots[row]
+                        
+                        cols = st.columns(len(office_columns)+2)
+                        cols[0].write(date_str)
+                        cols[1].write(period)
+            
+                        for i, (office, is_available) in enumerate(zip(office_columns, is_available_row), start=2):
+                            if is_available:
+                                # If the desktop is available, create a checkbox and save the status in the dictionary
+                                checkbox_checked = cols[i].checkbox('', key=f"{date_str}-{period}-{office}")
+                                user_selections[(current_date, period, office)] = checkbox_checked
+                            else:
+                                # If the desktop is not available, deactivate the checkbox
+                                cols[i].write(' -')
+                        
+                        if period == "Après-midi":
+                            st.write("---")
 
                     # Submit form button
                     col_name, _ = st.columns([1,3])
@@ -432,70 +552,199 @@ def reserve_office(df, today, offices, excel):
                 # After submitting the form, display the user's selections or process them as required                      
                 if submitted:
                     if name:  # Check that the name is not empty
-                        # Iterate over all user selections and update the DataFrame
-                        for date_period, reservations in user_selections.items():
-                            try:
-                                # Check whether "Après-midi" is in the chain and adjust the division logic accordingly
-                                if "Après-midi" in date_period:
-                                    parts = date_period.split('-')
-                                    if len(parts) > 2:  # This means that "Après-midi" was part of the chain
-                                        # Rebuild 'selected_date_str' and 'period' taking into account the "Après-midi" anomaly
-                                        selected_date_str = parts[0]  # The date remains the first part
-                                        period = "Après-midi"  # Assign "Après-midi" value manually
-                                    else:
-                                        # If the length is not greater than 2, the division is normal.
-                                        selected_date_str, period = parts
-                                else:
-                                    # For all other strings, normal division logic applies
-                                    selected_date_str, period = date_period.split('-')
-                        
-                                # Convert formatted date string to datetime object
-                                selected_date = datetime.datetime.strptime(selected_date_str, '%A %d %B %Y')
-                             
-                            except ValueError:
-                                continue  # Goes to the next iteration, ignoring the rest of the code in the loop
-                            
-                            # Convert formatted date string to datetime object
-                            try:
-                                selected_date = datetime.datetime.strptime(selected_date_str, '%A %d %B %Y')
-                            except ValueError:
-                                st.error(f"Le format de la date est incorrect : {selected_date_str}")
-                                return
-                    
-                            # Create a mask for the rows corresponding to the selected date and period.
-                            mask = (df['Date'] == selected_date) & (df['Créneau'] == period)
-                    
-                            # Iterate over the reservations in the dictionary for the given date and period
-                            for office, is_booked in reservations.items():
-                                if is_booked:
-                                    # If the user has checked the box, we update the DataFrame.
-                                    # Check if the office is available for booking
-                                    if 'Disponible' in df.loc[mask, office].values:
-                                        # Office available, so updated to indicate it is now reserved.
-                                        df.loc[mask, office] = name  # Enter the name of the person who made the reservation
-                                    else:
-                                        # If the desktop is not available (i.e. the value is not "Disponible"), we display an error.
-                                        st.error(f"Le {office} n'est pas disponible pour {period} le {selected_date_str}.")
-                                        return  # We return here to avoid trying to save changes or other operations.
-                    
-                        # If we are here, this means that all the necessary reservations are available and have been updated.
-                        # We'll now save the updated DataFrame.
-                        save_df_to_s3(df, BUCKET_NAME, excel)
+                        # Every checked box is checked and reserved in one pass, then saved once:
+                        # if one of them is not available anymore, nothing is saved.
+                        requested = [cell for cell, is_booked in user_selections.items() if is_booked]
+                        try:
+                            get_service(BUCKET_NAME, site).book_cells(flex, requested, name)
+                        except ReservationError as e:
+                            st.error(str(e))
+                            return
+                        except ConcurrentModificationError:
+                            st.error(BUSY_MESSAGE)
+                            return
                         st.success("Réservation effectuée avec succès.")
                         st.rerun()
                     else:
                         st.warning("Veuillez entrer votre nom pour effectuer une réservation.")
 
-def cancel_reservation(df, today, offices, excel):
+@timed("app.reserve_grid_form")
+def reserve_with_grid(df, offices, flex, site):
+    """
+    Month reservation form displayed as a single editable grid instead of one checkbox widget per cell.
+
+    Parameters:
+    - df (pandas.DataFrame): DataFrame containing the office booking data of the next 30 days.
+    - offices ([str]): List of offices available for reservation.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
+
+    Returns:
+    None
+
+    Notes:
+    Each office is a checkbox column: available slots can be ticked, reserved ones are left empty.
+    The ticked boxes are reserved all at once, with the same semantics as the checkbox form.
+    """
+    start_date = datetime.date.today()
+    end_date = start_date + datetime.timedelta(days=30)
+    grid = availability_frame(df, offices, start_date, end_date)
+
+    if grid.empty:
+        st.write("Aucune donnée de réservation disponible pour la période sélectionnée.")
+        return
+
+    with st.form(key='reservation_form3'):
+        st.write("Veuillez cocher les créneaux de réservation (les cases vides sont déjà réservées)")
+        edited = st.data_editor(
+            grid,
+            hide_index=True,
+            width="stretch",
+            disabled=['Date', 'Créneau'],
+            column_config={office: st.column_config.CheckboxColumn(office) for office in offices},
+            key='reservation_grid'
+        )
+        col_name, _ = st.columns([1,3])
+        with col_name:
+            name = st.text_input("Entrez votre nom pour la réservation")
+        submitted = st.form_submit_button("Soumettre les réservations")
+
+    if submitted:
+        if not name:  # Check that the name is not empty
+            st.warning("Veuillez entrer votre nom pour effectuer une réservation.")
+            return
+        try:
+            get_service(BUCKET_NAME, site).book_cells(flex, checked_cells(df, edited, offices), name)
+        except ReservationError as e:
+            st.error(str(e))
+            return
+        except ConcurrentModificationError:
+            st.error(BUSY_MESSAGE)
+            return
+        st.success("Réservation effectuée avec succès.")
+        st.rerun()
+
+@timed("app.recurring_form")
+def reserve_recurring(today, offices, flex, site):
+    """
+    Recurring reservation form: an office on some days of every week of a period, e.g. every Tuesday and Thursday.
+
+    Parameters:
+    - today (datetime.date): The current date, used as a starting point for date selections.
+    - offices ([str]): List of offices available for reservation.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
+
+    Returns:
+    None
+
+    Notes:
+    The rule is checked on every day of the period in one pass and its reservations are saved in a single
+    write (see BookingService.add_rule). The existing rules are listed below the form and can be deleted,
+    which cancels their reservations from today.
+    """
+    with st.form(key="recurring_form"):
+        col_days, col_slot, col_office = st.columns([1, 1, 1])
+        with col_days:
+            weekdays = st.multiselect("Quels jours de la semaine ?", range(len(WEEKDAYS)), format_func=WEEKDAYS.__getitem__)
+        with col_slot:
+            period = st.radio("Quel créneau souhaitez-vous ?", ("Matin", "Après-midi", "Journée"), index=2)
+        with col_office:
+            office = st.radio("Quel bureau préférez vous ?", tuple(offices))
+        col_start, col_end, col_name = st.columns([1, 1, 1])
+        with col_start:
+            start_date = st.date_input("Du", value=today)
+        with col_end:
+            end_date = st.date_input("Au", value=today + datetime.timedelta(days=90))
+        with col_name:
+            name = st.text_input("Entrez votre nom pour la réservation")
+        skip_conflicts = st.checkbox("Réserver quand même les jours disponibles si certains sont déjà pris")
+        submitted = st.form_submit_button("Réserver chaque semaine")
+
+    if submitted:
+        try:
+            _, booked, skipped = get_service(BUCKET_NAME, site).add_rule(
+                flex, office, weekdays, period, start_date, end_date, name, skip_conflicts=skip_conflicts)
+        except ReservationError as e:
+            st.error(str(e))
+        except ConcurrentModificationError:
+            st.error(BUSY_MESSAGE)
+        else:
+            st.success(f"{booked} créneau(x) réservé(s).")
+            if skipped:
+                st.warning(conflict_message(skipped))
+
+    rules = get_service(BUCKET_NAME, site).list_rules(flex)
+    if not rules:
+        return
+    st.write("---")
+    st.write("Réservations récurrentes")
+    st.dataframe(pd.DataFrame({
+        "Nom": [rule["name"] for rule in rules],
+        "Bureau": [rule["office"] for rule in rules],
+        "Jours": [", ".join(WEEKDAYS[day] for day in rule["weekdays"]) for rule in rules],
+        "Créneau": [rule["period"] for rule in rules],
+        "Du": [rule["start"] for rule in rules],
+        "Au": [rule["end"] for rule in rules],
+    }), hide_index=True, width="stretch")
+    col_rule, col_button = st.columns([3, 1])
+    with col_rule:
+        rule = st.selectbox("Réservation récurrente à supprimer", rules,
+                            format_func=lambda rule: f"{rule['name']} - {rule['office']} ({rule['start']} au {rule['end']})")
+    with col_button:
+        if st.button("Supprimer et annuler les prochains créneaux"):
+            try:
+                released = get_service(BUCKET_NAME, site).delete_rule(flex, rule["id"], today)
+            except ReservationError as e:
+                st.warning(str(e))
+                return
+            except ConcurrentModificationError:
+                st.error(BUSY_MESSAGE)
+                return
+            st.success(f"{released} créneau(x) libéré(s).")
+            st.rerun()
+
+def join_waitlist(flex, office, selected_date, period, name, contact, site):
+    """
+    Queue the user for the slots of an office reserved by someone else, and display their position.
+
+    Parameters:
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - office (str): The office waited for.
+    - selected_date (datetime.date): The day.
+    - period (str): 'Matin', 'Après-midi' or 'Journée'.
+    - name (str): The name under which the reservation will be made.
+    - contact (str): Where the notification is sent, empty if none.
+    - site (str): The site of the flex office.
+
+    Returns:
+    None
+
+    Notes:
+    When the reservation is canceled, the office is reserved under the name of the first person waiting,
+    in the same write as the cancellation.
+    """
+    try:
+        positions = get_service(BUCKET_NAME, site).join_waitlist(flex, office, selected_date, period, name,
+                                                                 contact or None)
+    except ReservationError as e:
+        st.error(str(e))
+        return
+    for slot, position in positions.items():
+        st.info(f"Vous êtes n°{position} sur la liste d'attente du bureau {office} pour {slot} "
+                f"le {selected_date.strftime('%d/%m/%Y')}. Il vous sera attribué s'il se libère.")
+
+@timed("app.cancel_form")
+def cancel_reservation(today, offices, flex, site):
     """
     Allows the user to cancel a previously made office reservation. The user can select
     a date, a period (morning, afternoon, full day), and a specific office whose reservation needs to be canceled.
 
     Parameters:
-    - df (pandas.DataFrame): DataFrame containing the office booking data.
     - today (datetime.date): The current date, used as a reference for cancellations.
     - offices ([str]): List of offices available for cancellation.
-    - excel (str): The name of the Excel file in the S3 bucket where booking data is stored.
+    - flex (str): The name of the flex office, as declared in the configuration of the site.
+    - site (str): The site of the flex office.
 
     Returns:
     None
@@ -513,35 +762,116 @@ def cancel_reservation(df, today, offices, excel):
     with col_office:
         office = st.radio("Quel bureau préférez-vous ?", tuple(offices))
 
+    df = load_file_from_s3(BUCKET_NAME, site, flex, selected_date)
     with st.form(key="cancel"):
         display_selected_data(df, selected_date, 1, period)
         
         cancel = st.form_submit_button("Annuler le créneau")
         
         if cancel:
-            mask = (df['Date'] == pd.Timestamp(selected_date))
-            
-            if period != 'Journée':
-                mask &= (df['Créneau'] == period)
-            
-            matching_rows = df.loc[mask]
-            
-            if not matching_rows.empty:
-                periods_to_check = ['Matin', 'Après-midi'] if period == 'Journée' else [period]
-                
-                for period_segment in periods_to_check:
-                    specific_mask = (matching_rows['Créneau'] == period_segment)
-                    period_rows = df.loc[mask & specific_mask]
-                    
-                    for index, row in period_rows.iterrows():
-                        if row[office] != 'Disponible':  # The office is currently reserved
-                            df.at[index, office] = 'Disponible'  # Make the office available
-                            st.success(f"Le bureau {office} est maintenant disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
-            
-                save_df_to_s3(df, BUCKET_NAME, excel)  # Save the updated DataFrame to S3
-                st.rerun()
-            else:
-                st.warning("Aucune réservation ne correspond à vos critères de sélection.")
+            # Nothing to cancel on the version of the file the user is looking at
+            if office in availability_index(df).free_offices(selected_date, period):
+                st.warning(f"Le bureau {office} n'est pas réservé pour ce créneau le {selected_date.strftime('%d/%m/%Y')}.")
+                return
+            try:
+                # Free the slots on the latest version of the file, without overwriting concurrent reservations
+                released, assigned = get_service(BUCKET_NAME, site).cancel(flex, office, selected_date, period)
+            except ReservationError as e:
+                st.warning(str(e))
+                return
+            except ConcurrentModificationError:
+                st.error(BUSY_MESSAGE)
+                return
+            for period_segment in released:
+                if period_segment in assigned:
+                    st.success(f"Le bureau {office} a été attribué à {assigned[period_segment]} (liste d'attente) "
+                               f"pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
+                else:
+                    st.success(f"Le bureau {office} est maintenant disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
+            st.rerun()
+
+# ========================================================================================================================================
+# STATISTICS
+@timed("app.statistics")
+def show_statistics(today, flex, site):
+    """
+    Display the occupancy statistics of a flex office over a period, archived years included.
+
+    Parameters:
+    - today (datetime.date): The current date, end of the default period.
+    - flex (str): The flex office.
+    - site (str): The site of the flex office.
+
+    Returns:
+    None
+
+    Notes:
+    The report is computed once per data version and period for every session (see BookingService.analytics),
+    so the page is rendered from memory until a reservation changes the data.
+    """
+    col_start, col_end = st.columns([1, 1])
+    with col_start:
+        start_date = st.date_input("Du", value=today - datetime.timedelta(days=ANALYTICS_DAYS), key="stats_start")
+    with col_end:
+        end_date = st.date_input("Au", value=today, min_value=start_date, key="stats_end")
+
+    report = get_service(BUCKET_NAME, site).analytics(flex, start_date, end_date)
+    if report["rate"] is None:
+        st.write("Aucun jour ouvré sur cette période.")
+        return
+    col_rate, col_people = st.columns([1, 1])
+    col_rate.metric("Taux d'occupation", f"{report['rate']:.0%}")
+    col_people.metric("Personnes ayant réservé", len(report["people"]))
+
+    st.subheader("Occupation quotidienne")
+    st.line_chart(report["daily"])
+    st.subheader("Par bureau, jour de la semaine et créneau")
+    rates = list(report["weekdays"].columns) + list(report["slots"].columns) + ["Taux d'occupation"]
+    st.dataframe(report["offices"].join(report["weekdays"]).join(report["slots"]).style.format(
+        lambda value: f"{value:.0%}" if pd.notna(value) else "", subset=rates), width="stretch")
+    st.subheader("Par personne")
+    st.dataframe(report["people"], width="stretch", column_config={
+        "Première réservation": st.column_config.DateColumn(format="DD/MM/YYYY"),
+        "Dernière réservation": st.column_config.DateColumn(format="DD/MM/YYYY"),
+    })
+    if report["late_cancellations"] is not None and not report["late_cancellations"].empty:
+        st.subheader("Annulations le jour même ou après")
+        st.bar_chart(report["late_cancellations"][["Réservations", "Annulations tardives"]])
+
+# ========================================================================================================================================
+# DIAGNOSTIC
+def debug_panel(site):
+    """
+    Display, for the administrators only, the time spent in each step of the current rerun.
+
+    Parameters:
+    - site (str): The site displayed, whose file cache statistics are shown.
+
+    Returns:
+    None
+
+    Notes:
+    The panel is unlocked in the sidebar with the ADMIN_MDP secret, for the rest of the session.
+    It lists the timed steps in the order they started, indented by nesting level (e.g. the S3 GET
+    and the parsing of a file inside its loading), and the statistics of the file cache.
+    """
+    if not ADMIN_PASSWORD:
+        return
+    with st.sidebar.expander("Diagnostic"):
+        if not st.session_state.get("admin"):
+            entered_password = st.text_input("Mot de passe administrateur", type="password", key="admin_password")
+            if entered_password != ADMIN_PASSWORD:
+                return
+            st.session_state.admin = True
+
+        trace, total_ms = current_trace()
+        steps = pd.DataFrame({
+            "Étape": ["· " * record["depth"] + record["span"] for record in trace] + ["Total du rerun"],
+            "ms": [record["ms"] for record in trace] + [round(total_ms, 3)],
+        })
+        st.dataframe(steps, hide_index=True, width="stretch")
+        stats = file_cache_stats(get_service(BUCKET_NAME, site).store)
+        st.caption("Cache des fichiers : " + ", ".join(f"{name} {value}" for name, value in stats.items()))
 
 
 #####################################################################
@@ -562,34 +892,12 @@ def main():
     reserve or cancel offices. Users must authenticate with a password before accessing the features.
     """
     st.set_page_config(layout="wide", page_icon=":clock3:", page_title="Flex Offices")
+    enable_copy_on_write()  # The grids cached for every session are handed out without copying them
+    start_trace()  # Time the steps of this rerun
+    start_metrics_server()
 
     today = datetime.date.today()
 
-    # Configuration for each flex office
-    flex_config = {
-        "Aquarium": {
-            "image": "aquarium.jpg",
-            "excel": "FlexAqua.xlsx",
-            "sidebar_image": "aqua.png",
-            "plan": "plan_aqua.png",
-            "offices": ["Aquali", "Carapuce", "Hank", "Némo", "Polochon", "Tamatoa"]
-        },
-        "Jungle": {
-            "image": "serre.jpg",
-            "excel": "FlexSerre.xlsx",
-            "sidebar_image": "jungle.png",
-            "plan": "plan_jungle.png",
-            "offices": ["Baloo", "Stitch", "Rajah", "Meeko"]
-        },
-        "IMA": {
-            "image": "clinicaltrial.jpg",
-            "excel": "FlexIMA.xlsx",
-            "sidebar_image": "clinicaltrial.png",
-            "plan": "plan_ima.png",
-            "offices": ["Bureau 1", "Bureau 2", "Bureau 3"]
-        }    
-    }
-
     # Initialize st.session_state
     if "authenticated" not in st.session_state:
         st.session_state.authenticated = False
@@ -607,24 +915,40 @@ def main():
 
     # Display options once authenticated
     if st.session_state.authenticated:
+        roll_calendars(BUCKET_NAME, today)
+        sites = get_sites(BUCKET_NAME)
+        site_names = {site: sites.name(site) for site in sites.sites()}
+        site = next(iter(site_names))
+        if len(site_names) > 1:
+            site = st.sidebar.selectbox("Choisissez votre site", list(site_names), format_func=site_names.get, index=0)
+        flex_config = sites.config(site)
         flex = st.sidebar.selectbox("Choisissez votre flex office", list(flex_config.keys()), index=0)
 
         # Apply the configuration based on the chosen office
         office_details = flex_config[flex]
         load_image(office_details["image"])
-        df = load_file_from_s3(BUCKET_NAME, office_details["excel"])
         load_image_sidebar(office_details["sidebar_image"])
 
-        tab_selection = st.sidebar.selectbox("Que souhaitez-vous faire ?", ["Visualisation", "Réservation", "Annulation"])
+        tab_selection = st.sidebar.selectbox("Que souhaitez-vous faire ?", ["Visualisation", "Recherche", "Réservation", "Annulation",
+                                                                                   "Statistiques"])
         st.write("---")
         load_image_sidebar(office_details["plan"])
 
         if tab_selection == "Visualisation":
-            visualize_data(df, today)
+            visualize_data(flex, site, today)
+        elif tab_selection == "Recherche":
+            search_free_offices(today, site)
         elif tab_selection == "Réservation":
-            reserve_office(df, today, office_details["offices"], office_details["excel"])
+            reserve_office(today, office_details["offices"], flex, site)
         elif tab_selection == "Annulation":
-            cancel_reservation(df, today, office_details["offices"], office_details["excel"])
+            cancel_reservation(today, office_details["offices"], flex, site)
+        elif tab_selection == "Statistiques":
+            show_statistics(today, flex, site)
+
+        debug_panel(site)
+
+    if os.environ.get(FILE_VARIABLE):
+        write_metrics(os.environ[FILE_VARIABLE])
 
 
 #####################################################################
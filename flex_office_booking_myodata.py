@@ -4,9 +4,12 @@
 
 import streamlit as st
 import pandas as pd
-from PIL import Image
 import datetime
 import os
+from flex_grid import ReservationError, book_cells, book_slots, release_slots
+from flex_images import image_bytes
+from flex_storage import FrameStore, LocalBackend
+from flex_service import FLEX_CONFIG
 
 
 #####################################################################
@@ -16,6 +19,7 @@ import os
 GENERAL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/"
 IMG_PATH = os.path.join(GENERAL_PATH, "images/")
 LOCAL_FOLDER = "flexoffice"
+STORAGE_FORMAT = "parquet"  # "xlsx" keeps the historical workbooks as the stored files
 
 #####################################################################
 # ========================= GENERAL INFO ========================== #
@@ -27,28 +31,41 @@ LOCAL_FOLDER = "flexoffice"
 
 # ========================================================================================================================================
 # DATA LOADING
+@st.cache_resource
+def get_store(folder_name):
+    """
+    Return the reservation store shared by every session of the Streamlit server.
+
+    Parameters:
+    - folder_name (str): Name of the local subfolder (e.g., "flexoffice")
+
+    Returns:
+    - FrameStore: Store reading and writing the reservation files of the folder
+    """
+    return FrameStore(LocalBackend(os.path.join(GENERAL_PATH, folder_name)), fmt=STORAGE_FORMAT)
+
 def load_file_from_local(folder_name, file_name):
     """
-    Loads a local Excel file from a specific folder.
+    Loads a local reservation file from a specific folder.
 
     Parameters:
     - folder_name (str): Name of the local subfolder (e.g., "flexoffice")
-    - file_name (str): Name of the Excel file to load (e.g., "FlexIMA.xlsx")
+    - file_name (str): Name of the file to load, as declared in the configuration (e.g., "FlexIMA.xlsx")
 
     Returns:
-    - pandas.DataFrame: Data loaded from the Excel file
+    - pandas.DataFrame: Data loaded from the file
 
     Raises:
     - FileNotFoundError: If the file does not exist
+
+    Notes:
+    The file is read in STORAGE_FORMAT; the Excel workbook is converted on first access if needed.
     """
-    file_path = os.path.join(GENERAL_PATH, folder_name, file_name)
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File {file_path} not found.")
-    return pd.read_excel(file_path)
+    return get_store(folder_name).load(file_name)
 
 def load_image(img_name):
     """
-    Load and display an image from the images folder, adjusting its size.
+    Display a banner image from the images folder, reduced in height.
 
     Parameters:
     - img_name (str): The name of the image to load and display.
@@ -57,24 +74,13 @@ def load_image(img_name):
     None
 
     Notes:
+    The resized variant is prepared once (see flex_images.py) and its bytes are kept in memory,
+    so displaying the banner does not decode nor resize the image again.
     Displays a warning if the specified image does not exist in the images folder.
     """
-    img_path = os.path.join(IMG_PATH, img_name)  # Construct the full path to the image
-    if os.path.exists(img_path):
-        image = Image.open(img_path)  # Open the image file
-        
-        # Get the original dimensions of the image
-        width, height = image.size
-        
-        # Calculate the new height
-        new_height = int(height * 0.67)  # Reduce height by 33% which is equivalent to multiplying by 0.67
-        
-        # Resize the image
-        image_resized = image.resize((width, new_height))
-        
-        # Display the resized image using Streamlit
-        st.image(image_resized, use_column_width=True)
-    else:
+    try:
+        st.image(image_bytes(img_name, "banner", IMG_PATH), use_column_width=True)
+    except FileNotFoundError:
         # Display a warning if the image does not exist
         st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")
 
@@ -89,33 +95,73 @@ def load_image_sidebar(img_name):
     None
 
     Notes:
+    The recompressed variant is prepared once (see flex_images.py) and its bytes are kept in memory.
     Displays a warning if the specified image does not exist in the images folder.
     """
-    img_path = os.path.join(IMG_PATH, img_name)  # Construct the full path to the image
-    if os.path.exists(img_path):
-        image = Image.open(img_path)  # Open the image file
-        st.sidebar.image(image, use_column_width=True)  # Display the image in the sidebar using Streamlit
-    else:
+    try:
+        st.sidebar.image(image_bytes(img_name, "sidebar", IMG_PATH), use_column_width=True)
+    except FileNotFoundError:
         st.warning(f"The image {img_name} does not exist in the folder {IMG_PATH}.")  # Display a warning if the image does not exist
 
 # ========================================================================================================================================
 # SAVE
 def save_file_to_local(df, folder_name, file_name):
     """
-    Saves a DataFrame to an Excel file in a specific local folder.
+    Saves a DataFrame to a reservation file in a specific local folder.
 
     Parameters:
     - df (pandas.DataFrame): Data to save
     - folder_name (str): Name of the local subfolder (e.g., "flexoffice")
-    - file_name (str): Name of the Excel file to create
+    - file_name (str): Name of the file, as declared in the configuration
+
+    Returns:
+    None
+    """
+    get_store(folder_name).save(df, file_name)
+
+def book_slots_in_local(folder_name, file_name, date, period, office, name):
+    """
+    Reserves an office for a period of a day in a local reservation file.
+
+    Parameters:
+    - folder_name (str): Name of the local subfolder (e.g., "flexoffice")
+    - file_name (str): Name of the file, as declared in the configuration
+    - date (datetime.date): The day of the reservation
+    - period (str): 'Matin', 'Après-midi' or 'Journée'
+    - office (str): The office to reserve
+    - name (str): The name under which the reservation is made
 
     Returns:
     None
+
+    Raises:
+    - ReservationError: If the day is not in the file or the office is not available. Nothing is saved in that case.
+
+    Notes:
+    The file is modified on its latest version (see FrameStore.update), and the grid accepts any new name.
+    """
+    get_store(folder_name).update(file_name, lambda df: book_slots(df, date, period, office, name))
+
+def book_cells_in_local(folder_name, file_name, cells, name):
     """
-    folder_path = os.path.join(GENERAL_PATH, folder_name)
-    os.makedirs(folder_path, exist_ok=True)
-    file_path = os.path.join(folder_path, file_name)
-    df.to_excel(file_path, index=False)
+    Reserves a batch of (date, slot, office) cells of a local reservation file, all or nothing.
+
+    Raises:
+    - ReservationError: Listing the cells that are not available. Nothing is saved in that case.
+    """
+    get_store(folder_name).update(file_name, lambda df: book_cells(df, cells, name))
+
+def release_slots_in_local(folder_name, file_name, date, period, office):
+    """
+    Cancels the reservation of an office for a period of a day in a local reservation file.
+
+    Returns:
+    - [str]: The slots that were reserved and are now available.
+
+    Raises:
+    - ReservationError: If the day is not in the file.
+    """
+    return get_store(folder_name).update(file_name, lambda df: release_slots(df, date, period, office))
 
 # ========================================================================================================================================
 # GRAPH AND DISPLAY
@@ -285,43 +331,16 @@ def reserve_office(df, today, offices, excel):
             if submitted:
                 if name:  # Check that the name is not empty
                     try:
-                        # Create a mask for the rows corresponding to the selected date and period.
-                        mask = (df['Date'] == pd.Timestamp(selected_date))
-            
-                        if period != 'Journée':
-                            mask &= (df['Créneau'] == period)
-                        
-                        # Find lines that match our criteria
-                        matching_rows = df.loc[mask]
-            
-                        if not matching_rows.empty:
-                            # If the period is "Journée", we want to check availability for each segment of the day.
-                            if period == 'Journée':
-                                periods_to_check = ['Matin', 'Après-midi']
-                            else:
-                                periods_to_check = [period]  # # Otherwise, we only check the specific period selected.
-            
-                            for period_segment in periods_to_check:
-                                specific_mask = (matching_rows['Créneau'] == period_segment)
-                                # Check if the office is available for reservations
-                                if 'Disponible' in matching_rows.loc[specific_mask, office].values:
-                                    # Office available, so updated to indicate it is now reserved.
-                                    df.loc[mask & specific_mask, office] = name
-                                else:
-                                    # If the desktop is not available (i.e. the value is not "Disponible"), we display an error.
-                                    st.error(f"Le bureau {office} n'est pas disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
-                                    return  # We return here to avoid trying to save changes or other operations.
-                            
-                            # If we are here, this means that all the necessary reservations are available and have been updated.
-                            # We'll now save the updated DataFrame.
-                            save_file_to_local(df, LOCAL_FOLDER, excel)
-                            st.success("Réservation effectuée avec succès.")
-                            st.experimental_rerun()
-                        else:
-                            st.warning("Aucune case disponible ne correspond à vos critères de sélection.")
-            
+                        # Every slot of the period is checked and reserved at once, on the latest version of the file
+                        book_slots_in_local(LOCAL_FOLDER, excel, selected_date, period, office, name)
+                    except ReservationError as e:
+                        st.error(str(e))
+                        return
                     except Exception as e:
                         st.error(f"Une erreur s'est produite lors de la mise à jour de la réservation : {e}")
+                        return
+                    st.success("Réservation effectuée avec succès.")
+                    st.rerun()
                 else:
                     st.warning("Veuillez entrer votre nom pour effectuer une réservation.")
         
@@ -393,7 +412,8 @@ def reserve_office(df, today, offices, excel):
                 # After submitting the form, display the user's selections or process them as required                      
                 if submitted:
                     if name:  # Check that the name is not empty
-                        # Iterate over all user selections and update the DataFrame
+                        # Collect the cells checked by the user
+                        cells = []
                         for date_period, reservations in user_selections.items():
                             try:
                                 # Check whether "Après-midi" is in the chain and adjust the division logic accordingly
@@ -411,37 +431,19 @@ def reserve_office(df, today, offices, excel):
                                     selected_date_str, period = date_period.split('-')
                         
                                 # Convert formatted date string to datetime object
-                                selected_date = datetime.datetime.strptime(selected_date_str, '%A %d %B %Y')
+                                selected_date = datetime.datetime.strptime(selected_date_str, '%A %d %B %Y').date()
                              
                             except ValueError:
                                 continue  # Goes to the next iteration, ignoring the rest of the code in the loop
-                            
-                            # Convert formatted date string to datetime object
-                            try:
-                                selected_date = datetime.datetime.strptime(selected_date_str, '%A %d %B %Y')
-                            except ValueError:
-                                st.error(f"Le format de la date est incorrect : {selected_date_str}")
-                                return
-                    
-                            # Create a mask for the rows corresponding to the selected date and period.
-                            mask = (df['Date'] == selected_date) & (df['Créneau'] == period)
-                    
-                            # Iterate over the reservations in the dictionary for the given date and period
-                            for office, is_booked in reservations.items():
-                                if is_booked:
-                                    # If the user has checked the box, we update the DataFrame.
-                                    # Check if the office is available for booking
-                                    if 'Disponible' in df.loc[mask, office].values:
-                                        # Office available, so updated to indicate it is now reserved.
-                                        df.loc[mask, office] = name  # Enter the name of the person who made the reservation
-                                    else:
-                                        # If the desktop is not available (i.e. the value is not "Disponible"), we display an error.
-                                        st.error(f"Le {office} n'est pas disponible pour {period} le {selected_date_str}.")
-                                        return  # We return here to avoid trying to save changes or other operations.
-                    
-                        # If we are here, this means that all the necessary reservations are available and have been updated.
-                        # We'll now save the updated DataFrame.
-                        save_file_to_local(df, LOCAL_FOLDER, excel)
+
+                            cells.extend((selected_date, period, office) for office, is_booked in reservations.items() if is_booked)
+
+                        try:
+                            # All the reservations are made together, or none if one of the offices was taken in the meantime
+                            book_cells_in_local(LOCAL_FOLDER, excel, cells, name)
+                        except ReservationError as e:
+                            st.error(str(e))
+                            return
                         st.success("Réservation effectuée avec succès.")
                         st.rerun()
                     else:
@@ -480,29 +482,14 @@ def cancel_reservation(df, today, offices, excel):
         cancel = st.form_submit_button("Annuler le créneau")
         
         if cancel:
-            mask = (df['Date'] == pd.Timestamp(selected_date))
-            
-            if period != 'Journée':
-                mask &= (df['Créneau'] == period)
-            
-            matching_rows = df.loc[mask]
-            
-            if not matching_rows.empty:
-                periods_to_check = ['Matin', 'Après-midi'] if period == 'Journée' else [period]
-                
-                for period_segment in periods_to_check:
-                    specific_mask = (matching_rows['Créneau'] == period_segment)
-                    period_rows = df.loc[mask & specific_mask]
-                    
-                    for index, row in period_rows.iterrows():
-                        if row[office] != 'Disponible':  # The office is currently reserved
-                            df.at[index, office] = 'Disponible'  # Make the office available
-                            st.success(f"Le bureau {office} est maintenant disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
-            
-                save_file_to_local(df, LOCAL_FOLDER, excel)
-                st.rerun()
-            else:
-                st.warning("Aucune réservation ne correspond à vos critères de sélection.")
+            try:
+                released = release_slots_in_local(LOCAL_FOLDER, excel, selected_date, period, office)
+            except ReservationError as e:
+                st.warning(str(e))
+                return
+            for period_segment in released:
+                st.success(f"Le bureau {office} est maintenant disponible pour {period_segment} le {selected_date.strftime('%d/%m/%Y')}.")
+            st.rerun()
 
 
 #####################################################################
@@ -526,35 +513,10 @@ def main():
 
     today = datetime.date.today()
 
-    # Configuration for each flex office
-    flex_config = {
-        "Aquarium": {
-            "image": "aquarium.jpg",
-            "excel": "FlexAqua.xlsx",
-            "sidebar_image": "aqua.png",
-            "plan": "plan_aqua.png",
-            "offices": ["Aquali", "Carapuce", "Hank", "Némo", "Polochon", "Tamatoa"]
-        },
-        "Jungle": {
-            "image": "serre.jpg",
-            "excel": "FlexSerre.xlsx",
-            "sidebar_image": "jungle.png",
-            "plan": "plan_jungle.png",
-            "offices": ["Baloo", "Stitch", "Rajah", "Meeko"]
-        },
-        "IMA": {
-            "image": "clinicaltrial.jpg",
-            "excel": "FlexIMA.xlsx",
-            "sidebar_image": "clinicaltrial.png",
-            "plan": "plan_ima.png",
-            "offices": ["Bureau 1", "Bureau 2", "Bureau 3"]
-        }    
-    }
-
-    flex = st.sidebar.selectbox("Choisissez votre flex office", list(flex_config.keys()), index=0)
+    flex = st.sidebar.selectbox("Choisissez votre flex office", list(FLEX_CONFIG.keys()), index=0)
 
     # Apply the configuration based on the chosen office
-    office_details = flex_config[flex]
+    office_details = FLEX_CONFIG[flex]
     load_image(office_details["image"])
     df = load_file_from_local(LOCAL_FOLDER, office_details["excel"])
     df['Date'] = pd.to_datetime(df['Date'], errors='coerce')  # 💡 Ajout essentiel
@@ -0,0 +1,575 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import pandas as pd
+
+from flex_grid import (RenderCache, append_rows, concat_grids, enable_copy_on_write, encode_grid, missing_rows,
+                       shared_copy)
+from flex_metrics import span
+from flex_storage import (DEFAULT_FORMAT, FORMATS, LEGACY_FORMAT, RETRY_BACKOFF_SECONDS, UPDATE_RETRIES,
+                          ConcurrentModificationError, FrameStore, LocalBackend, S3Backend,
+                          deserialize_frame, make_s3_client, serialize_frame, storage_key)
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Name of the file listing the partitions of a grid, stored in the folder of its partitions
+MANIFEST_NAME = "manifest.json"
+
+# Partition of the rows whose date could not be parsed; it sorts before every month, so it is archived first
+UNDATED = "0000-00"
+
+# Number of assembled grids (sets of months) kept for every session of the process
+GRID_CACHE_SIZE = 32
+
+
+#####################################################################
+# ============================ MONTHS ============================= #
+#####################################################################
+
+def month_of(date):
+    """
+    Return the partition of a date, as "YYYY-MM".
+    """
+    return f"{date.year:04d}-{date.month:02d}"
+
+def months_between(start_date, end_date):
+    """
+    Return the partitions of the months overlapping a date range.
+
+    Parameters:
+    - start_date (datetime.date): First day of the range.
+    - end_date (datetime.date): Last day of the range (included).
+
+    Returns:
+    - [str]: The months as "YYYY-MM", in chronological order. Empty if the range is reversed.
+    """
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def month_bounds(start_date, end_date):
+    """
+    Extend a date range to whole months.
+
+    Parameters:
+    - start_date (datetime.date): First day of the range.
+    - end_date (datetime.date): Last day of the range (included).
+
+    Returns:
+    - (datetime.date, datetime.date): The first day of the first month and the last day of the last month.
+    """
+    first_day = datetime.date(start_date.year, start_date.month, 1)
+    next_month = datetime.date(end_date.year + end_date.month // 12, end_date.month % 12 + 1, 1)
+    return first_day, next_month - datetime.timedelta(days=1)
+
+def split_months(df):
+    """
+    Split a reservation grid into one DataFrame per month.
+
+    Parameters:
+    - df (pandas.DataFrame): The grid, with a datetime 'Date' column.
+
+    Returns:
+    - dict: "YYYY-MM" -> the rows of the month, in their original order (UNDATED for the rows without a date).
+    """
+    months = df['Date'].dt.strftime('%Y-%m').fillna(UNDATED)
+    return {month: frame.reset_index(drop=True) for month, frame in df.groupby(months, sort=True)}
+
+
+#####################################################################
+# ============================= STORE ============================= #
+#####################################################################
+
+class PartitionedFrameStore(FrameStore):
+    """
+    FrameStore keeping each grid as one file per month, listed in a small manifest.
+
+    A page showing the next 15 days only downloads and parses the one or two months it covers,
+    whatever the length of the history. Partition files are immutable and named after their content:
+    a modification writes the months it changed as new files, then replaces the manifest with a
+    conditional write. The manifest is the only file that is ever replaced, so a modification spanning
+    several months is saved all at once, with the same compare-and-swap as FrameStore.update.
+
+    Past months can be archived: they leave the hot set returned by `load`, and are only read
+    when a date range asks for them.
+
+    Parameters:
+    - backend (StorageBackend): Where the files are stored.
+    - fmt (str, optional): Format of the partitions. Defaults to DEFAULT_FORMAT.
+    - legacy_fmt (str, optional): Format of the historical files. Defaults to LEGACY_FORMAT.
+    - cache (DataFrameCache, optional): Cache of the parsed partitions. A new one is created if not provided.
+
+    Notes:
+    The partitions of "FlexAqua.xlsx" are stored as "FlexAqua/<YYYY-MM>.<digest>.parquet", next to
+    "FlexAqua/manifest.json". The version of the data is the version of the manifest. When the manifest
+    is missing, it is created from the single file of FrameStore or, failing that, from the legacy workbook.
+    Superseded partition files are not deleted: nothing references them anymore. The grids assembled
+    from the partitions are kept too, under the keys of their partitions, and shared by every session.
+    """
+
+    def __init__(self, backend, fmt=DEFAULT_FORMAT, legacy_fmt=LEGACY_FORMAT, cache=None):
+        super().__init__(backend, fmt=fmt, legacy_fmt=legacy_fmt, cache=cache)
+        self._manifests = {}  # file name -> [manifest, version, last check (monotonic time)]
+        self._cached = {}  # file name -> keys of the partitions put in the cache
+        self._grids = RenderCache(GRID_CACHE_SIZE)  # keys of the partitions -> grid assembled from them
+        self._lock = threading.Lock()
+
+    def _folder(self, file_name):
+        return os.path.splitext(file_name)[0] + "/"
+
+    def _manifest_key(self, file_name):
+        return self._folder(file_name) + MANIFEST_NAME
+
+    @staticmethod
+    def _stored(manifest):
+        # Every partition of a grid, archived or not
+        return {**manifest["archive"], **manifest["partitions"]}
+
+    def _read_manifest(self, file_name):
+        with span("storage.read"):
+            data, version = self.backend.read(self._manifest_key(file_name))
+        return json.loads(data), version
+
+    def _remember(self, file_name, manifest, version):
+        current = set(self._stored(manifest).values())
+        with self._lock:
+            self._manifests[file_name] = [manifest, version, time.monotonic()]
+            cached = self._cached.setdefault(file_name, set())
+            superseded = cached - current
+            cached &= current
+        # Superseded partitions will not be read again (or only by a load already under way, which caches them again)
+        for key in superseded:
+            self.cache.invalidate(key)
+
+    def _manifest(self, file_name):
+        # Same revalidation as DataFrameCache: trusted for the TTL, then compared with a HEAD request
+        with self._lock:
+            entry = self._manifests.get(file_name)
+        if entry is not None:
+            if time.monotonic() - entry[2] < self.cache.ttl:
+                return entry[0], entry[1]
+            with span("storage.head"):
+                version = self.backend.head(self._manifest_key(file_name))
+            if version == entry[1]:
+                with self._lock:
+                    entry[2] = time.monotonic()
+                return entry[0], entry[1]
+        try:
+            manifest, version = self._read_manifest(file_name)
+        except FileNotFoundError:
+            # Create only: if another user migrated (and booked) in the meantime, their manifest is kept
+            self.migrate(file_name, overwrite=False)
+            manifest, version = self._read_manifest(file_name)
+        self._remember(file_name, manifest, version)
+        return manifest, version
+
+    def _read_partition(self, file_name, key):
+        with self._lock:
+            self._cached.setdefault(file_name, set()).add(key)
+
+        def fetch():
+            with span("storage.read"):
+                data, _ = self.backend.read(key)
+            with span("storage.parse", fmt=self.fmt):
+                return encode_grid(deserialize_frame(data, self.fmt)), key
+
+        # A partition never changes: its key is its version, so it is never downloaded twice
+        return self.cache.get(key, lambda: key, fetch)
+
+    def _prefetch(self, file_name, keys):
+        # The months not cached yet are downloaded at the same time rather than one round trip after the other
+        missing = self.cache.missing(keys)
+        if len(missing) < 2:
+            return
+        with self._lock:
+            self._cached.setdefault(file_name, set()).update(missing)
+        with span("storage.read_many"):
+            fetched = self.backend.read_many(missing)
+        for key, (data, _) in fetched.items():
+            with span("storage.parse", fmt=self.fmt):
+                self.cache.put(key, encode_grid(deserialize_frame(data, self.fmt)), key)
+
+    def _concat(self, file_name, manifest, keys):
+        if not keys:
+            empty = pd.DataFrame({column: pd.Series(dtype=object) for column in manifest["columns"]})
+            return encode_grid(empty)
+        # The partitions are immutable, so the grid assembled from the same ones is the same for every session
+        grid = self._grids.get(tuple(keys))
+        if grid is None:
+            self._prefetch(file_name, keys)
+            # Each month has its own dictionary of names: they are merged so the grid stays categorical
+            grid = concat_grids([self._read_partition(file_name, key) for key in keys])
+            self._grids.put(tuple(keys), grid)
+        return shared_copy(grid)
+
+    def load_versioned(self, file_name):
+        """
+        Load the hot set of a reservation grid, i.e. every month that is not archived.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - (pandas.DataFrame, str): A copy of the reservation data and its version.
+
+        Raises:
+        - FileNotFoundError: If the grid exists neither as partitions, nor as a single file, nor in the legacy format.
+        """
+        manifest, version = self._manifest(file_name)
+        return self._concat(file_name, manifest, [manifest["partitions"][month] for month in sorted(manifest["partitions"])]), version
+
+    def load_range(self, file_name, start_date, end_date):
+        """
+        Load the months of a reservation grid overlapping a date range, archived or not.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date): Last day of the range (included).
+
+        Returns:
+        - (pandas.DataFrame, str): A copy of the rows of those whole months, and the version of the grid.
+        """
+        manifest, version = self._manifest(file_name)
+        stored = self._stored(manifest)
+        return self._concat(file_name, manifest, [stored[month] for month in months_between(start_date, end_date)
+                                                  if month in stored]), version
+
+    def version(self, file_name):
+        """
+        Return the current version of a reservation grid (the version of its manifest), without loading any month.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - str: The version `load_versioned` and `load_range` would return.
+        """
+        return self._manifest(file_name)[1]
+
+    def _write_partition(self, file_name, month, frame):
+        with span("storage.serialize", fmt=self.fmt):
+            data = serialize_frame(frame, self.fmt)
+        key = f"{self._folder(file_name)}{month}.{hashlib.md5(data).hexdigest()[:16]}{FORMATS[self.fmt]['extension']}"
+        return key, data
+
+    def _commit(self, file_name, df, if_match=None, if_none_match=False, replace=True):
+        # Base the new manifest on the one that was loaded, to keep the archive and the untouched months
+        if if_none_match:
+            base = None
+        else:
+            with self._lock:
+                entry = self._manifests.get(file_name)
+            if entry is not None and if_match is not None and entry[1] == if_match:
+                base = entry[0]
+            else:
+                try:
+                    base, _ = self._read_manifest(file_name)
+                except FileNotFoundError:
+                    base = None
+        base = base or {"partitions": {}, "archive": {}}
+
+        partitions = {} if replace else dict(base["partitions"])
+        archive = dict(base["archive"])
+        written = []
+        for month, frame in split_months(df).items():
+            key, data = self._write_partition(file_name, month, frame)
+            if key != self._stored(base).get(month):
+                written.append((key, data, FORMATS[self.fmt]["content_type"]))
+                # The content of the new partition is known: it is not downloaded and encoded again
+                with self._lock:
+                    self._cached.setdefault(file_name, set()).add(key)
+                self.cache.put(key, encode_grid(frame), key)
+            if month in archive:
+                archive[month] = key
+            else:
+                partitions[month] = key
+        # The new months are uploaded together, and only referenced by the manifest once they are all stored
+        with span("storage.write"):
+            self.backend.write_many(written)
+
+        manifest = {"format": self.fmt, "columns": list(df.columns), "partitions": partitions, "archive": archive}
+        if if_match is not None and manifest == {"format": self.fmt, "columns": list(df.columns), **base}:
+            return if_match  # Nothing changed: the manifest is not rewritten
+        return self._write_manifest(file_name, manifest, if_match=if_match, if_none_match=if_none_match)
+
+    def _write_manifest(self, file_name, manifest, if_match=None, if_none_match=False):
+        try:
+            with span("storage.write"):
+                version = self.backend.write(self._manifest_key(file_name), json.dumps(manifest, indent=1).encode("utf-8"),
+                                             "application/json", if_match=if_match, if_none_match=if_none_match)
+        except ConcurrentModificationError:
+            # Make sure the next load sees the manifest that won
+            self.invalidate(file_name)
+            raise
+        # The manifest just written is the freshest one: no need to download it again
+        self._remember(file_name, manifest, version)
+        return version
+
+    def save(self, df, file_name, if_match=None, if_none_match=False):
+        """
+        Replace the hot set of a reservation grid with a DataFrame.
+
+        Parameters:
+        - df (pandas.DataFrame): The DataFrame to save.
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - if_match (str, optional): Only save if the grid is still at this version.
+        - if_none_match (bool, optional): Only save if the grid does not exist yet. Defaults to False.
+
+        Returns:
+        - str: The version of the grid.
+
+        Raises:
+        - ConcurrentModificationError: If a condition is given and the grid changed or exists.
+
+        Notes:
+        Only the months whose content changed are written. Archived months stay archived:
+        they are replaced if `df` holds rows for them, and kept as they are otherwise.
+        """
+        return self._commit(file_name, df, if_match=if_match, if_none_match=if_none_match)
+
+    def update_range(self, file_name, start_date, end_date, mutate, retries=UPDATE_RETRIES):
+        """
+        Apply a modification to the months overlapping a date range, without overwriting concurrent changes.
+
+        Same as `update`, but only those months are loaded, modified and written: `mutate` receives their rows.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the modified range.
+        - end_date (datetime.date): Last day of the modified range (included).
+        - mutate (callable): Receives the DataFrame and modifies it in place, without adding nor removing rows.
+          Its return value is returned by `update_range`. Any exception it raises aborts the update without saving.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - The value returned by `mutate` for the attempt that was saved.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        for attempt in range(retries + 1):
+            df, version = self.load_range(file_name, start_date, end_date)
+            result = mutate(df)
+            try:
+                self._commit(file_name, df, if_match=version, replace=False)
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+                continue
+            return result
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the update was not saved.")
+
+    def extend(self, file_name, rows, retries=UPDATE_RETRIES):
+        """
+        Add calendar rows to a reservation grid. Only the months of the new rows are loaded and written.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - rows (pandas.DataFrame): The rows to add. The (date, slot) rows already in the grid are left as they are.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - (int, str): The number of rows added, and the version of the grid.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        if rows.empty:
+            return 0, self._manifest(file_name)[1]
+        for attempt in range(retries + 1):
+            df, version = self.load_range(file_name, rows['Date'].min(), rows['Date'].max())
+            added = missing_rows(df, rows)
+            if added.empty:
+                return 0, version
+            try:
+                return len(added), self._commit(file_name, append_rows(df, added), if_match=version, replace=False)
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the rows were not saved.")
+
+    def truncate(self, file_name, before_date, archive=None, retries=UPDATE_RETRIES):
+        """
+        Remove the months before a date from a reservation grid, archived or not.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The months strictly before the month of this date are removed.
+        - archive (callable, optional): Receives the removed rows before the manifest is saved without them.
+          Any exception it raises aborts the removal. It may be called again after a conflict.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - (pandas.DataFrame, str): The removed rows, and the version of the grid.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        limit = month_of(before_date)
+        for attempt in range(retries + 1):
+            self.invalidate(file_name)
+            manifest, version = self._manifest(file_name)
+            stored = self._stored(manifest)
+            months = sorted(month for month in stored if UNDATED < month < limit)
+            removed = self._concat(file_name, manifest, [stored[month] for month in months])
+            if not months:
+                return removed, version
+            if archive is not None:
+                archive(removed)
+            kept = dict(manifest,
+                        partitions={month: key for month, key in manifest["partitions"].items() if month not in months},
+                        archive={month: key for month, key in manifest["archive"].items() if month not in months})
+            try:
+                return removed, self._write_manifest(file_name, kept, if_match=version)
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the months were not removed.")
+
+    def invalidate(self, file_name):
+        """
+        Drop the cached manifest of a reservation grid so the next load downloads it.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self._manifests.pop(file_name, None)
+
+    def migrate(self, file_name, overwrite=True):
+        """
+        Split a reservation file into monthly partitions.
+
+        The single file of FrameStore is used if it exists, the legacy workbook otherwise.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - overwrite (bool, optional): Replace the partitions if the grid is already partitioned. Defaults to True.
+
+        Returns:
+        - pandas.DataFrame: The migrated data.
+
+        Raises:
+        - FileNotFoundError: If neither the single file nor the legacy file exist.
+        """
+        try:
+            data, _ = self.backend.read(storage_key(file_name, self.fmt))
+            df = deserialize_frame(data, self.fmt)
+        except FileNotFoundError:
+            if not self.legacy_fmt or self.legacy_fmt == self.fmt:
+                raise
+            data, _ = self.backend.read(storage_key(file_name, self.legacy_fmt))
+            df = deserialize_frame(data, self.legacy_fmt)
+        # Some historical workbooks store the dates as text
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        try:
+            self.save(df, file_name, if_none_match=not overwrite)
+        except ConcurrentModificationError:
+            pass  # Already migrated by someone else
+        return df
+
+    def archive(self, file_name, before_date, retries=UPDATE_RETRIES):
+        """
+        Move the months before a date out of the hot set.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The months strictly before the month of this date are archived.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - ([str], str): The archived months, and the version of the grid.
+
+        Raises:
+        - ConcurrentModificationError: If the grid kept changing during every attempt.
+
+        Notes:
+        Only the manifest is rewritten: the archived partitions keep their files, and stay readable with `load_range`.
+        """
+        limit = month_of(before_date)
+        for attempt in range(retries + 1):
+            self.invalidate(file_name)
+            manifest, version = self._manifest(file_name)
+            moved = sorted(month for month in manifest["partitions"] if month < limit)
+            if not moved:
+                return [], version
+            archived = dict(manifest,
+                            partitions={month: key for month, key in manifest["partitions"].items() if month >= limit},
+                            archive={**manifest["archive"], **{month: manifest["partitions"][month] for month in moved}})
+            try:
+                return moved, self._write_manifest(file_name, archived, if_match=version)
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the months were not archived.")
+
+    def months(self, file_name):
+        """
+        List the partitions of a reservation grid.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - ([str], [str]): The months of the hot set and the archived months, as "YYYY-MM".
+        """
+        manifest, _ = self._manifest(file_name)
+        return sorted(manifest["partitions"]), sorted(manifest["archive"])
+
+
+#####################################################################
+# ========================== ARCHIVE CLI ========================== #
+#####################################################################
+
+def main():
+    """
+    Split the grids of a folder or an S3 bucket into monthly partitions, and archive the past months.
+
+    Usage:
+    python flex_partitions.py FlexAqua.xlsx FlexSerre.xlsx FlexIMA.xlsx --folder flexoffice
+    python flex_partitions.py FlexAqua.xlsx --bucket bucketflexoffice --archive-before 2026-10-01
+    """
+    from flex_events import EventLogStore
+
+    parser = argparse.ArgumentParser(description="Partition the flex office grids by month and archive the past months.")
+    parser.add_argument("files", nargs="+", help="Names of the grids, as declared in the flex configuration")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the grids")
+    location.add_argument("--bucket", help="S3 bucket holding the grids")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=[f for f in FORMATS if f != LEGACY_FORMAT])
+    parser.add_argument("--archive-before", type=datetime.date.fromisoformat, default=datetime.date.today(),
+                        help="Archive the months before the month of this date (YYYY-MM-DD). Defaults to today")
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    # Archiving goes through the event log, which keeps its watermark in step with the new manifest
+    store = EventLogStore(PartitionedFrameStore(backend, fmt=args.format))
+    for file_name in args.files:
+        archived = store.archive(file_name, args.archive_before)
+        hot, _ = store.snapshots.months(file_name)
+        print(f"{file_name}: {len(archived)} month(s) archived, hot set {hot[0] if hot else '-'} to {hot[-1] if hot else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+import json
+import os
+import random
+import time
+import uuid
+
+import numpy as np
+
+from flex_grid import ReservationError
+from flex_metrics import span
+from flex_storage import RETRY_BACKOFF_SECONDS, UPDATE_RETRIES, ConcurrentModificationError
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Days of the week a rule can repeat on, Monday = 0 as in datetime.date.weekday
+WEEKDAYS = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi")
+
+RULES_CONTENT_TYPE = "application/json"
+
+# Number of unavailable cells listed in the message of a refused rule, the others are counted
+MAX_LISTED_CONFLICTS = 10
+
+
+#####################################################################
+# ============================= RULES ============================= #
+#####################################################################
+
+def make_rule(office, weekdays, period, start_date, end_date, name, exceptions=()):
+    """
+    Build a recurring reservation rule: an office reserved on some days of every week of a period.
+
+    Parameters:
+    - office (str): The office reserved.
+    - weekdays ([int]): The days of the week, Monday = 0 to Friday = 4.
+    - period (str): 'Matin', 'Après-midi' or 'Journée'.
+    - start_date (datetime.date): First day of the rule.
+    - end_date (datetime.date): Last day of the rule (included).
+    - name (str): The name under which the reservations are made.
+    - exceptions ([datetime.date], optional): Days of the period without reservation. Defaults to none.
+
+    Returns:
+    - dict: The rule, as stored: {"id", "office", "weekdays", "period", "start", "end", "name", "exceptions",
+      "until"}, with the dates as YYYY-MM-DD. "until" is the last day already reserved, None before the first
+      materialization.
+
+    Raises:
+    - ReservationError: If the days of the week, the dates or the name are not valid.
+    """
+    try:
+        weekdays = sorted(set(int(day) for day in weekdays))
+    except (TypeError, ValueError):
+        weekdays = []
+    if not weekdays or not all(0 <= day < len(WEEKDAYS) for day in weekdays):
+        raise ReservationError("Veuillez choisir au moins un jour de la semaine, du lundi au vendredi.")
+    if end_date < start_date:
+        raise ReservationError("La date de fin doit suivre la date de début.")
+    if not name:
+        raise ReservationError("Veuillez entrer votre nom pour effectuer une réservation.")
+    return {
+        "id": uuid.uuid4().hex[:12],
+        "office": office,
+        "weekdays": weekdays,
+        "period": period,
+        "start": start_date.isoformat(),
+        "end": end_date.isoformat(),
+        "name": name,
+        "exceptions": sorted({day.isoformat() for day in exceptions}),
+        "until": None,
+    }
+
+def expand_rule(rule, index, start_date=None, end_date=None):
+    """
+    Expand a rule into the cells of a grid, and find those that are not available, in one pass.
+
+    Parameters:
+    - rule (dict): A rule built by `make_rule`.
+    - index (AvailabilityIndex): The availability index of a grid covering the dates.
+    - start_date (datetime.date, optional): First day expanded, within the rule. Defaults to the start of the rule.
+    - end_date (datetime.date, optional): Last day expanded, within the rule. Defaults to the end of the rule.
+
+    Returns:
+    - ([(datetime.date, str, str)], [(datetime.date, str, str)]): The (date, slot, office) cells of the rule
+      that are in the grid, in date order, and those of them that are not available.
+
+    Notes:
+    Only the business-day slots of the grid are expanded: the public holidays and closures have no rows.
+    The days of the week and the exceptions are selected on the date array of the index, without a loop.
+    """
+    first = max(start_date or datetime.date.min, datetime.date.fromisoformat(rule["start"]))
+    last = min(end_date or datetime.date.max, datetime.date.fromisoformat(rule["end"]))
+    if first > last or rule["office"] not in index.offices:
+        return [], []
+    rows = index.rows_between(first, last, rule["period"])
+    days = index.days[rows]
+    # Day 0 of datetime64 is Thursday 1970-01-01
+    keep = np.isin((days.astype('int64') + 3) % 7, rule["weekdays"])
+    keep &= ~np.isin(days, np.array(rule["exceptions"], dtype='datetime64[D]'))
+    rows = rows[keep]
+    cells = [(day, slot, rule["office"]) for day, slot in zip(index.days[rows].tolist(), index.slots[rows].tolist())]
+    free = index.free_matrix(rows, [rule["office"]])[:, 0]
+    return cells, [cell for cell, is_free in zip(cells, free) if not is_free]
+
+def conflict_message(conflicts):
+    """
+    Describe the unavailable cells of a rule in a French message, listing the first MAX_LISTED_CONFLICTS.
+    """
+    details = ", ".join(f"{office} ({slot} le {date.strftime('%d/%m/%Y')})"
+                        for date, slot, office in conflicts[:MAX_LISTED_CONFLICTS])
+    if len(conflicts) > MAX_LISTED_CONFLICTS:
+        details += f" et {len(conflicts) - MAX_LISTED_CONFLICTS} autre(s)"
+    return f"Les bureaux suivants ne sont pas disponibles : {details}."
+
+
+#####################################################################
+# =========================== RULE STORE ========================== #
+#####################################################################
+
+class RuleStore:
+    """
+    Recurring reservation rules, one small JSON document per flex office.
+
+    A rule takes a few hundred bytes whatever its length, where its reservations are hundreds of cells:
+    the cells are reserved from the rule, in one write per materialization (see BookingService.add_rule
+    and BookingService.materialize_rules).
+
+    Parameters:
+    - backend (StorageBackend): Where the rules are stored, as "recurring/<name>.json".
+
+    Notes:
+    The documents are modified with a conditional write on the version they were read at, retried on conflict.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _key(self, file_name):
+        return f"recurring/{os.path.splitext(file_name)[0]}.json"
+
+    def _read(self, file_name):
+        try:
+            with span("storage.read"):
+                data, version = self.backend.read(self._key(file_name))
+        except FileNotFoundError:
+            return [], None
+        return json.loads(data)["rules"], version
+
+    def load(self, file_name):
+        """
+        Return the rules of a flex office.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - [dict]: The rules, in the order they were added.
+        """
+        return self._read(file_name)[0]
+
+    def update(self, file_name, mutate, retries=UPDATE_RETRIES):
+        """
+        Modify the rules of a flex office with a conditional write.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - mutate (callable): Receives the list of rules, modifies it in place, and returns a value.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - The value returned by `mutate` for the attempt that was written.
+
+        Raises:
+        - ConcurrentModificationError: If the rules kept changing during every attempt.
+        """
+        key = self._key(file_name)
+        for attempt in range(retries + 1):
+            rules, version = self._read(file_name)
+            result = mutate(rules)
+            data = json.dumps({"rules": rules}, ensure_ascii=False).encode("utf-8")
+            try:
+                with span("storage.write"):
+                    self.backend.write(key, data, RULES_CONTENT_TYPE, if_match=version, if_none_match=version is None)
+                return result
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        raise ConcurrentModificationError(f"File {key} kept changing, the rules were not saved.")
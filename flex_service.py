@@ -0,0 +1,893 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import concurrent.futures
+import datetime
+import functools
+import threading
+import time
+
+import pandas as pd
+
+from flex_analytics import ARCHIVED_YEARS, REPORTS, occupancy_report, within
+from flex_calendar import HORIZON_DAYS, KEEP_PAST_MONTHS, roll_calendar
+from flex_events import EventLogStore, fold_events
+from flex_grid import (FULL_DAY, SLOTS, ReservationError, availability_index, book_cells, book_slots, concat_grids,
+                       release_cells, release_slots, shared_copy, slots_for)
+from flex_journal import JournalStore
+from flex_metrics import LOGGER, REGISTRY, span
+from flex_partitions import PartitionedFrameStore, month_bounds
+from flex_recurring import conflict_message, expand_rule, make_rule
+from flex_sites import DEFAULT_SITE, bundled_config
+from flex_sqlite import SQLiteStore
+from flex_storage import CACHE_TTL_SECONDS, DEFAULT_FORMAT, ConcurrentModificationError, FrameStore
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Configuration of the flex offices of the default site, shipped in sites/principal.json. The other sites,
+# and the configuration edited without a release, are read from the config store (see flex_sites.SiteDirectory)
+FLEX_CONFIG = bundled_config(DEFAULT_SITE)
+
+# "events": append-only reservation log, "snapshot": whole-file rewrites, "sqlite": local database
+ENGINES = ("events", "snapshot", "sqlite")
+DEFAULT_ENGINE = "events"
+
+# "monthly": one file per month listed in a manifest, "single": one file per flex office
+LAYOUTS = ("monthly", "single")
+DEFAULT_LAYOUT = "monthly"
+
+OPERATIONS_METRIC = "flex_operations_total"
+
+# Number of seconds the version of a flex office is trusted before the store is asked again: the pages
+# polling for changes cost the same storage requests whatever the number of sessions
+VERSION_TTL_SECONDS = CACHE_TTL_SECONDS
+
+# Number of flex offices loaded at the same time by the searches across the flex offices (see `search_pool`)
+SEARCH_WORKERS = 8
+
+
+#####################################################################
+# ============================= STORE ============================= #
+#####################################################################
+
+def make_store(backend, fmt=DEFAULT_FORMAT, engine=DEFAULT_ENGINE, sqlite_path=None, layout=DEFAULT_LAYOUT,
+               journal_path=None):
+    """
+    Build the reservation store of a storage backend.
+
+    Parameters:
+    - backend (StorageBackend): Where the reservation files are stored.
+    - fmt (str, optional): Format of the stored files. Defaults to DEFAULT_FORMAT.
+    - engine (str, optional): One of ENGINES. Defaults to DEFAULT_ENGINE.
+    - sqlite_path (str, optional): Path of the database of the "sqlite" engine, seeded from the backend.
+    - layout (str, optional): One of LAYOUTS, how the grids (or the snapshots of the "events" engine) are split
+      into files. Defaults to DEFAULT_LAYOUT.
+    - journal_path (str, optional): Local journal of the write-behind mode: the modifications are acknowledged
+      once recorded there, and uploaded in the background (see JournalStore). Written through if None.
+
+    Returns:
+    - FrameStore, EventLogStore, SQLiteStore or JournalStore: The store reading and writing the reservations.
+
+    Raises:
+    - ValueError: If the engine or the layout is unknown, if the "sqlite" engine has no database path,
+      or if it is given a journal.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown storage engine {engine!r}, expected one of {', '.join(ENGINES)}.")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown storage layout {layout!r}, expected one of {', '.join(LAYOUTS)}.")
+    store = PartitionedFrameStore(backend, fmt=fmt) if layout == "monthly" else FrameStore(backend, fmt=fmt)
+    if engine == "events":
+        store = EventLogStore(store)
+    elif engine == "sqlite":
+        if not sqlite_path:
+            raise ValueError("The sqlite engine needs the path of its database.")
+        store = SQLiteStore(sqlite_path, seed=store)
+    if journal_path:
+        if engine == "sqlite":
+            raise ValueError("The sqlite engine writes to a local database already, it takes no journal.")
+        store = JournalStore(store, journal_path)
+    return store
+
+
+#####################################################################
+# ============================ SERVICE ============================ #
+#####################################################################
+
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+def search_pool():
+    """
+    Return the thread pool loading the flex offices of a search, created on first use and shared by every search.
+
+    Returns:
+    - concurrent.futures.ThreadPoolExecutor: A pool of SEARCH_WORKERS threads.
+
+    Notes:
+    The loads run on their own pool, not on flex_storage.io_pool: they submit their transfers to it, and
+    waiting for them from the threads of the same pool could deadlock it.
+    """
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS,
+                                                                 thread_name_prefix="flex-search")
+        return _search_pool
+
+def instrumented(operation):
+    """
+    Decorator timing a service operation and counting its outcomes ("ok", "refused", "conflict" or "error").
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            outcome = "ok"
+            try:
+                with span(f"service.{operation}"):
+                    return method(*args, **kwargs)
+            except ReservationError:
+                outcome = "refused"
+                raise
+            except ConcurrentModificationError:
+                outcome = "conflict"
+                raise
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                REGISTRY.inc(OPERATIONS_METRIC, operation=operation, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+class BookingService:
+    """
+    Reservation operations of the flex offices, independent of the user interface.
+
+    The Streamlit pages, the HTTP API and the scripts all go through this class, so a booking has
+    the same checks and the same concurrency guarantees whatever the client.
+
+    Parameters:
+    - store (FrameStore, EventLogStore or SQLiteStore): The reservation store (see `make_store`).
+    - config (dict, optional): Configuration of the flex offices. Defaults to FLEX_CONFIG.
+    - archive (ArchiveStore, optional): Where `roll_calendar` moves the past months. They stay in the grids if None.
+    - namespace (str, optional): Prefix of the file names in the data keys of the grids, e.g. the site, so the
+      tables memoized for the files of two sites with the same name never mix. Defaults to none.
+    - rules (RuleStore, optional): Where the recurring reservation rules are kept. No recurring reservations if None.
+    - waitlist (Waitlist, optional): The queues of the people waiting for a reserved office, served by `cancel`.
+      No waitlists if None.
+
+    Notes:
+    Every method is synchronous and thread-safe: it can be called from several Streamlit sessions
+    or from the worker threads of the HTTP server at the same time. Errors meant for the user are
+    raised as ReservationError, with a French message.
+    The clients keeping a grid follow the changes with `version` and `refresh`: the version is shared
+    by the sessions of the process, and the modifications made through the service are seen at once.
+    """
+
+    def __init__(self, store, config=FLEX_CONFIG, archive=None, namespace="", rules=None, waitlist=None):
+        self.store = store
+        self.config = config
+        self.archive = archive
+        self.namespace = namespace
+        self.rules = rules
+        self.waitlist = waitlist
+        self._versions = {}  # flex -> [version, last check (monotonic time)]
+        self._lock = threading.Lock()
+
+    def _file(self, flex):
+        if flex not in self.config:
+            raise ReservationError(f"Le flex office {flex} n'existe pas.")
+        return self.config[flex]["excel"]
+
+    def _check_office(self, flex, office):
+        if office not in self.offices(flex):
+            raise ReservationError(f"Le bureau {office} n'existe pas dans le flex office {flex}.")
+
+    def _check_period(self, period):
+        if period != FULL_DAY and period not in SLOTS:
+            raise ReservationError(f"Le créneau {period} n'existe pas.")
+
+    def flexes(self):
+        """
+        Return the names of the flex offices.
+        """
+        return list(self.config)
+
+    def offices(self, flex):
+        """
+        Return the offices of a flex office.
+        """
+        self._file(flex)
+        return list(self.config[flex]["offices"])
+
+    @instrumented("load")
+    def load(self, flex, start_date=None, end_date=None):
+        """
+        Load the reservation grid of a flex office, or only the part of it needed for a date range.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - start_date (datetime.date, optional): First day needed. The whole hot set is loaded if None.
+        - end_date (datetime.date, optional): Last day needed (included). Defaults to `start_date`.
+
+        Returns:
+        - pandas.DataFrame: The grid, or the rows of the whole months overlapping the range (the whole grid
+          with the "single" layout). The file name, data version and loaded months are kept in
+          `df.attrs['data_key']` to memoize what is derived from the data (rendered tables, availability index).
+        """
+        file_name = self._file(flex)
+        if start_date is None:
+            df, version = self.store.load_versioned(file_name)
+            df.attrs['data_key'] = (self.namespace + file_name, version)
+            return df
+        first_day, last_day = month_bounds(start_date, end_date or start_date)
+        df, version = self.store.load_range(file_name, first_day, last_day)
+        df.attrs['data_key'] = (self.namespace + file_name, version, first_day, last_day)
+        return df
+
+    def _changed(self, flex):
+        # The next `version` asks the store, so every session of the process sees the modification at once
+        with self._lock:
+            self._versions.pop(flex, None)
+
+    def version(self, flex):
+        """
+        Return the current version of the reservation data of a flex office, without loading it.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+
+        Returns:
+        - str: The version of the data, as in `df.attrs['data_key']` of the grids returned by `load`.
+
+        Notes:
+        The version is checked with the store at most once per VERSION_TTL_SECONDS for all the sessions,
+        so polling it is cheap. A modification made through this service is seen at once.
+        """
+        file_name = self._file(flex)
+        with self._lock:
+            entry = self._versions.get(flex)
+        if entry is not None and time.monotonic() - entry[1] < VERSION_TTL_SECONDS:
+            return entry[0]
+        version = self.store.version(file_name)
+        with self._lock:
+            self._versions[flex] = [version, time.monotonic()]
+        return version
+
+    @instrumented("changes")
+    def changes(self, flex, since):
+        """
+        Return the reservations and cancellations made in a flex office since a version of its data.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - since (str): A version returned by `version`, or the one of a grid returned by `load`.
+
+        Returns:
+        - ([dict] or None, str): The events since that version, oldest first ("timestamp", "action" ('book' or
+          'cancel'), "office", "date" as YYYY-MM-DD, "slot", "name"), and the current version. The events are
+          None when they are not known (e.g., "snapshot" engine, new calendar days, archived months): the
+          data must be loaded again.
+        """
+        if since == self.version(flex):
+            return [], since
+        events, version = self.store.changes(self._file(flex), since)
+        with self._lock:
+            self._versions[flex] = [version, time.monotonic()]
+        return events, version
+
+    @instrumented("refresh")
+    def refresh(self, flex, df):
+        """
+        Bring a grid returned by `load` up to date, applying only the modifications made since its version.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - df (pandas.DataFrame): A grid returned by `load` (or `refresh`) for this flex office. It is not modified.
+
+        Returns:
+        - pandas.DataFrame: `df` itself if the data did not change, otherwise the updated grid, with the same
+          rows and the new version in `df.attrs['data_key']`.
+
+        Notes:
+        The events since the version of the grid are folded into a copy of it (see `shared_copy`): with
+        copy-on-write, only the columns of the modified offices are copied. When they are not known, the same months are loaded again.
+        """
+        data_file, version, *months = df.attrs['data_key']
+        events, current = self.changes(flex, version)
+        if events is None:
+            return self.load(flex, *months)
+        if current == version:
+            return df
+        df = fold_events(shared_copy(df), events)
+        df.attrs['data_key'] = (data_file, current, *months)
+        return df
+
+    @instrumented("book")
+    def book(self, flex, office, date, period, name):
+        """
+        Reserve an office for every slot of a period, if it is available for all of them.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office to reserve.
+        - date (datetime.date): The day of the reservation.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+        - name (str): The name under which the reservation is made.
+
+        Returns:
+        None
+
+        Raises:
+        - ReservationError: If the office is not available for one of the slots. Nothing is reserved in that case.
+        - ConcurrentModificationError: If the file kept changing during every attempt.
+        """
+        file_name = self._file(flex)
+        self._check_office(flex, office)
+        self._check_period(period)
+        if not name:
+            raise ReservationError("Veuillez entrer votre nom pour effectuer une réservation.")
+        if isinstance(self.store, SQLiteStore):
+            # The availability check and the reservation are a single indexed transaction
+            self.store.book_slots(file_name, date, period, office, name)
+        else:
+            # If someone else saved the file in the meantime, the check is done again on their version
+            self.store.update_range(file_name, date, date, lambda df: book_slots(df, date, period, office, name))
+        self._changed(flex)
+
+    @instrumented("book_cells")
+    def book_cells(self, flex, cells, name, partial=False):
+        """
+        Reserve a batch of cells at once, all or nothing.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - cells ([(datetime.date, str, str)]): The (date, slot, office) cells to reserve.
+        - name (str): The name under which the reservations are made.
+        - partial (bool, optional): Reserve the available cells and return the others instead of raising.
+          Defaults to False.
+
+        Returns:
+        - [(datetime.date, str, str)]: With `partial`, the cells that could not be reserved.
+
+        Raises:
+        - ReservationError: Listing every requested cell that is not available. Nothing is reserved in that case.
+        - ConcurrentModificationError: If the file kept changing during every attempt.
+        """
+        file_name = self._file(flex)
+        for _, slot, office in cells:
+            self._check_office(flex, office)
+            self._check_period(slot)
+        if not name:
+            raise ReservationError("Veuillez entrer votre nom pour effectuer une réservation.")
+        conflicts = []
+        if isinstance(self.store, SQLiteStore):
+            conflicts = self.store.book_cells(file_name, cells, name, partial)
+        elif cells:
+            dates = [date for date, _, _ in cells]
+            conflicts = self.store.update_range(file_name, min(dates), max(dates),
+                                                lambda df: book_cells(df, cells, name, partial))
+        self._changed(flex)
+        return conflicts
+
+    @instrumented("cancel")
+    def cancel(self, flex, office, date, period):
+        """
+        Cancel the reservations of an office for every slot of a period.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office whose reservation is canceled.
+        - date (datetime.date): The day of the reservation to cancel.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+
+        Returns:
+        - ([str], {str: str}): The slots that were reserved and are now released, and slot -> name of the
+          released slots given to the first person of their waitlist. The other released slots are available.
+
+        Raises:
+        - ReservationError: If the date is not in the grid.
+        - ConcurrentModificationError: If the file kept changing during every attempt.
+
+        Notes:
+        A released slot with a waitlist is reserved for the first person waiting in the same write as the
+        cancellation (the same event batch, or the same SQLite transaction), so nobody else can take it in
+        between. That person is taken out of the queue before the write (see Waitlist.claim), so leaving the
+        queue at the same moment either comes first or finds nothing; the people claimed for slots that were
+        not reserved, or when the write fails, are put back at their place. Their notification is then added
+        to the outbox of the waitlist.
+        """
+        file_name = self._file(flex)
+        self._check_office(flex, office)
+        self._check_period(period)
+        claimed = self.waitlist.claim(flex, office, date, slots_for(period)) if self.waitlist else {}
+        reassign = {slot: waiter[1] for slot, waiter in claimed.items()}
+        try:
+            if isinstance(self.store, SQLiteStore):
+                released = self.store.release_slots(file_name, date, period, office, reassign)
+            else:
+                def release_and_reassign(df):
+                    released = release_slots(df, date, period, office)
+                    for slot in released:
+                        if slot in reassign:
+                            book_cells(df, [(date, slot, office)], reassign[slot])
+                    return released
+
+                released = self.store.update_range(file_name, date, date, release_and_reassign)
+        except BaseException:
+            if self.waitlist:
+                self.waitlist.restore(flex, office, date, claimed)
+            raise
+        waiters = {slot: waiter for slot, waiter in claimed.items() if slot in released}
+        if self.waitlist:
+            self.waitlist.restore(flex, office, date,
+                                  {slot: waiter for slot, waiter in claimed.items() if slot not in released})
+            self.waitlist.assigned(flex, office, date, waiters)
+        self._changed(flex)
+        return released, {slot: waiter[1] for slot, waiter in waiters.items()}
+
+    def _waitlist(self):
+        if self.waitlist is None:
+            raise ReservationError("Les listes d'attente ne sont pas disponibles.")
+        return self.waitlist
+
+    @instrumented("wait")
+    def join_waitlist(self, flex, office, date, period, name, contact=None):
+        """
+        Queue for the slots of a period where an office is reserved by someone else.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office waited for.
+        - date (datetime.date): The day.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+        - name (str): The name under which the reservation will be made.
+        - contact (str, optional): Where to send the notification (e.g., an e-mail address). Defaults to none.
+
+        Returns:
+        - {str: int}: The position in the queue of each reserved slot of the period, starting at 1.
+
+        Raises:
+        - ReservationError: If the date is not in the grid, or if the office is available (or reserved under
+          `name`) for every slot of the period: it is booked directly in that case.
+        """
+        self._file(flex)
+        self._check_office(flex, office)
+        self._check_period(period)
+        waitlist = self._waitlist()
+        if not name:
+            raise ReservationError("Veuillez entrer votre nom pour effectuer une réservation.")
+        df = self.load(flex, date)
+        index = availability_index(df)
+        rows = [index.row(date, slot) for slot in slots_for(period)]
+        if any(row is None for row in rows):
+            raise ReservationError("Aucune réservation ne correspond à vos critères de sélection.")
+        holders = df[office].to_numpy()[index.positions[rows]]
+        slots = [slot for slot, holder in zip(slots_for(period), holders)
+                 if not index.is_free(date, slot, office) and holder != name]
+        if not slots:
+            raise ReservationError(f"Le bureau {office} n'est pas réservé par quelqu'un d'autre : "
+                                   "réservez-le directement.")
+        return waitlist.join(flex, office, date, slots, name, contact)
+
+    @instrumented("leave")
+    def leave_waitlist(self, flex, office, date, period, name):
+        """
+        Leave the queues of the slots of a period of an office.
+
+        Returns:
+        - [str]: The slots whose queue was left.
+        """
+        self._file(flex)
+        self._check_office(flex, office)
+        self._check_period(period)
+        return self._waitlist().leave(flex, office, date, slots_for(period), name)
+
+    def free_offices(self, flex, date, period=FULL_DAY):
+        """
+        Return the offices available for every slot of a period on a given date.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - date (datetime.date): The day to check.
+        - period (str, optional): 'Matin', 'Après-midi' or 'Journée'. Defaults to 'Journée'.
+
+        Returns:
+        - [str]: The available offices, in the order of the grid.
+        """
+        return availability_index(self.load(flex, date)).free_offices(date, period)
+
+    @instrumented("availability")
+    def availability(self, flex, start_date, end_date, period=FULL_DAY):
+        """
+        Return the availability of every office for the business-day slots of a date range.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date): Last day of the range (included).
+        - period (str, optional): 'Matin', 'Après-midi' or 'Journée' (both slots). Defaults to 'Journée'.
+
+        Returns:
+        - [dict]: One {"date", "slot", "free", "reserved"} entry per slot, in date order: "date" is
+          formatted as YYYY-MM-DD, "free" lists the available offices and "reserved" maps the other
+          offices to the name of the person who reserved them.
+        """
+        self._check_period(period)
+        df = self.load(flex, start_date, end_date)
+        index = availability_index(df)
+        rows = index.rows_between(start_date, end_date, period)
+        names = index.frame(df, rows)[index.offices].to_numpy()
+        return [
+            {
+                "date": str(index.days[row]),
+                "slot": index.slots[row],
+                "free": [office for office, is_free in zip(index.offices, index.free[row]) if is_free],
+                "reserved": {office: name for office, name, is_free in zip(index.offices, line, index.free[row])
+                             if not is_free},
+            }
+            for row, line in zip(rows, names)
+        ]
+
+    @instrumented("search")
+    def search(self, start_date, end_date=None, period=FULL_DAY, flexes=None):
+        """
+        Find the free offices of every flex office for a date range, the most available first.
+
+        Parameters:
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date, optional): Last day of the range (included). Defaults to `start_date`.
+        - period (str, optional): 'Matin', 'Après-midi' or 'Journée' (both slots). Defaults to 'Journée'.
+        - flexes ([str], optional): The flex offices searched. Defaults to all of them.
+
+        Returns:
+        - [dict]: One {"flex", "office", "free_slots", "slots", "whole_period"} entry per office free for at
+          least one slot of the range: "free_slots" counts its free business-day slots out of "slots", and
+          "whole_period" is True when it is free for all of them. The offices free for the whole range come
+          first, then by number of free slots, then in the order of the configuration.
+
+        Notes:
+        The months of the flex offices are loaded concurrently, and each grid is read through its availability
+        index, shared by the sessions until the data changes: a search on cached data costs a few array operations
+        per flex office. The flex offices without a file yet are skipped.
+        """
+        self._check_period(period)
+        end_date = end_date or start_date
+        flexes = list(flexes) if flexes is not None else self.flexes()
+        for flex in flexes:
+            self._file(flex)
+        grids = list(search_pool().map(lambda flex: self._search_grid(flex, start_date, end_date), flexes))
+
+        results = []
+        for flex, df in zip(flexes, grids):
+            if df is None:
+                continue
+            index = availability_index(df)
+            rows = index.rows_between(start_date, end_date, period)
+            if not len(rows):
+                continue
+            free_slots = index.free[rows].sum(axis=0)
+            results.extend(
+                {"flex": flex, "office": office, "free_slots": int(count), "slots": len(rows),
+                 "whole_period": bool(count == len(rows))}
+                for office, count in zip(index.offices, free_slots) if count
+            )
+        # Stable sort: the order of the configuration breaks the ties
+        results.sort(key=lambda result: (not result["whole_period"], -result["free_slots"]))
+        return results
+
+    def _search_grid(self, flex, start_date, end_date):
+        # A flex office without a file yet (e.g. a floor just added, before its calendar rolls) has no free office
+        try:
+            return self.load(flex, start_date, end_date)
+        except FileNotFoundError:
+            return None
+
+    @instrumented("analytics")
+    def analytics(self, flex, start_date=None, end_date=None):
+        """
+        Compute the occupancy statistics of a flex office over its whole history, archived years included.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - start_date (datetime.date, optional): First day counted. Defaults to the first archived day.
+        - end_date (datetime.date, optional): Last day counted (included). Defaults to the last day of the grid.
+
+        Returns:
+        - dict: The report of `flex_analytics.occupancy_report`. It is shared: do not modify it.
+
+        Notes:
+        The reports are memoized per data version and period for all the sessions: until a reservation changes
+        the data, the dashboard costs a version check. The archived years are memoized per version of their file,
+        so a new reservation only reloads the hot set. The late cancellations need the event log of the "events"
+        engine, they are None with the other engines.
+        """
+        file_name = self._file(flex)
+        key = (self.namespace + file_name, self.version(flex), start_date, end_date)
+        report = REPORTS.get(key)
+        if report is not None:
+            return report
+
+        df = self.load(flex)
+        key = (self.namespace + file_name, df.attrs['data_key'][1], start_date, end_date)
+        report = REPORTS.get(key)
+        if report is not None:
+            return report
+        history = concat_grids(self._archived_years(file_name, start_date, end_date) + [df])
+        # A row archived then still in the grid (e.g. during a roll) is counted once, with its current state
+        history = history.drop_duplicates(subset=['Date', 'Créneau'], keep='last')
+        history = history.sort_values('Date', kind='stable', ignore_index=True)
+        history = history[within(history['Date'], start_date, end_date)].reset_index(drop=True)
+
+        events = None
+        if hasattr(self.store, "audit_trail"):
+            events = self.store.audit_trail(file_name)
+            events = events[within(pd.to_datetime(events['date']), start_date, end_date)]
+        offices = [office for office in self.offices(flex) if office in history.columns]
+        report = occupancy_report(history, offices, events)
+        REPORTS.put(key, report)
+        return report
+
+    def _archived_years(self, file_name, start_date, end_date):
+        # The archive files only change when the calendar rolls: their rows are kept per file version
+        if self.archive is None:
+            return []
+        frames = []
+        for year in self.archive.years(file_name):
+            if (start_date is not None and year < start_date.year) or (end_date is not None and year > end_date.year):
+                continue
+            try:
+                version = self.archive.version(file_name, year)
+                key = (self.namespace + file_name, year, version)
+                rows = ARCHIVED_YEARS.get(key)
+                if rows is None:
+                    rows = self.archive.load(file_name, year)
+                    ARCHIVED_YEARS.put(key, rows)
+            except FileNotFoundError:
+                continue
+            frames.append(rows)
+        return frames
+
+    def _rule_store(self):
+        if self.rules is None:
+            raise ReservationError("Les réservations récurrentes ne sont pas disponibles.")
+        return self.rules
+
+    def list_rules(self, flex):
+        """
+        Return the recurring reservation rules of a flex office (see `add_rule`).
+        """
+        file_name = self._file(flex)
+        return self.rules.load(file_name) if self.rules is not None else []
+
+    @instrumented("add_rule")
+    def add_rule(self, flex, office, weekdays, period, start_date, end_date, name, exceptions=(), skip_conflicts=False):
+        """
+        Reserve an office on some days of every week of a period, e.g. every Tuesday and Thursday of the year.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office reserved.
+        - weekdays ([int]): The days of the week, Monday = 0 to Friday = 4.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+        - start_date (datetime.date): First day of the rule.
+        - end_date (datetime.date): Last day of the rule (included).
+        - name (str): The name under which the reservations are made.
+        - exceptions ([datetime.date], optional): Days of the period without reservation. Defaults to none.
+        - skip_conflicts (bool, optional): Reserve the available cells and skip the others instead of refusing
+          the whole rule. Defaults to False.
+
+        Returns:
+        - (dict, int, [(datetime.date, str, str)]): The rule (see `make_rule`), the number of cells reserved,
+          and the cells skipped because they were not available.
+
+        Raises:
+        - ReservationError: If the rule is not valid, or, without `skip_conflicts`, listing the cells that are
+          not available. Nothing is reserved in that case.
+        - ConcurrentModificationError: If the file kept changing during every attempt.
+
+        Notes:
+        The rule is expanded on the days of the grid, up to the horizon of the calendar, and all its cells are
+        checked in one pass and reserved in a single write. The days after the horizon are reserved when the
+        calendar is rolled forward (see `materialize_rules`); an occurrence canceled later stays canceled.
+        The rule is recorded before its reservations, and removed if they cannot be made: a reservation of a
+        rule always has its rule, so `delete_rule` can cancel it.
+        """
+        store = self._rule_store()
+        file_name = self._file(flex)
+        self._check_office(flex, office)
+        self._check_period(period)
+        rule = make_rule(office, weekdays, period, start_date, end_date, name, exceptions)
+
+        index = availability_index(self.load(flex, start_date, end_date))
+        cells, conflicts = expand_rule(rule, index)
+        if conflicts and not skip_conflicts:
+            raise ReservationError(conflict_message(conflicts))
+        def discard(rules):
+            rules[:] = [recorded for recorded in rules if recorded["id"] != rule["id"]]
+
+        store.update(file_name, lambda rules: rules.append(dict(rule)))
+        try:
+            # Checked again on the latest data, in the same write
+            conflicts = self.book_cells(flex, cells, name, partial=skip_conflicts)
+        except Exception:
+            store.update(file_name, discard)
+            raise
+        covered = index.days[-1].item() if len(index.days) else start_date - datetime.timedelta(days=1)
+        rule["until"] = min(end_date, max(covered, start_date - datetime.timedelta(days=1))).isoformat()
+
+        def advance(rules):
+            for recorded in rules:
+                if recorded["id"] == rule["id"]:
+                    recorded["until"] = rule["until"]
+
+        store.update(file_name, advance)
+        return rule, len(cells) - len(conflicts), conflicts
+
+    @instrumented("delete_rule")
+    def delete_rule(self, flex, rule_id, from_date):
+        """
+        Delete a recurring reservation rule, and cancel its reservations from a date.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - rule_id (str): The "id" of the rule.
+        - from_date (datetime.date): First day whose reservations are canceled, e.g. today.
+
+        Returns:
+        - int: The number of cells freed. The cells reserved by someone else are left as they are.
+
+        Raises:
+        - ReservationError: If the rule does not exist.
+        - ConcurrentModificationError: If the file kept changing during every attempt.
+        """
+        store = self._rule_store()
+        file_name = self._file(flex)
+
+        def remove(rules):
+            for position, rule in enumerate(rules):
+                if rule["id"] == rule_id:
+                    return rules.pop(position)
+            raise ReservationError(f"La réservation récurrente {rule_id} n'existe pas.")
+
+        rule = store.update(file_name, remove)
+        # A rule whose reservations were made but not recorded yet (see `add_rule`) has no "until": its whole
+        # period is released, only the cells reserved under its name are freed
+        until = datetime.date.fromisoformat(rule["until"] or rule["end"])
+        if until < from_date:
+            return 0
+        cells, _ = expand_rule(rule, availability_index(self.load(flex, from_date, until)), from_date, until)
+        if not cells:
+            return 0
+        if isinstance(self.store, SQLiteStore):
+            released = self.store.release_cells(file_name, cells, rule["name"])
+        else:
+            released = self.store.update_range(file_name, cells[0][0], cells[-1][0],
+                                               lambda df: release_cells(df, cells, rule["name"]))
+        self._changed(flex)
+        return released
+
+    @instrumented("materialize_rules")
+    def materialize_rules(self, flex, end_date):
+        """
+        Reserve the cells of the recurring rules of a flex office for the days not reserved yet, up to a date.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - end_date (datetime.date): Last day to reserve, e.g. the horizon of the calendar.
+
+        Returns:
+        - {str: [(datetime.date, str, str)]}: The cells skipped because they were not available, per rule id.
+
+        Notes:
+        Each rule remembers the last day it reserved, so only the new days are expanded, and the cells of all
+        the rules are reserved in a single write (one transaction per rule with the "sqlite" engine).
+        """
+        file_name = self._file(flex)
+        if self.rules is None:
+            return {}
+        pending = []
+        for rule in self.rules.load(file_name):
+            first = max(datetime.date.fromisoformat(rule["start"]),
+                        datetime.date.fromisoformat(rule["until"]) + datetime.timedelta(days=1)
+                        if rule["until"] else datetime.date.min)
+            last = min(datetime.date.fromisoformat(rule["end"]), end_date)
+            if first <= last:
+                pending.append((rule, first, last))
+        if not pending:
+            return {}
+
+        index = availability_index(self.load(flex, min(first for _, first, _ in pending),
+                                             max(last for _, _, last in pending)))
+        expanded = [(rule, expand_rule(rule, index, first, last)[0]) for rule, first, last in pending]
+        cells = [cell for _, rule_cells in expanded for cell in rule_cells]
+        if isinstance(self.store, SQLiteStore):
+            skipped = {rule["id"]: self.store.book_cells(file_name, rule_cells, rule["name"], partial=True)
+                       for rule, rule_cells in expanded}
+        elif cells:
+            skipped = self.store.update_range(
+                file_name, min(cell[0] for cell in cells), max(cell[0] for cell in cells),
+                lambda df: {rule["id"]: book_cells(df, rule_cells, rule["name"], partial=True)
+                            for rule, rule_cells in expanded})
+        else:
+            skipped = {}
+        self._changed(flex)
+
+        # The days after the last one of the grid are expanded again once the calendar has rows for them
+        if not len(index.days):
+            return {rule_id: conflicts for rule_id, conflicts in skipped.items() if conflicts}
+        covered = index.days[-1].item()
+        done = {rule["id"]: min(last, covered).isoformat() for rule, _, last in pending}
+
+        def advance(rules):
+            for rule in rules:
+                if rule["id"] in done and (rule["until"] or "") < done[rule["id"]]:
+                    rule["until"] = done[rule["id"]]
+
+        self.rules.update(file_name, advance)
+        return {rule_id: conflicts for rule_id, conflicts in skipped.items() if conflicts}
+
+    @instrumented("roll_calendar")
+    def roll_calendar(self, flex, today, horizon_days=HORIZON_DAYS, keep_past_months=KEEP_PAST_MONTHS):
+        """
+        Add the business days of a flex office up to the horizon and archive its past months.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - today (datetime.date): The current date.
+        - horizon_days (int, optional): Number of days ahead of today covered by the grid. Defaults to HORIZON_DAYS.
+        - keep_past_months (int, optional): Number of past months kept besides the current one. Defaults to KEEP_PAST_MONTHS.
+
+        Returns:
+        - (int, int): The number of rows added and the number of rows archived.
+
+        Notes:
+        The days listed in the "closures" of the configuration of the flex office get no row, like
+        the weekends and the public holidays.
+        """
+        file_name = self._file(flex)
+        rolled = roll_calendar(self.store, file_name, self.offices(flex), today, self.archive,
+                               self.config[flex].get("closures", ()), horizon_days, keep_past_months)
+        self._changed(flex)
+        # The days entering the horizon get the reservations of the recurring rules
+        for rule_id, conflicts in self.materialize_rules(flex, today + datetime.timedelta(days=horizon_days)).items():
+            if conflicts:
+                LOGGER.warning(f"Rule {rule_id} of {flex}: {len(conflicts)} cell(s) not available were skipped")
+        return rolled
+
+    def roll_calendars(self, today):
+        """
+        Roll the calendar of every flex office (see `roll_calendar`).
+
+        Returns:
+        - {str: (int, int)}: The rows added and archived, per flex office.
+        """
+        return {flex: self.roll_calendar(flex, today) for flex in self.flexes()}
+
+
+def parse_date(value):
+    """
+    Parse a date given as text (YYYY-MM-DD), e.g. in a request of the HTTP API.
+
+    Parameters:
+    - value (str or datetime.date): The date to parse.
+
+    Returns:
+    - datetime.date: The parsed date.
+
+    Raises:
+    - ReservationError: If the text is not a valid date.
+    """
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        raise ReservationError(f"La date {value} n'est pas valide (format attendu : AAAA-MM-JJ).") from None
+
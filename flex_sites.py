@@ -0,0 +1,297 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import json
+import os
+import threading
+
+from flex_storage import LocalBackend, PrefixedBackend, S3Backend, make_s3_client
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Folder of the application: the site definitions shipped with it are in its "sites/" subfolder
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Keys of the index of the sites and of the definition of the flex offices of a site, in the config store
+INDEX_KEY = "sites/index.json"
+SITE_KEY = "sites/{site}.json"
+
+# Storage partition of the reservation files of a site whose entry in the index has no "prefix"
+SITE_PREFIX = "sites/{site}/"
+
+# Site of the flex offices defined before the sites existed; its files stay at the root of the bucket
+DEFAULT_SITE = "principal"
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+#####################################################################
+# ========================== DEFINITIONS ========================== #
+#####################################################################
+
+def read_json(backend, key):
+    """
+    Read a JSON document from a backend.
+
+    Parameters:
+    - backend (StorageBackend): Where the document is stored.
+    - key (str): Key of the document.
+
+    Returns:
+    - The parsed document.
+
+    Raises:
+    - FileNotFoundError: If the key does not exist.
+    """
+    data, _ = backend.read(key)
+    return json.loads(data)
+
+def check_site(site, config):
+    """
+    Check the definition of the flex offices of a site.
+
+    Parameters:
+    - site (str): Identifier of the site, for the messages.
+    - config (dict): Flex office name -> {"excel", "offices", and optionally "image", "sidebar_image", "plan", "closures"}.
+
+    Returns:
+    - dict: `config` itself.
+
+    Raises:
+    - ValueError: If a flex office has no file or no office, or if two flex offices share a file.
+    """
+    files = {}
+    for flex, details in config.items():
+        if not details.get("excel") or not details.get("offices"):
+            raise ValueError(f"Flex office {flex} of site {site} needs an \"excel\" file and \"offices\".")
+        if details["excel"] in files:
+            raise ValueError(f"Flex offices {files[details['excel']]} and {flex} of site {site} share the file {details['excel']}.")
+        files[details["excel"]] = flex
+    return config
+
+def bundled_config(site=DEFAULT_SITE):
+    """
+    Return the definition of the flex offices of a site shipped with the application (sites/<site>.json).
+
+    Parameters:
+    - site (str, optional): Identifier of the site. Defaults to DEFAULT_SITE.
+
+    Returns:
+    - dict: Flex office name -> configuration, in the order of the file.
+    """
+    return check_site(site, read_json(LocalBackend(APP_FOLDER), SITE_KEY.format(site=site)))
+
+
+#####################################################################
+# ============================= SITES ============================= #
+#####################################################################
+
+class SiteDirectory:
+    """
+    Index of the sites and definitions of their flex offices, read from a config store.
+
+    The config store holds "sites/index.json", listing the sites ({"sites": {<site>: {"name", "prefix"}}}),
+    and one "sites/<site>.json" per site with its flex offices (same fields as FLEX_CONFIG). Adding a floor
+    or a site is an edit of these documents, not of the code.
+
+    Parameters:
+    - backend (StorageBackend): The config store, which also holds the reservation files (e.g., the S3 bucket).
+    - fallback (StorageBackend, optional): Where the documents are read when the config store has no index.
+      Defaults to the definitions shipped with the application.
+
+    Notes:
+    The index is read once, when the directory is created; the definition of a site is read the first time
+    the site is used, and both are kept until `reload`. The reservation files of each site are stored under its
+    own prefix ("sites/<site>/" unless the index gives another one; "" keeps them at the root, as before the
+    sites existed), so every site has its own files, caches and, with the "sqlite" engine, its own database.
+    """
+
+    def __init__(self, backend, fallback=None):
+        self.backend = backend
+        self.fallback = fallback or LocalBackend(APP_FOLDER)
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        Read the index of the sites again, and forget the definitions and services of the sites.
+
+        Returns:
+        None
+        """
+        try:
+            source, index = self.backend, read_json(self.backend, INDEX_KEY)
+        except FileNotFoundError:
+            source, index = self.fallback, read_json(self.fallback, INDEX_KEY)
+        with self._lock:
+            self._source = source
+            self._index = index["sites"]
+            self._configs = {}
+            self._services = {}
+
+    def sites(self):
+        """
+        Return the sites of the index.
+
+        Returns:
+        - {str: dict}: Site identifier -> {"name", and optionally "prefix"}, in the order of the index.
+        """
+        return dict(self._index)
+
+    def name(self, site):
+        """
+        Return the display name of a site.
+        """
+        return self._entry(site).get("name", site)
+
+    def _entry(self, site):
+        if site not in self._index:
+            raise ValueError(f"Unknown site: {site}")
+        return self._index[site]
+
+    def config(self, site):
+        """
+        Return the flex offices of a site.
+
+        Parameters:
+        - site (str): Identifier of the site.
+
+        Returns:
+        - dict: Flex office name -> configuration (see FLEX_CONFIG).
+
+        Raises:
+        - ValueError: If the site is not in the index or its definition is invalid.
+        - FileNotFoundError: If the definition of the site is missing from the config store.
+        """
+        self._entry(site)
+        with self._lock:
+            config = self._configs.get(site)
+        if config is None:
+            config = check_site(site, read_json(self._source, SITE_KEY.format(site=site)))
+            with self._lock:
+                self._configs[site] = config
+        return config
+
+    def site_backend(self, site):
+        """
+        Return the storage partition of the reservation files of a site.
+
+        Parameters:
+        - site (str): Identifier of the site.
+
+        Returns:
+        - StorageBackend: The config store itself for a site with an empty prefix, a PrefixedBackend otherwise.
+        """
+        prefix = self._entry(site).get("prefix", SITE_PREFIX.format(site=site))
+        return PrefixedBackend(self.backend, prefix) if prefix else self.backend
+
+    def _site_path(self, site, path):
+        # Each site with a prefix gets its own local database next to the default one
+        if not path or self.site_backend(site) is self.backend:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}.{site}{extension}"
+
+    def service(self, site, fmt=None, engine=None, sqlite_path=None, layout=None, waitlist_path=None, journal_path=None):
+        """
+        Return the booking service of a site, created on first use and then shared.
+
+        Parameters:
+        - site (str): Identifier of the site.
+        - fmt, engine, layout (str, optional): Options of `make_store`. Default to its defaults.
+        - sqlite_path (str, optional): Database of the "sqlite" engine. Each site with a prefix gets its own
+          database next to it (e.g., "flexoffice.lyon.db").
+        - waitlist_path (str, optional): Database of the waitlists, one per site as for `sqlite_path`.
+          No waitlists if None.
+        - journal_path (str, optional): Journal of the write-behind mode, one per site as for `sqlite_path`.
+          The modifications are written through if None.
+
+        Returns:
+        - BookingService: The reservation operations on the flex offices of the site.
+        """
+        from flex_calendar import ArchiveStore
+        from flex_recurring import RuleStore
+        from flex_service import DEFAULT_ENGINE, DEFAULT_LAYOUT, BookingService, make_store
+        from flex_storage import DEFAULT_FORMAT
+        from flex_waitlist import Waitlist
+
+        with self._lock:
+            service = self._services.get(site)
+        if service is not None:
+            return service
+        backend = self.site_backend(site)
+        store = make_store(backend, fmt=fmt or DEFAULT_FORMAT, engine=engine or DEFAULT_ENGINE,
+                           sqlite_path=self._site_path(site, sqlite_path), layout=layout or DEFAULT_LAYOUT,
+                           journal_path=self._site_path(site, journal_path))
+        waitlist = Waitlist(self._site_path(site, waitlist_path)) if waitlist_path else None
+        # The site is part of the data keys, so the tables memoized for two sites never mix
+        service = BookingService(store, config=self.config(site), archive=ArchiveStore(backend), namespace=f"{site}/",
+                                 rules=RuleStore(backend), waitlist=waitlist)
+        with self._lock:
+            return self._services.setdefault(site, service)
+
+    def publish(self, folder, sites=None):
+        """
+        Copy the definitions of a local folder to the config store, e.g. after adding a floor.
+
+        Parameters:
+        - folder (str): Folder holding "index.json" and one "<site>.json" per site.
+        - sites ([str], optional): The sites whose definition is copied. Defaults to every site of the index.
+
+        Returns:
+        - [str]: The sites copied. The index is copied after them, then read again.
+
+        Raises:
+        - ValueError: If a definition is invalid. Nothing is copied in that case.
+        """
+        local = LocalBackend(folder)
+        index = read_json(local, "index.json")
+        sites = sites or list(index["sites"])
+        documents = {SITE_KEY.format(site=site): check_site(site, read_json(local, f"{site}.json")) for site in sites}
+        documents[INDEX_KEY] = index
+        for key, document in documents.items():
+            self.backend.write(key, json.dumps(document, ensure_ascii=False, indent=4).encode("utf-8"), JSON_CONTENT_TYPE)
+        self.reload()
+        return sites
+
+
+#####################################################################
+# ============================ SITES CLI ========================== #
+#####################################################################
+
+def main():
+    """
+    List the sites of a config store, or publish the definitions of a local folder to it.
+
+    Usage:
+    python flex_sites.py --bucket bucketflexoffice
+    python flex_sites.py --bucket bucketflexoffice --publish sites
+    """
+    parser = argparse.ArgumentParser(description="List or publish the sites and their flex offices.")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the reservation files")
+    location.add_argument("--bucket", help="S3 bucket holding the reservation files")
+    parser.add_argument("--publish", metavar="FOLDER", help="Copy index.json and the <site>.json files of FOLDER")
+    args = parser.parse_args()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    directory = SiteDirectory(backend)
+    if args.publish:
+        print(f"Published: {', '.join(directory.publish(args.publish))}")
+    for site in directory.sites():
+        flexes = directory.config(site)
+        print(f"{site} ({directory.name(site)}): {len(flexes)} flex office(s), "
+              f"{sum(len(details['offices']) for details in flexes.values())} office(s)")
+
+
+if __name__ == "__main__":
+    main()
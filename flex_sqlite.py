@@ -0,0 +1,562 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from flex_grid import AVAILABLE, RenderCache, ReservationError, encode_grid, shared_copy, slots_for
+from flex_partitions import month_bounds
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of milliseconds a writer waits for the database lock before failing
+BUSY_TIMEOUT_MS = 5000
+
+# Number of grids (flex office, months and version) kept for every session of the process
+GRID_CACHE_SIZE = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calendar (
+    flex TEXT NOT NULL,
+    date TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    PRIMARY KEY (flex, date, slot)
+);
+CREATE TABLE IF NOT EXISTS offices (
+    flex TEXT NOT NULL,
+    office TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (flex, office)
+);
+CREATE TABLE IF NOT EXISTS reservations (
+    flex TEXT NOT NULL,
+    office TEXT NOT NULL,
+    date TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS reservations_cell ON reservations (flex, office, date, slot);
+CREATE INDEX IF NOT EXISTS reservations_day ON reservations (flex, date, slot);
+CREATE TABLE IF NOT EXISTS versions (
+    flex TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    flex TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    office TEXT,
+    date TEXT,
+    slot TEXT,
+    name TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_version ON changes (flex, version);
+CREATE TRIGGER IF NOT EXISTS reservations_book AFTER INSERT ON reservations BEGIN
+    INSERT INTO changes VALUES (NEW.flex, COALESCE((SELECT version FROM versions WHERE flex = NEW.flex), 0) + 1,
+                                'book', NEW.office, NEW.date, NEW.slot, NEW.name, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+END;
+CREATE TRIGGER IF NOT EXISTS reservations_cancel AFTER DELETE ON reservations BEGIN
+    INSERT INTO changes VALUES (OLD.flex, COALESCE((SELECT version FROM versions WHERE flex = OLD.flex), 0) + 1,
+                                'cancel', OLD.office, OLD.date, OLD.slot, OLD.name, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+END;
+"""
+
+# Columns of the change feed returned by `changes`, in the order of the table
+CHANGE_COLUMNS = ("action", "office", "date", "slot", "name", "timestamp")
+
+# Change recorded when the grid is replaced or truncated: the clients load it again
+RESET = "reset"
+
+
+#####################################################################
+# ============================= STORE ============================= #
+#####################################################################
+
+class SQLiteStore:
+    """
+    Reservation store backed by an embedded SQLite database.
+
+    Reservations live in a normalized table with a unique index on (flex, office, date, slot):
+    checking that a cell is available and booking it is a single indexed INSERT, and the
+    database rejects a second reservation of the same cell.
+
+    Parameters:
+    - path (str): Path of the database file. It is created if needed.
+    - seed (FrameStore, optional): Store the grids are imported from the first time they are loaded.
+
+    Notes:
+    Exposes the same `load`, `load_range`, `version`, `changes`, `save`, `update`, `update_range`, `extend`
+    and `truncate` methods as FrameStore, plus `book_slots`, `release_slots` and `free_offices` working directly on
+    the indexed table. A flex office is identified by the name of its file without extension (e.g., "FlexAqua").
+    The grids built from the database are kept for their version and shared by every session of the
+    process: every load hands out a copy (see `shared_copy`), and the grid is only built again after a write.
+
+    A grid is imported from what the `load` of the seed returns, i.e. its current rows only: the months
+    already moved to the archive (ArchiveStore, or the archived partitions of PartitionedFrameStore) never
+    enter the database. The change feed starts at the import, and the older reservations are only read
+    from the archive (e.g. by the occupancy statistics of BookingService).
+    """
+
+    def __init__(self, path, seed=None):
+        self.path = path
+        self.seed = seed
+        self._grids = RenderCache(GRID_CACHE_SIZE)
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads: one per thread (i.e. per Streamlit session)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock at once, so concurrent writers are serialized
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _flex(self, file_name):
+        return os.path.splitext(file_name)[0]
+
+    def _bump_version(self, conn, flex):
+        conn.execute(
+            "INSERT INTO versions (flex, version) VALUES (?, 1) "
+            "ON CONFLICT (flex) DO UPDATE SET version = version + 1", (flex,))
+
+    def _reset_changes(self, conn, flex, keep=False):
+        # The change feed only describes reservations and cancellations: a marker makes the clients load the
+        # grid again, and the older changes (with those of the current transaction) are dropped unless `keep`
+        if not keep:
+            conn.execute("DELETE FROM changes WHERE flex = ?", (flex,))
+        conn.execute("INSERT INTO changes (flex, version, action) "
+                     "SELECT ?, COALESCE(MAX(version), 0) + 1, ? FROM versions WHERE flex = ?", (flex, RESET, flex))
+
+    def _ensure_loaded(self, file_name):
+        flex = self._flex(file_name)
+        conn = self._connection()
+        if conn.execute("SELECT 1 FROM offices WHERE flex = ? LIMIT 1", (flex,)).fetchone():
+            return
+        if self.seed is None:
+            raise FileNotFoundError(f"Flex office {flex} not found in {self.path}.")
+        df = self.seed.load(file_name)
+        with self._transaction() as conn:
+            # Another thread may have imported the grid (and booked on it) while this one was loading the seed
+            if not conn.execute("SELECT 1 FROM offices WHERE flex = ? LIMIT 1", (flex,)).fetchone():
+                self._replace(conn, flex, df)
+
+    def _read_grid(self, conn, flex, window=None):
+        # The version is read before the rows: a write in between makes the grid newer than its version, never older
+        version = conn.execute("SELECT version FROM versions WHERE flex = ?", (flex,)).fetchone()
+        version = str(version[0] if version else 0)
+        key = (flex, month_bounds(*window) if window is not None else None, version)
+        grid = self._grids.get(key)
+        if grid is None:
+            grid = self._build_grid(conn, flex, window)
+            self._grids.put(key, grid)
+        return shared_copy(grid), version
+
+    def _build_grid(self, conn, flex, window=None):
+        # With a (start date, end date) window, only the rows of the whole months covering it are read
+        condition, params = "flex = ?", (flex,)
+        if window is not None:
+            first_day, last_day = month_bounds(*window)
+            condition, params = "flex = ? AND date BETWEEN ? AND ?", (flex, first_day.isoformat(), last_day.isoformat())
+        offices = [row[0] for row in conn.execute(
+            "SELECT office FROM offices WHERE flex = ? ORDER BY position", (flex,))]
+        calendar = pd.read_sql_query(
+            f"SELECT date, slot FROM calendar WHERE {condition} ORDER BY date, slot = 'Après-midi'", conn, params=params)
+        reservations = pd.read_sql_query(
+            f"SELECT office, date, slot, name FROM reservations WHERE {condition}", conn, params=params)
+
+        grid = reservations.pivot(index=['date', 'slot'], columns='office', values='name')
+        grid = grid.reindex(index=pd.MultiIndex.from_frame(calendar), columns=offices).fillna(AVAILABLE)
+        grid = grid.reset_index()
+        grid.columns = ['Date', 'Créneau'] + offices
+        return encode_grid(grid)
+
+    def load_versioned(self, file_name):
+        """
+        Build the reservation grid of a flex office from the database.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - (pandas.DataFrame, str): The grid and its version (incremented on every write).
+        """
+        self._ensure_loaded(file_name)
+        return self._read_grid(self._connection(), self._flex(file_name))
+
+    def load_range(self, file_name, start_date, end_date):
+        """
+        Build the part of the reservation grid of a flex office needed for a date range.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date): Last day of the range (included).
+
+        Returns:
+        - (pandas.DataFrame, str): The rows of the whole months overlapping the range, and the version of the grid.
+        """
+        self._ensure_loaded(file_name)
+        return self._read_grid(self._connection(), self._flex(file_name), (start_date, end_date))
+
+    def load(self, file_name):
+        """
+        Build the reservation grid of a flex office from the database.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - pandas.DataFrame: The grid, with the 'Date', 'Créneau' and office columns.
+        """
+        return self.load_versioned(file_name)[0]
+
+    def version(self, file_name):
+        """
+        Return the current version of the grid of a flex office, without building it.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - str: The version `load_versioned` and `load_range` would return.
+        """
+        self._ensure_loaded(file_name)
+        version = self._connection().execute("SELECT version FROM versions WHERE flex = ?",
+                                             (self._flex(file_name),)).fetchone()
+        return str(version[0] if version else 0)
+
+    def changes(self, file_name, since):
+        """
+        Return the reservations and cancellations made in a flex office since a version of its grid.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - since (str): A version returned by `load_versioned`, `load_range` or `version`.
+
+        Returns:
+        - ([dict] or None, str): The events made since that version, oldest first (same fields as the events
+          of EventLogStore), and the current version. The events are None when the grid was replaced or
+          truncated since then, and must be loaded again.
+
+        Notes:
+        The changes are recorded by triggers on the reservations table, in the transaction of the write.
+        The writes made before the table existed are not recorded: the events are None for the versions
+        older than the first recorded change.
+        """
+        version = self.version(file_name)
+        if since == version:
+            return [], version
+        flex = self._flex(file_name)
+        conn = self._connection()
+        first = conn.execute("SELECT MIN(version) FROM changes WHERE flex = ?", (flex,)).fetchone()[0]
+        if first is None or not since.isdigit() or int(since) < first - 1:
+            return None, version
+        rows = conn.execute(
+            f"SELECT {', '.join(CHANGE_COLUMNS)} FROM changes WHERE flex = ? AND version > ? AND version <= ? "
+            "ORDER BY version, rowid", (flex, int(since), int(version))).fetchall()
+        if any(row[0] == RESET for row in rows):
+            return None, version
+        return [dict(zip(CHANGE_COLUMNS, row)) for row in rows], version
+
+    def save(self, df, file_name):
+        """
+        Replace the calendar and the reservations of a flex office with the content of a grid.
+
+        Parameters:
+        - df (pandas.DataFrame): The grid to store.
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        None
+        """
+        with self._transaction() as conn:
+            self._replace(conn, self._flex(file_name), df)
+
+    def _replace(self, conn, flex, df):
+        offices = [column for column in df.columns if column not in ('Date', 'Créneau')]
+        dates = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+        cells = df[offices].assign(date=dates, slot=df['Créneau']).melt(
+            id_vars=['date', 'slot'], var_name='office', value_name='name')
+        cells = cells[cells['name'] != AVAILABLE]
+
+        for table in ("calendar", "offices", "reservations"):
+            conn.execute(f"DELETE FROM {table} WHERE flex = ?", (flex,))
+        conn.executemany("INSERT INTO offices VALUES (?, ?, ?)",
+                         [(flex, office, i) for i, office in enumerate(offices)])
+        conn.executemany("INSERT INTO calendar VALUES (?, ?, ?)",
+                         [(flex, date, slot) for date, slot in zip(dates, df['Créneau'])])
+        conn.executemany("INSERT INTO reservations VALUES (?, ?, ?, ?, ?)",
+                         [(flex, office, date, slot, name) for date, slot, office, name
+                          in cells[['date', 'slot', 'office', 'name']].itertuples(index=False)])
+        self._reset_changes(conn, flex)
+        self._bump_version(conn, flex)
+
+    def update(self, file_name, mutate, retries=None):
+        """
+        Apply a modification to the grid of a flex office in a single transaction.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - mutate (callable): Receives the DataFrame and modifies it in place. Its return value is
+          returned by `update`. Any exception it raises rolls the transaction back.
+        - retries (int, optional): Unused, the write lock makes concurrent updates wait instead of conflicting.
+
+        Returns:
+        - The value returned by `mutate`.
+        """
+        return self._update(file_name, mutate)
+
+    def update_range(self, file_name, start_date, end_date, mutate, retries=None):
+        """
+        Same as `update`, but `mutate` only receives the rows of the months overlapping a date range.
+        """
+        return self._update(file_name, mutate, (start_date, end_date))
+
+    def _update(self, file_name, mutate, window=None):
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        with self._transaction() as conn:
+            df, _ = self._read_grid(conn, flex, window)
+            before = shared_copy(df)
+            result = mutate(df)
+
+            offices = [column for column in df.columns if column not in ('Date', 'Créneau')]
+            changed = before[offices].to_numpy() != df[offices].to_numpy()
+            dates = df['Date'].dt.strftime('%Y-%m-%d').to_numpy()
+            slots = df['Créneau'].to_numpy()
+            for row, col in zip(*changed.nonzero()):
+                cell = (flex, offices[col], dates[row], slots[row])
+                conn.execute("DELETE FROM reservations WHERE flex = ? AND office = ? AND date = ? AND slot = ?", cell)
+                name = df[offices[col]].iat[row]
+                if name != AVAILABLE:
+                    conn.execute("INSERT INTO reservations VALUES (?, ?, ?, ?, ?)", cell + (name,))
+            if changed.any():
+                self._bump_version(conn, flex)
+        return result
+
+    def extend(self, file_name, rows):
+        """
+        Add calendar rows to a flex office, e.g. the business days of a new period.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - rows (pandas.DataFrame): The rows to add. Only their 'Date' and 'Créneau' columns are used:
+          new days have no reservation. The (date, slot) rows already in the calendar are left as they are.
+
+        Returns:
+        - (int, str): The number of rows added, and the version of the grid.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        dates = pd.to_datetime(rows['Date']).dt.strftime('%Y-%m-%d')
+        with self._transaction() as conn:
+            added = sum(conn.execute("INSERT OR IGNORE INTO calendar VALUES (?, ?, ?)", (flex, date, slot)).rowcount
+                        for date, slot in zip(dates, rows['Créneau']))
+            if added:
+                self._reset_changes(conn, flex, keep=True)
+                self._bump_version(conn, flex)
+            version = conn.execute("SELECT version FROM versions WHERE flex = ?", (flex,)).fetchone()
+        return added, str(version[0] if version else 0)
+
+    def truncate(self, file_name, before_date, archive=None):
+        """
+        Remove the days of the months before a date from a flex office, with their reservations.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The days before the first day of the month of this date are removed.
+        - archive (callable, optional): Receives the removed rows before the transaction is committed.
+          Any exception it raises rolls the transaction back.
+
+        Returns:
+        - (pandas.DataFrame, str): The removed rows, and the version of the grid.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        cutoff = datetime.date(before_date.year, before_date.month, 1)
+        with self._transaction() as conn:
+            first_day = conn.execute("SELECT MIN(date) FROM calendar WHERE flex = ?", (flex,)).fetchone()[0]
+            if first_day is None or first_day >= cutoff.isoformat():
+                removed, version = self._read_grid(conn, flex, (cutoff, cutoff))
+                return removed.iloc[0:0], version
+            removed, _ = self._read_grid(conn, flex, (datetime.date.fromisoformat(first_day),
+                                                      cutoff - datetime.timedelta(days=1)))
+            if archive is not None:
+                archive(removed)
+            for table in ("calendar", "reservations"):
+                conn.execute(f"DELETE FROM {table} WHERE flex = ? AND date < ?", (flex, cutoff.isoformat()))
+            self._reset_changes(conn, flex)
+            self._bump_version(conn, flex)
+            version = conn.execute("SELECT version FROM versions WHERE flex = ?", (flex,)).fetchone()
+        return removed, str(version[0])
+
+    def book_slots(self, file_name, date, period, office, name):
+        """
+        Reserve an office for every slot of a period, as one indexed transaction.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - date (datetime.date): The day of the reservation.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+        - office (str): The office to reserve.
+        - name (str): The name under which the reservation is made.
+
+        Returns:
+        None
+
+        Raises:
+        - ReservationError: If the day is not in the calendar or the office is already reserved for one of the slots.
+          Nothing is reserved in that case.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        day = date.strftime('%Y-%m-%d')
+        with self._transaction() as conn:
+            for slot in slots_for(period):
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO reservations (flex, office, date, slot, name) "
+                    "SELECT flex, ?, date, slot, ? FROM calendar WHERE flex = ? AND date = ? AND slot = ?",
+                    (office, name, flex, day, slot)).rowcount
+                if not inserted:
+                    # Raising rolls back the slots already reserved in this transaction
+                    raise ReservationError(f"Le bureau {office} n'est pas disponible pour {slot} le {date.strftime('%d/%m/%Y')}.")
+            self._bump_version(conn, flex)
+
+    def book_cells(self, file_name, cells, name, partial=False):
+        """
+        Reserve a batch of cells at once, all or nothing, in a single transaction.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - cells ([(datetime.date, str, str)]): The (date, slot, office) cells to reserve.
+        - name (str): The name under which the reservations are made.
+        - partial (bool, optional): Reserve the available cells and return the others instead of raising.
+          The cells already reserved under `name` are left as they are. Defaults to False.
+
+        Returns:
+        - [(datetime.date, str, str)]: With `partial`, the cells that are not in the calendar or not available.
+
+        Raises:
+        - ReservationError: Listing every requested cell that is not available. Nothing is reserved in that case.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        unavailable = []
+        booked = 0
+        with self._transaction() as conn:
+            for date, slot, office in cells:
+                day = date.strftime('%Y-%m-%d')
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO reservations (flex, office, date, slot, name) "
+                    "SELECT flex, ?, date, slot, ? FROM calendar WHERE flex = ? AND date = ? AND slot = ?",
+                    (office, name, flex, day, slot)).rowcount
+                booked += inserted
+                if not inserted and not (partial and conn.execute(
+                        "SELECT 1 FROM reservations WHERE flex = ? AND office = ? AND date = ? AND slot = ? AND name = ?",
+                        (flex, office, day, slot, name)).fetchone()):
+                    unavailable.append((date, slot, office))
+            if unavailable and not partial:
+                # Raising rolls back the cells already reserved in this transaction
+                details = ", ".join(f"{office} ({slot} le {date.strftime('%d/%m/%Y')})" for date, slot, office in unavailable)
+                raise ReservationError(f"Les bureaux suivants ne sont pas disponibles : {details}.")
+            if booked:
+                self._bump_version(conn, flex)
+        return unavailable
+
+    def release_cells(self, file_name, cells, name):
+        """
+        Cancel a batch of reservations made under a name, in a single transaction.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - cells ([(datetime.date, str, str)]): The (date, slot, office) cells to free.
+        - name (str): The name of the reservations: the cells reserved by someone else are left as they are.
+
+        Returns:
+        - int: The number of cells freed.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        with self._transaction() as conn:
+            released = sum(conn.execute(
+                "DELETE FROM reservations WHERE flex = ? AND office = ? AND date = ? AND slot = ? AND name = ?",
+                (flex, office, date.strftime('%Y-%m-%d'), slot, name)).rowcount for date, slot, office in cells)
+            if released:
+                self._bump_version(conn, flex)
+        return released
+
+    def release_slots(self, file_name, date, period, office, reassign=None):
+        """
+        Cancel the reservations of an office for every slot of a period.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - date (datetime.date): The day of the reservation to cancel.
+        - period (str): 'Matin', 'Après-midi' or 'Journée'.
+        - office (str): The office whose reservation is canceled.
+        - reassign ({str: str}, optional): Slot -> name of the person the slot goes to once released
+          (e.g., the first of its waitlist), in the same transaction. Defaults to none.
+
+        Returns:
+        - [str]: The slots that were reserved and are now released.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        day = date.strftime('%Y-%m-%d')
+        released = []
+        with self._transaction() as conn:
+            for slot in slots_for(period):
+                if conn.execute("DELETE FROM reservations WHERE flex = ? AND office = ? AND date = ? AND slot = ?",
+                                (flex, office, day, slot)).rowcount:
+                    released.append(slot)
+                    if reassign and slot in reassign:
+                        conn.execute("INSERT INTO reservations VALUES (?, ?, ?, ?, ?)",
+                                     (flex, office, day, slot, reassign[slot]))
+            if released:
+                self._bump_version(conn, flex)
+        return released
+
+    def free_offices(self, file_name, date, slot):
+        """
+        List the offices available for a slot, with an indexed query.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - date (datetime.date): The day to check.
+        - slot (str): 'Matin' or 'Après-midi'.
+
+        Returns:
+        - [str]: The available offices, in the order of the grid. Empty if the day is not in the calendar.
+        """
+        self._ensure_loaded(file_name)
+        flex = self._flex(file_name)
+        return [row[0] for row in self._connection().execute(
+            "SELECT o.office FROM offices o JOIN calendar c ON c.flex = o.flex AND c.date = ? AND c.slot = ? "
+            "WHERE o.flex = ? AND NOT EXISTS (SELECT 1 FROM reservations r WHERE r.flex = o.flex "
+            "AND r.office = o.office AND r.date = c.date AND r.slot = c.slot) ORDER BY o.position",
+            (date.strftime('%Y-%m-%d'), slot, flex))]
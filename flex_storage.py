@@ -0,0 +1,990 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import random
+import threading
+import time
+from io import BytesIO
+
+import pandas as pd
+
+from flex_grid import append_rows, decode_grid, enable_copy_on_write, encode_grid, missing_rows, shared_copy
+from flex_metrics import span
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Number of seconds a cached workbook is trusted before its ETag is checked again
+CACHE_TTL_SECONDS = 5
+
+# Number of times a conditional write is retried against the fresh data before giving up,
+# and base delay (in seconds) of the randomized exponential backoff between attempts
+UPDATE_RETRIES = 8
+RETRY_BACKOFF_SECONDS = 0.02
+
+# Tuning of the S3 client (see make_s3_client): size of its connection pool, which must cover the requests
+# made at the same time by the sessions and the parallel transfers, attempts of its adaptive retries
+# (throttling and transient errors, with a client-side rate limiter), and timeouts in seconds
+S3_MAX_POOL_CONNECTIONS = 50
+S3_MAX_ATTEMPTS = 5
+S3_CONNECT_TIMEOUT = 5
+S3_READ_TIMEOUT = 30
+
+# Number of files read or written at the same time by `read_many` and `write_many`, for the whole process
+IO_WORKERS = 16
+
+# Format used for the reservation data, and format of the historical files it replaces
+DEFAULT_FORMAT = "parquet"
+LEGACY_FORMAT = "xlsx"
+
+# Serialization formats known by the storage layer
+FORMATS = {
+    "xlsx": {
+        "extension": ".xlsx",
+        "content_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    },
+    "parquet": {
+        "extension": ".parquet",
+        "content_type": "application/vnd.apache.parquet",
+    },
+    "feather": {  # Feather v2 is the Arrow IPC file format
+        "extension": ".arrow",
+        "content_type": "application/vnd.apache.arrow.file",
+    },
+}
+
+
+#####################################################################
+# =========================== EXCEPTIONS ========================== #
+#####################################################################
+
+class ConcurrentModificationError(Exception):
+    """
+    Raised when a conditional write fails because the file changed since it was read.
+    """
+
+
+#####################################################################
+# ============================= CACHE ============================= #
+#####################################################################
+
+class DataFrameCache:
+    """
+    Process-wide cache keeping one parsed DataFrame per workbook.
+
+    Entries are trusted for `ttl` seconds. Past that delay, the cheap `head` callable
+    is used to compare the stored version (ETag) with the remote one, and the workbook
+    is only downloaded and parsed again when the version changed.
+
+    Parameters:
+    - ttl (float, optional): Number of seconds an entry is served without revalidation. Defaults to CACHE_TTL_SECONDS.
+
+    Notes:
+    The cache is shared between Streamlit sessions, so every DataFrame handed out is a copy:
+    callers are free to mutate it without affecting other users. With copy-on-write enabled by the
+    entry point, the copies are lazy and share the memory of the cached DataFrame, so the memory does not
+    grow with the sessions (see `shared_copy`).
+    """
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries = {}  # key -> [version, DataFrame, last check (monotonic time)]
+        self._lock = threading.Lock()
+
+    def get(self, key, head, fetch):
+        """
+        Return the DataFrame stored under `key`, loading or revalidating it when required.
+
+        Parameters:
+        - key (hashable): Identifier of the workbook (e.g., (bucket_name, file_name)).
+        - head (callable): Returns the current remote version of the workbook without downloading it.
+        - fetch (callable): Downloads and parses the workbook, returns a (DataFrame, version) tuple.
+
+        Returns:
+        - pandas.DataFrame: A copy of the cached DataFrame (see `shared_copy`).
+        """
+        return self.get_versioned(key, head, fetch)[0]
+
+    def get_versioned(self, key, head, fetch):
+        """
+        Same as `get`, but also return the version of the DataFrame.
+
+        Returns:
+        - (pandas.DataFrame, str): A copy of the cached DataFrame (see `shared_copy`) and its version.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None:
+            version, df, checked_at = entry
+            if time.monotonic() - checked_at < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                return shared_copy(df), version
+
+            # TTL expired: compare the versions before downloading anything
+            with self._lock:
+                self.revalidations += 1
+            if head() == version:
+                with self._lock:
+                    entry[2] = time.monotonic()
+                    self.hits += 1
+                return shared_copy(df), version
+
+        df, version = fetch()
+        with self._lock:
+            self._entries[key] = [version, df, time.monotonic()]
+            self.misses += 1
+        return shared_copy(df), version
+
+    def version(self, key, head):
+        """
+        Return the current version of the workbook stored under `key`, without downloading it.
+
+        Parameters:
+        - key (hashable): Identifier of the workbook.
+        - head (callable): Returns the current remote version of the workbook without downloading it.
+
+        Returns:
+        - str: The version of the cached entry while it is trusted, the remote version otherwise.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return entry[0]
+        version = head()
+        if entry is not None and version == entry[0]:
+            with self._lock:
+                entry[2] = time.monotonic()
+        return version
+
+    def put(self, key, df, version):
+        """
+        Store a DataFrame the caller already holds, e.g. one it has just written, so the next access does not fetch it.
+
+        Parameters:
+        - key (hashable): Identifier of the workbook.
+        - df (pandas.DataFrame): The DataFrame. It is kept as is: the caller must not modify it afterwards.
+        - version (str): The version of the DataFrame.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self._entries[key] = [version, df, time.monotonic()]
+
+    def missing(self, keys):
+        """
+        Return the keys without an entry, e.g. to download them together before reading them one by one.
+        """
+        with self._lock:
+            return [key for key in keys if key not in self._entries]
+
+    def invalidate(self, key):
+        """
+        Drop the entry stored under `key` so the next access reloads it.
+
+        Parameters:
+        - key (hashable): Identifier of the workbook.
+
+        Returns:
+        None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        - dict: Number of hits, misses, revalidations and cached entries.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "entries": len(self._entries),
+            }
+
+
+#####################################################################
+# ========================= SERIALIZATION ========================= #
+#####################################################################
+
+def storage_key(file_name, fmt):
+    """
+    Build the name under which a workbook is stored for a given format.
+
+    Parameters:
+    - file_name (str): Name of the workbook as declared in the flex configuration (e.g., "FlexAqua.xlsx").
+    - fmt (str): Storage format, one of FORMATS.
+
+    Returns:
+    - str: The file name with the extension of the format (e.g., "FlexAqua.parquet").
+    """
+    return os.path.splitext(file_name)[0] + FORMATS[fmt]["extension"]
+
+def serialize_frame(df, fmt, compression=None):
+    """
+    Convert a DataFrame into the bytes of the requested format.
+
+    Parameters:
+    - df (pandas.DataFrame): The DataFrame to serialize.
+    - fmt (str): Storage format, one of FORMATS.
+    - compression (str, optional): Codec of the columnar formats (e.g., "zstd"). Defaults to the one of the format.
+
+    Returns:
+    - bytes: The serialized DataFrame. Categorical columns are stored as text, so the files do not
+      depend on the in-memory representation of the grids.
+
+    Raises:
+    - ValueError: If the format is unknown.
+    """
+    df = decode_grid(df)
+    buffer = BytesIO()
+    if fmt == "xlsx":
+        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(buffer, index=False, compression=compression or "snappy")
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(buffer, compression=compression)
+    else:
+        raise ValueError(f"Unknown storage format: {fmt}")
+    return buffer.getvalue()
+
+def deserialize_frame(data, fmt):
+    """
+    Convert bytes of the requested format back into a DataFrame.
+
+    Parameters:
+    - data (bytes): The serialized DataFrame.
+    - fmt (str): Storage format, one of FORMATS.
+
+    Returns:
+    - pandas.DataFrame: The deserialized DataFrame.
+
+    Raises:
+    - ValueError: If the format is unknown.
+    """
+    with BytesIO(data) as bIO:
+        if fmt == "xlsx":
+            return pd.read_excel(bIO)
+        if fmt == "parquet":
+            return pd.read_parquet(bIO)
+        if fmt == "feather":
+            return pd.read_feather(bIO)
+    raise ValueError(f"Unknown storage format: {fmt}")
+
+
+#####################################################################
+# =========================== BACKENDS ============================ #
+#####################################################################
+
+class StorageBackend:
+    """
+    Interface of the places where reservation files are stored.
+
+    A backend only moves bytes around: `head` returns the current version of a key
+    (an ETag or anything that changes on every write), `read` returns the content along with
+    its version, and `write` stores new content and returns the new version.
+    Missing keys raise FileNotFoundError.
+
+    When `if_match` is given to `write`, the content is only stored if the current version
+    of the key is still `if_match`; with `if_none_match`, it is only stored if the key does not
+    exist yet. ConcurrentModificationError is raised otherwise.
+    `list_keys` returns the sorted keys starting with a prefix, optionally only those after a given key.
+    `read_many` and `write_many` transfer several files at the same time (see `io_pool`).
+    """
+
+    def head(self, key):
+        raise NotImplementedError
+
+    def read(self, key):
+        raise NotImplementedError
+
+    def write(self, key, data, content_type=None, if_match=None, if_none_match=False):
+        raise NotImplementedError
+
+    def list_keys(self, prefix, start_after=None):
+        raise NotImplementedError
+
+    def read_many(self, keys):
+        """
+        Read several keys at the same time.
+
+        Parameters:
+        - keys ([str]): The keys to read.
+
+        Returns:
+        - {str: (bytes, str)}: Key -> (content, version) of the keys found. The missing keys are left out.
+
+        Notes:
+        The reads run on the shared `io_pool`, so the time of a batch is about the time of its slowest file
+        instead of the sum of the round trips. Other errors than a missing key are raised.
+        """
+        def read(key):
+            try:
+                return key, self.read(key)
+            except FileNotFoundError:
+                return key, None
+
+        if len(keys) <= 1:
+            results = map(read, keys)
+        else:
+            results = io_pool().map(read, keys)
+        return {key: result for key, result in results if result is not None}
+
+    def write_many(self, files):
+        """
+        Write several keys at the same time, unconditionally.
+
+        Parameters:
+        - files ([(str, bytes, str)]): The (key, content, content type) of the files.
+
+        Returns:
+        - {str: str}: Key -> new version.
+
+        Notes:
+        The writes run on the shared `io_pool`. If one of them fails, the error is raised once the others
+        are done; the files already written stay, which is safe for files no manifest refers to yet.
+        """
+        def write(file):
+            key, data, content_type = file
+            return key, self.write(key, data, content_type)
+
+        if len(files) <= 1:
+            return dict(map(write, files))
+        return dict(io_pool().map(write, files))
+
+    def exists(self, key):
+        """
+        Check whether a key is present in the backend.
+
+        Parameters:
+        - key (str): The key to check.
+
+        Returns:
+        - bool: True if the key exists, False otherwise.
+        """
+        try:
+            self.head(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+_io_pool = None
+_io_pool_lock = threading.Lock()
+
+def io_pool():
+    """
+    Return the thread pool of the parallel transfers, created on first use and shared by every backend of the process.
+
+    Returns:
+    - concurrent.futures.ThreadPoolExecutor: A pool of IO_WORKERS threads.
+
+    Notes:
+    The transfers wait on the network (or the disk) without holding the GIL, so threads are enough to
+    overlap them. A single pool bounds the number of connections used at the same time, whatever the
+    number of sessions loading grids; its tasks never submit other tasks, so they cannot deadlock it.
+    """
+    global _io_pool
+    with _io_pool_lock:
+        if _io_pool is None:
+            _io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="flex-io")
+        return _io_pool
+
+def make_s3_client(endpoint_url=None, **kwargs):
+    """
+    Build an S3 client tuned for many small concurrent requests.
+
+    Parameters:
+    - endpoint_url (str, optional): Endpoint of an S3-compatible service, e.g. a local stand-in
+      (`moto_server`, MinIO). Defaults to AWS.
+    - kwargs: Other arguments of `boto3.client`, e.g. the credentials or the region.
+
+    Returns:
+    - botocore.client.S3: A client with a pool of S3_MAX_POOL_CONNECTIONS connections, "adaptive" retries
+      (S3_MAX_ATTEMPTS attempts, exponential backoff, slowed down when S3 throttles) and bounded timeouts.
+
+    Notes:
+    A botocore client is thread-safe: one client serves every session of the process and the threads
+    of `io_pool`. Its pool must be at least as large as the number of threads using it at the same time,
+    otherwise the connections beyond it are opened and closed at every request.
+    """
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={"mode": "adaptive", "max_attempts": S3_MAX_ATTEMPTS},
+        connect_timeout=S3_CONNECT_TIMEOUT,
+        read_timeout=S3_READ_TIMEOUT,
+        tcp_keepalive=True,
+    )
+    return boto3.client('s3', endpoint_url=endpoint_url, config=config, **kwargs)
+
+
+class S3Backend(StorageBackend):
+    """
+    Backend storing files in an S3 bucket.
+
+    Parameters:
+    - client (botocore.client.S3): The S3 client used for the requests, preferably built by `make_s3_client`.
+    - bucket_name (str): The name of the bucket holding the files.
+    """
+
+    def __init__(self, client, bucket_name):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    def _missing(self, error, key):
+        # Translate the S3 "not found" errors into FileNotFoundError
+        if error.response['Error']['Code'] in ("404", "NoSuchKey"):
+            return FileNotFoundError(f"File {key} not found in S3 bucket {self.bucket_name}")
+        return error
+
+    def head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=key)['ETag']
+        except self.client.exceptions.ClientError as e:
+            raise self._missing(e, key)
+
+    def read(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=key)
+        except self.client.exceptions.ClientError as e:
+            raise self._missing(e, key)
+        return response['Body'].read(), response['ETag']
+
+    def write(self, key, data, content_type=None, if_match=None, if_none_match=False):
+        params = {}
+        if if_match is not None:
+            # Conditional PUT: S3 rejects the write if the object changed in between
+            params['IfMatch'] = if_match
+        if if_none_match:
+            # Conditional create: S3 rejects the write if the object already exists
+            params['IfNoneMatch'] = '*'
+        try:
+            response = self.client.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=data,
+                ContentType=content_type or 'application/octet-stream',
+                **params
+            )
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ("PreconditionFailed", "ConditionalRequestConflict", "NoSuchKey", "404"):
+                raise ConcurrentModificationError(f"File {key} was modified in S3 bucket {self.bucket_name}") from e
+            raise
+        return response['ETag']
+
+    def list_keys(self, prefix, start_after=None):
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if start_after:
+            params['StartAfter'] = start_after
+        keys = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(**params):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+
+class LocalBackend(StorageBackend):
+    """
+    Backend storing files in a local folder.
+
+    Parameters:
+    - folder_path (str): Path of the folder holding the files. It is created on the first write.
+
+    Notes:
+    The version of a file is the MD5 of its content, like the ETag of a simple S3 upload. Writes go
+    through a temporary file renamed over the target, so readers never see a half-written file.
+    Conditional writes are serialized within the process, which covers a single Streamlit server.
+    """
+
+    def __init__(self, folder_path):
+        self.folder_path = folder_path
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.folder_path, key)
+
+    def head(self, key):
+        return self.read(key)[1]
+
+    def read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File {self._path(key)} not found.")
+        return data, hashlib.md5(data).hexdigest()
+
+    def write(self, key, data, content_type=None, if_match=None, if_none_match=False):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            if if_match is not None or if_none_match:
+                try:
+                    current = self.head(key)
+                except FileNotFoundError:
+                    current = None
+                if (if_match is not None and current != if_match) or (if_none_match and current is not None):
+                    raise ConcurrentModificationError(f"File {path} was modified.")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return hashlib.md5(data).hexdigest()
+
+    def list_keys(self, prefix, start_after=None):
+        folder, _ = os.path.split(self._path(prefix))
+        if not os.path.isdir(folder):
+            return []
+        keys = []
+        for root, _, files in os.walk(folder):
+            for file_name in files:
+                key = os.path.relpath(os.path.join(root, file_name), self.folder_path).replace(os.sep, "/")
+                if key.startswith(prefix) and not key.endswith(".tmp") and (not start_after or key > start_after):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Backend keeping files in memory, for local runs and tests.
+
+    Parameters:
+    - files (dict, optional): Initial content, mapping keys to bytes.
+    """
+
+    def __init__(self, files=None):
+        self._files = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+        for key, data in (files or {}).items():
+            self.write(key, data)
+
+    def head(self, key):
+        with self._lock:
+            if key not in self._files:
+                raise FileNotFoundError(f"File {key} not found in memory.")
+            return self._files[key][1]
+
+    def read(self, key):
+        with self._lock:
+            if key not in self._files:
+                raise FileNotFoundError(f"File {key} not found in memory.")
+            return self._files[key]
+
+    def write(self, key, data, content_type=None, if_match=None, if_none_match=False):
+        with self._lock:
+            current = self._files.get(key, (None, None))[1]
+            if (if_match is not None and current != if_match) or (if_none_match and current is not None):
+                raise ConcurrentModificationError(f"File {key} was modified in memory.")
+            self._counter += 1
+            version = str(self._counter)
+            self._files[key] = (bytes(data), version)
+            return version
+
+    def list_keys(self, prefix, start_after=None):
+        with self._lock:
+            return sorted(key for key in self._files if key.startswith(prefix) and (not start_after or key > start_after))
+
+
+class PrefixedBackend(StorageBackend):
+    """
+    View of a backend restricted to the keys under a prefix, e.g. the storage partition of a site.
+
+    Parameters:
+    - backend (StorageBackend): The shared backend (e.g., the S3 bucket).
+    - prefix (str): Prefix of the keys of the partition, e.g. "sites/lyon/". The keys seen by the
+      callers are relative to it.
+
+    Notes:
+    The stores built on it are unaware of the other partitions: they list, read and write their
+    own files only, so no file is shared between sites.
+    """
+
+    def __init__(self, backend, prefix):
+        self.backend = backend
+        self.prefix = prefix
+
+    def head(self, key):
+        return self.backend.head(self.prefix + key)
+
+    def read(self, key):
+        return self.backend.read(self.prefix + key)
+
+    def write(self, key, data, content_type=None, if_match=None, if_none_match=False):
+        return self.backend.write(self.prefix + key, data, content_type, if_match=if_match, if_none_match=if_none_match)
+
+    def list_keys(self, prefix, start_after=None):
+        keys = self.backend.list_keys(self.prefix + prefix, start_after=start_after and self.prefix + start_after)
+        return [key[len(self.prefix):] for key in keys]
+
+
+#####################################################################
+# ============================= STORE ============================= #
+#####################################################################
+
+class FrameStore:
+    """
+    Load and save the reservation DataFrames of the flex offices through a storage backend.
+
+    Parameters:
+    - backend (StorageBackend): Where the files are stored.
+    - fmt (str, optional): Format of the stored files. Defaults to DEFAULT_FORMAT.
+    - legacy_fmt (str, optional): Format of the historical files. When a file is missing in `fmt`,
+      it is migrated from this format on first access. Defaults to LEGACY_FORMAT.
+    - cache (DataFrameCache, optional): Cache of the parsed files. A new one is created if not provided.
+
+    Notes:
+    The files are identified by the names used in the flex configuration (e.g., "FlexAqua.xlsx"),
+    whatever the format they are actually stored in.
+    """
+
+    def __init__(self, backend, fmt=DEFAULT_FORMAT, legacy_fmt=LEGACY_FORMAT, cache=None):
+        self.backend = backend
+        self.fmt = fmt
+        self.legacy_fmt = legacy_fmt
+        self.cache = cache or DataFrameCache()
+
+    def load(self, file_name):
+        """
+        Load a reservation file into a DataFrame.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - pandas.DataFrame: A copy of the reservation data.
+
+        Raises:
+        - FileNotFoundError: If the file exists neither in the storage format nor in the legacy one.
+        """
+        return self.load_versioned(file_name)[0]
+
+    def load_versioned(self, file_name):
+        """
+        Same as `load`, but also return the version of the loaded data.
+
+        Returns:
+        - (pandas.DataFrame, str): A copy of the reservation data and its version.
+        """
+        key = storage_key(file_name, self.fmt)
+
+        def head():
+            with span("storage.head"):
+                return self.backend.head(key)
+
+        def fetch():
+            try:
+                with span("storage.read"):
+                    data, version = self.backend.read(key)
+            except FileNotFoundError:
+                if not self.legacy_fmt or self.legacy_fmt == self.fmt:
+                    raise
+                # Create only: if another user migrated (and booked) in the meantime, their file is kept
+                self.migrate(file_name, overwrite=False)
+                with span("storage.read"):
+                    data, version = self.backend.read(key)
+            with span("storage.parse", fmt=self.fmt):
+                return encode_grid(deserialize_frame(data, self.fmt)), version
+
+        return self.cache.get_versioned(key, head, fetch)
+
+    def load_range(self, file_name, start_date, end_date):
+        """
+        Load the reservation data needed for a date range.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - start_date (datetime.date): First day of the range.
+        - end_date (datetime.date): Last day of the range (included).
+
+        Returns:
+        - (pandas.DataFrame, str): A copy of the reservation data and its version.
+
+        Notes:
+        A single file holds every date, so the whole grid is returned. PartitionedFrameStore
+        only reads the months of the range.
+        """
+        return self.load_versioned(file_name)
+
+    def version(self, file_name):
+        """
+        Return the current version of a reservation file, without downloading it.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - str: The version `load_versioned` would return. It is checked with a HEAD request at most once per cache TTL.
+        """
+        key = storage_key(file_name, self.fmt)
+
+        def head():
+            with span("storage.head"):
+                return self.backend.head(key)
+
+        try:
+            return self.cache.version(key, head)
+        except FileNotFoundError:
+            return self.load_versioned(file_name)[1]  # Migrated from the legacy format on first access
+
+    def changes(self, file_name, since):
+        """
+        Return the reservations and cancellations made in a reservation file since a version.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - since (str): A version returned by `load_versioned`, `load_range` or `version`.
+
+        Returns:
+        - ([dict] or None, str): The events since that version (see flex_events.diff_events), and the current
+          version. The events are None when they are not known and the data must be loaded again.
+
+        Notes:
+        The files only hold the current grid: the changes are empty when the version did not change,
+        unknown otherwise. EventLogStore and SQLiteStore return the events themselves.
+        """
+        version = self.version(file_name)
+        return ([] if version == since else None), version
+
+    def save(self, df, file_name, if_match=None, if_none_match=False):
+        """
+        Save a DataFrame into a reservation file.
+
+        Parameters:
+        - df (pandas.DataFrame): The DataFrame to save.
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - if_match (str, optional): Only save if the stored file is still at this version.
+        - if_none_match (bool, optional): Only save if the file does not exist yet. Defaults to False.
+
+        Returns:
+        - str: The version of the stored file.
+
+        Raises:
+        - ConcurrentModificationError: If a condition is given and the file changed or exists.
+        """
+        key = storage_key(file_name, self.fmt)
+        try:
+            with span("storage.serialize", fmt=self.fmt):
+                data = serialize_frame(df, self.fmt)
+            with span("storage.write"):
+                version = self.backend.write(key, data, FORMATS[self.fmt]["content_type"],
+                                             if_match=if_match, if_none_match=if_none_match)
+        except BaseException:
+            # Make sure the next load sees the stored version of the file
+            self.cache.invalidate(key)
+            raise
+        # The saved grid replaces the cached one for every session, without downloading it again
+        frame = encode_grid(df).reset_index(drop=True)
+        frame.attrs.clear()
+        self.cache.put(key, frame, version)
+        return version
+
+    def update(self, file_name, mutate, retries=UPDATE_RETRIES):
+        """
+        Apply a modification to a reservation file without overwriting concurrent changes.
+
+        The file is loaded, modified in place by `mutate`, then saved with a conditional write
+        on the version that was loaded. If someone else saved the file in the meantime, the
+        modification is applied again on the fresh data.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - mutate (callable): Receives the DataFrame and modifies it in place. Its return value is
+          returned by `update`. Any exception it raises aborts the update without saving.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - The value returned by `mutate` for the attempt that was saved.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        for attempt in range(retries + 1):
+            df, version = self.load_versioned(file_name)
+            result = mutate(df)
+            try:
+                self.save(df, file_name, if_match=version)
+            except ConcurrentModificationError:
+                # The cache entry was dropped by save, the next attempt sees the fresh data
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+                continue
+            return result
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the update was not saved.")
+
+    def update_range(self, file_name, start_date, end_date, mutate, retries=UPDATE_RETRIES):
+        """
+        Apply a modification to the reservation data of a date range, without overwriting concurrent changes.
+
+        Same as `update`: a single file holds every date, so `mutate` receives the whole grid.
+        """
+        return self.update(file_name, mutate, retries)
+
+    def _rewrite(self, file_name, transform, retries):
+        # Same compare-and-swap as `update`, for the modifications that add or remove rows
+        for attempt in range(retries + 1):
+            df, version = self.load_versioned(file_name)
+            new_df, result = transform(df)
+            if new_df is None:
+                return result, version  # Nothing to change
+            try:
+                return result, self.save(new_df, file_name, if_match=version)
+            except ConcurrentModificationError:
+                time.sleep(random.uniform(0, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+        raise ConcurrentModificationError(f"File {file_name} kept changing, the rows were not saved.")
+
+    def extend(self, file_name, rows, retries=UPDATE_RETRIES):
+        """
+        Add calendar rows to a reservation file, e.g. the business days of a new period.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - rows (pandas.DataFrame): The rows to add, with the 'Date', 'Créneau' and office columns.
+          The (date, slot) rows already in the file are left as they are.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - (int, str): The number of rows added, and the version of the file.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        def transform(df):
+            added = missing_rows(df, rows)
+            if added.empty:
+                return None, 0
+            return append_rows(df, added), len(added)
+
+        return self._rewrite(file_name, transform, retries)
+
+    def truncate(self, file_name, before_date, archive=None, retries=UPDATE_RETRIES):
+        """
+        Remove the rows of the months before a date from a reservation file.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - before_date (datetime.date): The rows before the first day of the month of this date are removed.
+        - archive (callable, optional): Receives the removed rows before the file is saved without them.
+          Any exception it raises aborts the removal. It may be called again after a conflict.
+        - retries (int, optional): Number of additional attempts after a conflict. Defaults to UPDATE_RETRIES.
+
+        Returns:
+        - (pandas.DataFrame, str): The removed rows, and the version of the file.
+
+        Raises:
+        - ConcurrentModificationError: If every attempt conflicted with another write.
+        """
+        cutoff = pd.Timestamp(before_date.year, before_date.month, 1)
+
+        def transform(df):
+            past = (df['Date'] < cutoff).to_numpy()
+            removed = df[past].reset_index(drop=True)
+            if removed.empty:
+                return None, removed
+            if archive is not None:
+                archive(removed)
+            return df[~past].reset_index(drop=True), removed
+
+        return self._rewrite(file_name, transform, retries)
+
+    def invalidate(self, file_name):
+        """
+        Drop the cached copy of a reservation file so the next load downloads it.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        None
+        """
+        self.cache.invalidate(storage_key(file_name, self.fmt))
+
+    def migrate(self, file_name, overwrite=True):
+        """
+        Convert a file from the legacy format to the storage format.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+        - overwrite (bool, optional): Replace the file in the storage format if it already exists. Defaults to True.
+
+        Returns:
+        - pandas.DataFrame: The migrated data.
+
+        Raises:
+        - FileNotFoundError: If the legacy file does not exist.
+        """
+        data, _ = self.backend.read(storage_key(file_name, self.legacy_fmt))
+        df = deserialize_frame(data, self.legacy_fmt)
+        # Some historical workbooks store the dates as text
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        try:
+            self.save(df, file_name, if_none_match=not overwrite)
+        except ConcurrentModificationError:
+            pass  # Already migrated by someone else
+        return df
+
+    def export_excel(self, file_name):
+        """
+        Export a reservation file as an Excel workbook.
+
+        Parameters:
+        - file_name (str): Name of the file as declared in the flex configuration.
+
+        Returns:
+        - bytes: The content of the xlsx file.
+        """
+        return serialize_frame(self.load(file_name), "xlsx")
+
+
+#####################################################################
+# ========================= MIGRATION CLI ========================= #
+#####################################################################
+
+def main():
+    """
+    Convert the Excel workbooks of a folder or an S3 bucket into the storage format, once.
+
+    Usage:
+    python flex_storage.py FlexAqua.xlsx FlexSerre.xlsx FlexIMA.xlsx --folder flexoffice
+    python flex_storage.py FlexAqua.xlsx --bucket bucketflexoffice --format feather
+    """
+    parser = argparse.ArgumentParser(description="Migrate the flex office workbooks to a columnar format.")
+    parser.add_argument("files", nargs="+", help="Names of the Excel workbooks to migrate")
+    location = parser.add_mutually_exclusive_group(required=True)
+    location.add_argument("--folder", help="Local folder holding the workbooks")
+    location.add_argument("--bucket", help="S3 bucket holding the workbooks")
+    parser.add_argument("--format", default=DEFAULT_FORMAT, choices=[f for f in FORMATS if f != LEGACY_FORMAT])
+    args = parser.parse_args()
+    enable_copy_on_write()
+
+    if args.folder:
+        backend = LocalBackend(args.folder)
+    else:
+        backend = S3Backend(make_s3_client(), args.bucket)
+
+    store = FrameStore(backend, fmt=args.format)
+    for file_name in args.files:
+        df = store.migrate(file_name)
+        print(f"{file_name} -> {storage_key(file_name, args.format)} ({len(df)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import argparse
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from flex_sqlite import BUSY_TIMEOUT_MS
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS waiters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    flex TEXT NOT NULL,
+    office TEXT NOT NULL,
+    date TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    name TEXT NOT NULL,
+    contact TEXT,
+    created TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS waiters_cell_name ON waiters (flex, office, date, slot, name);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    flex TEXT NOT NULL,
+    office TEXT NOT NULL,
+    date TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    name TEXT NOT NULL,
+    contact TEXT,
+    message TEXT NOT NULL,
+    created TEXT NOT NULL,
+    sent TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent, id);
+"""
+
+# Columns of the notifications returned by `pending`, in the order of the table
+OUTBOX_COLUMNS = ("id", "flex", "office", "date", "slot", "name", "contact", "message", "created")
+
+
+#####################################################################
+# ============================ WAITLIST =========================== #
+#####################################################################
+
+class Waitlist:
+    """
+    First-come, first-served queues of the people waiting for a reserved (office, date, slot) cell,
+    with the outbox of the notifications sent when a cell is given to them.
+
+    When a reservation is canceled, BookingService.cancel takes the first person waiting for each slot
+    out of the queue (see `claim`), gives them the freed slot in the same write as the cancellation, and
+    records their notification here. The clients do not need to poll the grids to catch a freed office:
+    a job delivers the outbox (see `deliver`).
+
+    Parameters:
+    - path (str): The SQLite database, created if needed. It is local to the server, like the database
+      of the "sqlite" engine.
+
+    Notes:
+    The grids and the queues are not in the same database, so a person is taken out of the queue before
+    the write of the grid: once claimed, leaving the queue does nothing, and a person who left before is
+    never given the office. If the slot is not released, the claimed people are put back at their place
+    (see `restore`). If the process stops between the write of the grid and the outbox, the person keeps
+    the office without being notified.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads: one per thread (i.e. per Streamlit session)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def join(self, flex, office, date, slots, name, contact=None):
+        """
+        Add a person at the end of the queues of some slots of an office.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office.
+        - date (datetime.date): The day.
+        - slots ([str]): The slots waited for.
+        - name (str): The name the reservations will be made under.
+        - contact (str, optional): Where to send the notification (e.g., an e-mail address). Defaults to none.
+
+        Returns:
+        - {str: int}: The position of the person in the queue of each slot, starting at 1. A person already
+          waiting keeps their place.
+        """
+        day = date.strftime('%Y-%m-%d')
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        positions = {}
+        with self._transaction() as conn:
+            for slot in slots:
+                conn.execute("INSERT OR IGNORE INTO waiters (flex, office, date, slot, name, contact, created) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)", (flex, office, day, slot, name, contact, now))
+                positions[slot] = conn.execute(
+                    "SELECT COUNT(*) FROM waiters WHERE flex = ? AND office = ? AND date = ? AND slot = ? AND id <= "
+                    "(SELECT id FROM waiters WHERE flex = ? AND office = ? AND date = ? AND slot = ? AND name = ?)",
+                    (flex, office, day, slot, flex, office, day, slot, name)).fetchone()[0]
+        return positions
+
+    def leave(self, flex, office, date, slots, name):
+        """
+        Remove a person from the queues of some slots of an office.
+
+        Returns:
+        - [str]: The slots the person was waiting for.
+        """
+        day = date.strftime('%Y-%m-%d')
+        with self._transaction() as conn:
+            return [slot for slot in slots if conn.execute(
+                "DELETE FROM waiters WHERE flex = ? AND office = ? AND date = ? AND slot = ? AND name = ?",
+                (flex, office, day, slot, name)).rowcount]
+
+    def queue(self, flex, office, date, slot):
+        """
+        Return the names waiting for a cell, first come first.
+        """
+        return [row[0] for row in self._connection().execute(
+            "SELECT name FROM waiters WHERE flex = ? AND office = ? AND date = ? AND slot = ? ORDER BY id",
+            (flex, office, date.strftime('%Y-%m-%d'), slot))]
+
+    def claim(self, flex, office, date, slots):
+        """
+        Take the first person waiting for each of some slots of an office out of its queue, in one transaction.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office.
+        - date (datetime.date): The day.
+        - slots ([str]): The slots about to be released.
+
+        Returns:
+        - {str: (int, str, str, str)}: Slot -> (id, name, contact, created) of the first waiter, for the slots
+          with a queue. To give back with `restore` for the slots that are not given to them.
+        """
+        day = date.strftime('%Y-%m-%d')
+        first = {}
+        with self._transaction() as conn:
+            for slot in slots:
+                row = conn.execute("DELETE FROM waiters WHERE id = (SELECT id FROM waiters WHERE flex = ? AND "
+                                   "office = ? AND date = ? AND slot = ? ORDER BY id LIMIT 1) "
+                                   "RETURNING id, name, contact, created", (flex, office, day, slot)).fetchone()
+                if row:
+                    first[slot] = tuple(row)
+        return first
+
+    def restore(self, flex, office, date, waiters):
+        """
+        Put claimed people back in their queues, at their place (e.g., their slot was not released after all).
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office.
+        - date (datetime.date): The day.
+        - waiters ({str: (int, str, str, str)}): The people to put back, as returned by `claim`.
+
+        Returns:
+        None
+
+        Notes:
+        A person who queued again in the meantime keeps their new place.
+        """
+        if not waiters:
+            return
+        day = date.strftime('%Y-%m-%d')
+        with self._transaction() as conn:
+            for slot, (waiter_id, name, contact, created) in waiters.items():
+                conn.execute("INSERT OR IGNORE INTO waiters (id, flex, office, date, slot, name, contact, created) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (waiter_id, flex, office, day, slot, name, contact, created))
+
+    def assigned(self, flex, office, date, waiters):
+        """
+        Record the notifications of the people given a slot, in one transaction.
+
+        Parameters:
+        - flex (str): Name of the flex office.
+        - office (str): The office.
+        - date (datetime.date): The day.
+        - waiters ({str: (int, str, str, str)}): Slot -> waiter, as returned by `claim`, of the reservations made.
+
+        Returns:
+        None
+        """
+        if not waiters:
+            return
+        day = date.strftime('%Y-%m-%d')
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with self._transaction() as conn:
+            for slot, (_, name, contact, _) in waiters.items():
+                message = (f"Le bureau {office} ({flex}) vous a été attribué pour le créneau {slot} "
+                           f"du {date.strftime('%d/%m/%Y')} (liste d'attente).")
+                conn.execute("INSERT INTO outbox (flex, office, date, slot, name, contact, message, created) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (flex, office, day, slot, name, contact, message, now))
+
+    def pending(self, limit=100):
+        """
+        Return the notifications not delivered yet, oldest first.
+
+        Returns:
+        - [dict]: One dict per notification, with the OUTBOX_COLUMNS keys.
+        """
+        rows = self._connection().execute(
+            f"SELECT {', '.join(OUTBOX_COLUMNS)} FROM outbox WHERE sent IS NULL ORDER BY id LIMIT ?", (limit,))
+        return [dict(zip(OUTBOX_COLUMNS, row)) for row in rows]
+
+    def deliver(self, send, limit=100):
+        """
+        Send the pending notifications, and mark each one as sent once `send` returned.
+
+        Parameters:
+        - send (callable): Receives a notification (see `pending`). An exception stops the delivery;
+          the notification stays pending and is sent again by the next call.
+        - limit (int, optional): Maximum number of notifications sent. Defaults to 100.
+
+        Returns:
+        - int: The number of notifications sent.
+        """
+        sent = 0
+        for notification in self.pending(limit):
+            send(notification)
+            with self._transaction() as conn:
+                conn.execute("UPDATE outbox SET sent = ? WHERE id = ?",
+                             (datetime.datetime.now().isoformat(timespec='seconds'), notification["id"]))
+            sent += 1
+        return sent
+
+
+#####################################################################
+# ========================== OUTBOX CLI =========================== #
+#####################################################################
+
+def main():
+    """
+    Print the pending notifications of a waitlist database and mark them as sent, e.g. from a job piping them to a mailer.
+
+    Usage:
+    python flex_waitlist.py flexwaitlist.db
+    python flex_waitlist.py flexwaitlist.db --dry-run
+    """
+    parser = argparse.ArgumentParser(description="Deliver the notifications of the flex office waitlists.")
+    parser.add_argument("path", help="Waitlist database")
+    parser.add_argument("--dry-run", action="store_true", help="Print the pending notifications without marking them")
+    args = parser.parse_args()
+
+    waitlist = Waitlist(args.path)
+    if args.dry_run:
+        for notification in waitlist.pending():
+            print(f"{notification['contact'] or notification['name']}: {notification['message']}")
+        return
+    sent = waitlist.deliver(lambda notification: print(f"{notification['contact'] or notification['name']}: "
+                                                       f"{notification['message']}"))
+    print(f"{sent} notification(s) sent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import FEBRUARY, LAST_DAY, MONDAY, OFFICES, WEEK
+from flex_analytics import late_cancellations, occupancy_report, report_json
+from flex_grid import book_slots, build_calendar, concat_grids
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def history():
+    # B2 was only added the second week: its cells of the first week are empty
+    first_week = build_calendar(["B1"], MONDAY, WEEK[-1])
+    book_slots(first_week, WEEK[0], "Journée", "B1", "Alice")
+    df = concat_grids([first_week, build_calendar(OFFICES, MONDAY + datetime.timedelta(days=7), LAST_DAY)])
+    book_slots(df, FEBRUARY, "Matin", "B2", "Bob")
+    return df
+
+
+#####################################################################
+# ============================ REPORTS ============================ #
+#####################################################################
+
+def test_empty_cells_are_not_occupied(history):
+    report = occupancy_report(history, OFFICES)
+
+    assert report["rate"] == pytest.approx(3 / 30)
+    assert report["offices"]["Demi-journées réservées"].tolist() == [2, 1]
+    assert report["offices"]["Taux d'occupation"].tolist() == pytest.approx([2 / 20, 1 / 10])
+    assert report["slots"].loc["B2"].tolist() == pytest.approx([1 / 5, 0])
+    assert report["daily"]["Taux d'occupation"].iloc[0] == 1
+
+def test_people_of_the_reserved_cells_only(history):
+    people = occupancy_report(history, OFFICES)["people"]
+
+    assert people.index.tolist() == ["Alice", "Bob"]
+    assert people.loc["Alice", ["Demi-journées", "Jours", "Bureau favori"]].tolist() == [2, 1, "B1"]
+    assert people.loc["Bob", "Première réservation"] == pd.Timestamp(FEBRUARY)
+
+def test_report_without_reservations(grid):
+    report = occupancy_report(grid, OFFICES)
+
+    assert report["rate"] == 0
+    assert report["people"].empty
+    assert report_json(report)["offices"]["B1"] == {"Demi-journées réservées": 0, "Taux d'occupation": 0.0}
+
+
+#####################################################################
+# ======================= LATE CANCELLATIONS ====================== #
+#####################################################################
+
+def test_late_cancellations_are_those_of_the_reserved_day():
+    events = pd.DataFrame({
+        "timestamp": ["2025-01-20T09:00:00", "2025-01-27T08:00:00", "2025-01-24T18:00:00"],
+        "action": ["book", "cancel", "cancel"],
+        "date": [str(WEEK[0]), str(WEEK[0]), str(WEEK[1])],
+    })
+    counts = late_cancellations(events)
+
+    assert counts.index.tolist() == [pd.Timestamp(MONDAY)]
+    assert counts.iloc[0].tolist() == [1, 1, 1.0]
@@ -0,0 +1,125 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+import json
+
+import pytest
+
+from conftest import FILE_NAME, MONDAY, OFFICES, WEEK, book, cell
+from flex_events import BOOK, CANCEL, EventLogStore, diff_events, fold_events
+from flex_grid import AVAILABLE, add_names, book_slots, build_calendar, concat_grids, release_cells
+from flex_storage import ConcurrentModificationError, FrameStore
+
+
+#####################################################################
+# ============================ EVENTS ============================= #
+#####################################################################
+
+def test_fold_replays_the_diff():
+    before = build_calendar(OFFICES, MONDAY, MONDAY)
+    after = before.copy()
+    book_slots(after, MONDAY, "Journée", "B2", "Alice")
+    release_cells(after, [(MONDAY, "Après-midi", "B2")], "Alice")
+
+    events = diff_events(before, after, OFFICES)
+    assert [(event["action"], event["office"], event["slot"]) for event in events] == [(BOOK, "B2", "Matin")]
+    assert fold_events(before.copy(), events).equals(after)
+
+def test_empty_cell_made_available_cancels_nobody():
+    # A third office only exists from the second week: its cells of the first one are empty
+    next_monday = MONDAY + datetime.timedelta(days=7)
+    before = concat_grids([build_calendar(OFFICES, MONDAY, MONDAY),
+                           build_calendar(OFFICES + ["B3"], next_monday, next_monday)])
+    after = before.copy()
+    add_names(after, ["Alice"])
+    after.loc[0, "B3"] = AVAILABLE
+    after.loc[1, "B3"] = "Alice"
+
+    events = diff_events(before, after, OFFICES + ["B3"])
+    assert [(event["action"], event["slot"], event["name"]) for event in events] == [
+        (CANCEL, "Matin", None), (BOOK, "Après-midi", "Alice")]
+    assert fold_events(before.copy(), events)["B3"].astype(str).equals(after["B3"].astype(str))
+    # Emptying a cell is not a reservation event
+    assert diff_events(after, before, OFFICES + ["B3"]) == []
+
+def test_fold_after_compaction(backend):
+    store = EventLogStore(FrameStore(backend), compact_every=3)
+    for day in WEEK:
+        book(store, day)
+
+    # The third batch triggered a compaction: the snapshot holds the first three bookings only
+    watermark = json.loads(backend.read("events/FlexTest.snapshot.json")[0])
+    assert watermark["last_batch"] == "events/FlexTest/000000000003.json"
+    snapshot = FrameStore(backend).load(FILE_NAME)
+    assert [cell(snapshot, day) for day in WEEK] == ["Alice"] * 3 + [AVAILABLE] * 2
+
+    # A new process folds the batches recorded after the watermark on top of the snapshot
+    df = EventLogStore(FrameStore(backend), compact_every=3).load(FILE_NAME)
+    assert [cell(df, day) for day in WEEK] == ["Alice"] * 5
+
+def test_changes_after_compaction(backend):
+    store = EventLogStore(FrameStore(backend), compact_every=3)
+    book(store, WEEK[0])
+    before_compaction = store.version(FILE_NAME)
+    book(store, WEEK[1])
+    book(store, WEEK[2])
+
+    # The snapshot was replaced: the client must load the grid again
+    events, version = store.changes(FILE_NAME, before_compaction)
+    assert events is None
+    assert version == store.version(FILE_NAME)
+
+    book(store, WEEK[3], office="B2", name="Bob")
+    events, _ = store.changes(FILE_NAME, version)
+    assert [(event["action"], event["office"], event["name"]) for event in events] == [(BOOK, "B2", "Bob")]
+
+def test_changes_list_the_cancellations(backend):
+    store = EventLogStore(FrameStore(backend))
+    book(store, WEEK[0])
+    since = store.version(FILE_NAME)
+    store.update(FILE_NAME, lambda df: release_cells(df, [(WEEK[0], "Matin", "B1")], "Alice"))
+
+    events, version = store.changes(FILE_NAME, since)
+    assert [(event["action"], event["name"]) for event in events] == [(CANCEL, "Alice")]
+    assert store.changes(FILE_NAME, version) == ([], version)
+
+
+#####################################################################
+# ======================= CONCURRENT BATCHES ====================== #
+#####################################################################
+
+def test_conflicting_batch_is_recorded_again(backend):
+    store = EventLogStore(FrameStore(backend))
+    other = EventLogStore(FrameStore(backend))  # Another server, with its own cache
+    attempts = []
+
+    def mutate(df):
+        if not attempts:
+            # Someone else takes the next batch number between the load and the write
+            book(other, WEEK[0], office="B2", name="Bob")
+        attempts.append(df)
+        book_slots(df, WEEK[0], "Matin", "B1", "Alice")
+
+    store.update(FILE_NAME, mutate)
+
+    assert len(attempts) == 2
+    assert backend.list_keys("events/FlexTest/") == ["events/FlexTest/000000000001.json",
+                                                     "events/FlexTest/000000000002.json"]
+    df = EventLogStore(FrameStore(backend)).load(FILE_NAME)
+    assert (cell(df, WEEK[0]), cell(df, WEEK[0], "B2")) == ("Alice", "Bob")
+
+def test_conflicting_batch_gives_up(backend):
+    store = EventLogStore(FrameStore(backend))
+    other = EventLogStore(FrameStore(backend))
+    attempts = []
+
+    def mutate(df):
+        book(other, WEEK[len(attempts)], office="B2", name="Bob")
+        attempts.append(df)
+        book_slots(df, WEEK[0], "Matin", "B1", "Alice")
+
+    with pytest.raises(ConcurrentModificationError):
+        store.update(FILE_NAME, mutate, retries=1)
+    assert len(store.audit_trail(FILE_NAME)) == 2  # Bob's bookings only
@@ -0,0 +1,29 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import pytest
+
+from conftest import OFFICES, WEEK
+from flex_grid import AVAILABLE_COLOR, RESERVED_COLOR, book_slots, decode_grid, grid_styles, render_period
+
+
+#####################################################################
+# ============================ DISPLAY ============================ #
+#####################################################################
+
+def test_grid_styles_color_every_office_cell(grid):
+    book_slots(grid, WEEK[0], "Matin", "B2", "Alice")
+    styles = grid_styles(decode_grid(grid))
+
+    assert (styles[['Date', 'Créneau']] == '').all().all()
+    assert styles.loc[0, 'B2'] == f'background-color: {RESERVED_COLOR}'
+    assert (styles[OFFICES].iloc[1:] == f'background-color: {AVAILABLE_COLOR}').all().all()
+
+@pytest.mark.parametrize("name", ["<script>alert(1)</script>", "<img src=x onerror=alert(1)>"])
+def test_rendered_names_are_escaped(grid, name):
+    book_slots(grid, WEEK[0], "Matin", "B1", name)
+    html = render_period(grid, WEEK[0], 5)
+
+    assert name not in html
+    assert name.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") in html
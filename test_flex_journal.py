@@ -0,0 +1,83 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import atexit
+
+from conftest import FILE_NAME, WEEK, book, cell
+from flex_grid import AVAILABLE
+from flex_journal import JournalStore
+from flex_storage import FrameStore
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+DAY = WEEK[1]
+
+# Long enough for the background thread never to upload during a test
+NEVER_SECONDS = 3600
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+def open_journal(backend, path):
+    journal = JournalStore(FrameStore(backend), str(path), flush_interval=NEVER_SECONDS, max_entries=1000)
+    # The tests decide when the journal is closed, or simulate a crash by never closing it
+    atexit.unregister(journal.close)
+    return journal
+
+
+#####################################################################
+# ============================ JOURNAL ============================ #
+#####################################################################
+
+def test_loads_include_the_waiting_entries(backend, tmp_path):
+    journal = open_journal(backend, tmp_path / "journal.db")
+    book(journal, DAY)
+
+    assert journal.pending_count() == 1
+    assert journal.version(FILE_NAME).endswith("#1")
+    assert cell(journal.load(FILE_NAME), DAY) == "Alice"
+    assert cell(FrameStore(backend).load(FILE_NAME), DAY) == AVAILABLE
+
+    events, _ = journal.changes(FILE_NAME, FrameStore(backend).version(FILE_NAME))
+    assert [(event["office"], event["name"]) for event in events] == [("B1", "Alice")]
+
+    assert journal.flush() == 1
+    assert journal.pending_count() == 0
+    assert cell(FrameStore(backend).load(FILE_NAME), DAY) == "Alice"
+    journal.close()
+
+def test_replay_after_an_unflushed_close(backend, tmp_path):
+    path = tmp_path / "journal.db"
+    crashed = open_journal(backend, path)
+    book(crashed, DAY)
+    book(crashed, DAY, office="B2", name="Bob")
+    # The server stops without uploading: the store never saw the reservations
+    assert cell(FrameStore(backend).load(FILE_NAME), DAY) == AVAILABLE
+
+    journal = open_journal(backend, path)
+    assert cell(journal.load(FILE_NAME), DAY, "B2") == "Bob"
+    journal.close()
+
+    assert journal.pending_count() == 0
+    df = FrameStore(backend).load(FILE_NAME)
+    assert (cell(df, DAY), cell(df, DAY, "B2")) == ("Alice", "Bob")
+    # The uploaded entries left the journal: a third start has nothing to replay
+    assert open_journal(backend, path).pending_count() == 0
+
+def test_replay_of_uploaded_entries_changes_nothing(backend, tmp_path):
+    path = tmp_path / "journal.db"
+    book(open_journal(backend, path), DAY)
+    # The server crashed after the upload, before removing the entries from the journal
+    book(FrameStore(backend), DAY)
+
+    journal = open_journal(backend, path)
+    journal.close()
+
+    assert journal.pending_count() == 0
+    assert cell(FrameStore(backend).load(FILE_NAME), DAY) == "Alice"
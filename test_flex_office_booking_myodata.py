@@ -0,0 +1,57 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import pytest
+
+from conftest import FILE_NAME, WEEK, cell
+from flex_grid import AVAILABLE, ReservationError
+from flex_office_booking_myodata import (book_cells_in_local, book_slots_in_local, get_store,
+                                         load_file_from_local, release_slots_in_local)
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def folder(tmp_path, grid):
+    # The local folder of the application, holding the grid (an absolute path replaces the one of the application)
+    get_store(str(tmp_path)).save(grid, FILE_NAME)
+    return str(tmp_path)
+
+
+#####################################################################
+# ========================== RESERVATIONS ========================= #
+#####################################################################
+
+def test_booking_under_a_new_name(folder):
+    # The office columns are categorical: a name never seen before must be added to them
+    book_slots_in_local(folder, FILE_NAME, WEEK[0], "Journée", "B1", "Nouvelle Personne 016")
+
+    df = load_file_from_local(folder, FILE_NAME)
+    assert cell(df, WEEK[0]) == cell(df, WEEK[0], slot="Après-midi") == "Nouvelle Personne 016"
+
+def test_booking_a_taken_office_saves_nothing(folder):
+    book_slots_in_local(folder, FILE_NAME, WEEK[0], "Après-midi", "B1", "Bob")
+
+    with pytest.raises(ReservationError):
+        book_slots_in_local(folder, FILE_NAME, WEEK[0], "Journée", "B1", "Alice")
+    assert cell(load_file_from_local(folder, FILE_NAME), WEEK[0]) == AVAILABLE
+
+def test_booking_the_checked_cells(folder):
+    cells = [(WEEK[1], "Matin", "B1"), (WEEK[2], "Après-midi", "B2")]
+    book_cells_in_local(folder, FILE_NAME, cells, "Autre Personne 016")
+
+    df = load_file_from_local(folder, FILE_NAME)
+    assert [cell(df, date, office, slot) for date, slot, office in cells] == ["Autre Personne 016"] * 2
+    with pytest.raises(ReservationError):
+        book_cells_in_local(folder, FILE_NAME, [(WEEK[3], "Matin", "B1")] + cells, "Alice")
+    assert cell(load_file_from_local(folder, FILE_NAME), WEEK[3]) == AVAILABLE
+
+def test_cancelling_a_reservation(folder):
+    book_slots_in_local(folder, FILE_NAME, WEEK[0], "Journée", "B2", "Bob")
+
+    assert release_slots_in_local(folder, FILE_NAME, WEEK[0], "Journée", "B2") == ["Matin", "Après-midi"]
+    assert release_slots_in_local(folder, FILE_NAME, WEEK[0], "Journée", "B2") == []
+    assert (load_file_from_local(folder, FILE_NAME)['B2'] == AVAILABLE).all()
@@ -0,0 +1,113 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import FEBRUARY, FILE_NAME, WEEK, book, cell
+from flex_grid import AVAILABLE, ReservationError, book_slots
+from flex_partitions import MANIFEST_NAME, PartitionedFrameStore
+from flex_storage import ConcurrentModificationError
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+JANUARY = WEEK[1]
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def backend(backend):
+    # The single file of FrameStore is migrated into monthly partitions on the first load
+    PartitionedFrameStore(backend).load(FILE_NAME)
+    return backend
+
+def manifest(backend):
+    return json.loads(backend.read(f"FlexTest/{MANIFEST_NAME}")[0])
+
+
+#####################################################################
+# =========================== PARTITIONS ========================== #
+#####################################################################
+
+def test_update_range_only_writes_its_month(backend):
+    store = PartitionedFrameStore(backend)
+    before = manifest(backend)["partitions"]
+    book(store, FEBRUARY)
+
+    after = manifest(backend)["partitions"]
+    assert sorted(after) == ["2025-01", "2025-02"]
+    assert after["2025-01"] == before["2025-01"]
+    assert after["2025-02"] != before["2025-02"]
+
+def test_load_range_only_returns_its_months(backend):
+    store = PartitionedFrameStore(backend)
+    df, version = store.load_range(FILE_NAME, FEBRUARY, FEBRUARY)
+    assert set(df['Date'].dt.month) == {2}
+    assert version == store.version(FILE_NAME)
+    assert df['Date'].min() == pd.Timestamp(FEBRUARY.replace(day=3))
+
+def test_nothing_changed_keeps_the_manifest(backend):
+    store = PartitionedFrameStore(backend)
+    version = store.version(FILE_NAME)
+    store.update_range(FILE_NAME, JANUARY, JANUARY, lambda df: None)
+    assert backend.head(f"FlexTest/{MANIFEST_NAME}") == version
+
+
+#####################################################################
+# ========================= MANIFEST RACE ========================= #
+#####################################################################
+
+def test_manifest_race_keeps_both_months(backend):
+    store = PartitionedFrameStore(backend)
+    other = PartitionedFrameStore(backend)  # Another server, with its own caches
+    store.load(FILE_NAME)
+    attempts = []
+
+    def mutate(df):
+        if not attempts:
+            # Someone else commits another month between the load and the manifest write
+            book(other, FEBRUARY, office="B2", name="Bob")
+        attempts.append(df)
+        book_slots(df, JANUARY, "Matin", "B1", "Alice")
+
+    store.update_range(FILE_NAME, JANUARY, JANUARY, mutate)
+
+    assert len(attempts) == 2
+    df = PartitionedFrameStore(backend).load(FILE_NAME)
+    assert (cell(df, JANUARY), cell(df, FEBRUARY, "B2")) == ("Alice", "Bob")
+
+def test_manifest_race_on_the_same_cell(backend):
+    store = PartitionedFrameStore(backend)
+    other = PartitionedFrameStore(backend)
+    attempts = []
+
+    def mutate(df):
+        if not attempts:
+            book(other, JANUARY, name="Bob")
+        attempts.append(df)
+        book_slots(df, JANUARY, "Matin", "B1", "Alice")
+
+    # The second attempt sees Bob's reservation and aborts without saving
+    with pytest.raises(ReservationError):
+        store.update_range(FILE_NAME, JANUARY, JANUARY, mutate)
+    assert cell(PartitionedFrameStore(backend).load(FILE_NAME), JANUARY) == "Bob"
+
+def test_stale_manifest_is_rejected(backend):
+    store = PartitionedFrameStore(backend)
+    df, version = store.load_versioned(FILE_NAME)
+    book(PartitionedFrameStore(backend), FEBRUARY)
+
+    book_slots(df, JANUARY, "Matin", "B1", "Alice")
+    with pytest.raises(ConcurrentModificationError):
+        store.save(df, FILE_NAME, if_match=version)
+    df = store.load(FILE_NAME)
+    assert (cell(df, JANUARY), cell(df, FEBRUARY)) == (AVAILABLE, "Alice")
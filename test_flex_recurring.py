@@ -0,0 +1,49 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+
+import pytest
+
+from conftest import FEBRUARY, LAST_DAY, MONDAY, WEEK
+from flex_grid import ReservationError, availability_index, book_slots
+from flex_recurring import MAX_LISTED_CONFLICTS, conflict_message, expand_rule, make_rule
+
+
+#####################################################################
+# ============================= RULES ============================= #
+#####################################################################
+
+def test_make_rule_refuses_the_weekends():
+    with pytest.raises(ReservationError):
+        make_rule("B1", [5], "Matin", MONDAY, LAST_DAY, "Alice")
+    with pytest.raises(ReservationError):
+        make_rule("B1", [0], "Matin", LAST_DAY, MONDAY, "Alice")
+
+def test_expand_rule_keeps_its_weekdays_without_the_exceptions(grid):
+    # Every Monday and Wednesday of the grid but Wednesday 29/01
+    rule = make_rule("B1", [0, 2], "Journée", MONDAY, LAST_DAY, "Alice", exceptions=[WEEK[2]])
+    cells, conflicts = expand_rule(rule, availability_index(grid))
+
+    days = [MONDAY, MONDAY + datetime.timedelta(days=7), FEBRUARY + datetime.timedelta(days=1)]
+    assert cells == [(day, slot, "B1") for day in days for slot in ("Matin", "Après-midi")]
+    assert conflicts == []
+
+def test_expand_rule_finds_the_unavailable_cells(grid):
+    book_slots(grid, FEBRUARY, "Après-midi", "B1", "Bob")
+    rule = make_rule("B1", [1], "Journée", MONDAY, LAST_DAY, "Alice")
+
+    cells, conflicts = expand_rule(rule, availability_index(grid), start_date=FEBRUARY)
+    assert cells == [(FEBRUARY, "Matin", "B1"), (FEBRUARY, "Après-midi", "B1")]
+    assert conflicts == [(FEBRUARY, "Après-midi", "B1")]
+
+def test_expand_rule_of_an_unknown_office(grid):
+    rule = make_rule("B9", [0, 1, 2, 3, 4], "Matin", MONDAY, LAST_DAY, "Alice")
+    assert expand_rule(rule, availability_index(grid)) == ([], [])
+
+def test_conflict_message_counts_the_cells_not_listed():
+    conflicts = [(MONDAY + datetime.timedelta(days=i), "Matin", "B1") for i in range(MAX_LISTED_CONFLICTS + 2)]
+    message = conflict_message(conflicts)
+    assert "B1 (Matin le 27/01/2025)" in message
+    assert message.endswith(" et 2 autre(s).")
@@ -0,0 +1,166 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import datetime
+
+import pytest
+
+from conftest import FEBRUARY, FILE_NAME, LAST_DAY, OFFICES, WEEK, book, cell
+from flex_grid import AVAILABLE, ReservationError, build_calendar, concat_grids
+from flex_recurring import RuleStore
+from flex_service import BookingService
+from flex_storage import ConcurrentModificationError, FrameStore
+from flex_waitlist import Waitlist
+
+
+#####################################################################
+# =========================== CONSTANTS =========================== #
+#####################################################################
+
+# Tuesdays of the grid, then of the two weeks added when the calendar rolls
+TUESDAYS = [WEEK[1] + datetime.timedelta(days=7 * i) for i in range(4)]
+
+# "Serre" is a floor just added to the site: its calendar has not been rolled yet, it has no file
+CONFIG = {
+    "Aqua": {"excel": FILE_NAME, "offices": OFFICES},
+    "Serre": {"excel": "FlexSerre.xlsx", "offices": ["S1"]},
+}
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def service(backend, tmp_path):
+    # The versions of the in-memory backends restart at 1: the namespace keeps the indexes of two tests apart
+    return BookingService(FrameStore(backend), config=CONFIG, namespace=f"{tmp_path.name}/", rules=RuleStore(backend),
+                          waitlist=Waitlist(str(tmp_path / "flexwaitlist.db")))
+
+
+#####################################################################
+# ============================= SEARCH ============================ #
+#####################################################################
+
+def test_search_skips_the_flex_offices_without_a_file(service):
+    book(service.store, WEEK[0], office="B2")
+
+    results = service.search(WEEK[0])
+    assert [(result["flex"], result["office"], result["whole_period"]) for result in results] == [
+        ("Aqua", "B1", True), ("Aqua", "B2", False)]
+    assert service.search(WEEK[0], flexes=["Serre"]) == []
+
+
+#####################################################################
+# =========================== WAITLISTS =========================== #
+#####################################################################
+
+def test_cancel_gives_the_slot_to_the_first_person_waiting(service):
+    service.book("Aqua", "B1", WEEK[0], "Journée", "Alice")
+    assert service.join_waitlist("Aqua", "B1", WEEK[0], "Matin", "Bob", "bob@example.com") == {"Matin": 1}
+    assert service.join_waitlist("Aqua", "B1", WEEK[0], "Journée", "Carol") == {"Matin": 2, "Après-midi": 1}
+
+    assert service.cancel("Aqua", "B1", WEEK[0], "Matin") == (["Matin"], {"Matin": "Bob"})
+    df = service.load("Aqua")
+    assert (cell(df, WEEK[0]), cell(df, WEEK[0], slot="Après-midi")) == ("Bob", "Alice")
+    assert service.waitlist.queue("Aqua", "B1", WEEK[0], "Matin") == ["Carol"]
+    assert [(notification["name"], notification["contact"]) for notification in service.waitlist.pending()] == [
+        ("Bob", "bob@example.com")]
+
+def test_cancel_of_an_available_slot_keeps_the_queue(service):
+    service.book("Aqua", "B1", WEEK[0], "Après-midi", "Alice")
+    service.join_waitlist("Aqua", "B1", WEEK[0], "Journée", "Bob")
+    service.join_waitlist("Aqua", "B1", WEEK[0], "Journée", "Carol")
+    # The morning queue was joined through the afternoon reservation: the morning is available
+    assert service.waitlist.queue("Aqua", "B1", WEEK[0], "Matin") == []
+
+    assert service.cancel("Aqua", "B1", WEEK[0], "Journée") == (["Après-midi"], {"Après-midi": "Bob"})
+    assert service.cancel("Aqua", "B1", WEEK[1], "Journée") == ([], {})
+    assert service.waitlist.queue("Aqua", "B1", WEEK[0], "Après-midi") == ["Carol"]
+
+def test_failed_cancel_puts_the_people_back(service, monkeypatch):
+    service.book("Aqua", "B1", WEEK[0], "Matin", "Alice")
+    service.join_waitlist("Aqua", "B1", WEEK[0], "Matin", "Bob")
+    service.join_waitlist("Aqua", "B1", WEEK[0], "Matin", "Carol")
+
+    def overtaken(*args, **kwargs):
+        raise ConcurrentModificationError("The grid kept changing.")
+
+    monkeypatch.setattr(service.store, "update_range", overtaken)
+    with pytest.raises(ConcurrentModificationError):
+        service.cancel("Aqua", "B1", WEEK[0], "Matin")
+    assert service.waitlist.queue("Aqua", "B1", WEEK[0], "Matin") == ["Bob", "Carol"]
+    assert service.waitlist.pending() == []
+
+def test_join_waitlist_of_an_available_office(service):
+    service.book("Aqua", "B1", WEEK[0], "Matin", "Alice")
+    with pytest.raises(ReservationError):
+        service.join_waitlist("Aqua", "B1", WEEK[0], "Après-midi", "Bob")
+    # Nobody waits for their own reservation
+    with pytest.raises(ReservationError):
+        service.join_waitlist("Aqua", "B1", WEEK[0], "Matin", "Alice")
+
+
+#####################################################################
+# ====================== RECURRING RESERVATIONS =================== #
+#####################################################################
+
+def roll(service, weeks):
+    # Add business days after the end of the grid, as when the calendar rolls
+    days = build_calendar(OFFICES, LAST_DAY + datetime.timedelta(days=1), LAST_DAY + datetime.timedelta(weeks=weeks))
+    service.store.save(concat_grids([service.load("Aqua"), days]), FILE_NAME)
+
+def test_add_rule_reserves_up_to_the_end_of_the_grid(service):
+    rule, reserved, skipped = service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], TUESDAYS[-1], "Alice")
+
+    assert (reserved, skipped) == (2, [])
+    assert service.list_rules("Aqua") == [dict(rule, until="2025-02-07")]
+    df = service.load("Aqua")
+    assert [cell(df, day) for day in TUESDAYS[:2]] == ["Alice", "Alice"]
+    assert cell(df, TUESDAYS[0], slot="Après-midi") == AVAILABLE
+
+def test_add_rule_with_a_conflict_reserves_nothing(service):
+    book(service.store, FEBRUARY, name="Bob")
+
+    with pytest.raises(ReservationError, match="B1 \\(Matin le 04/02/2025\\)"):
+        service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], LAST_DAY, "Alice")
+    assert service.list_rules("Aqua") == []
+    assert cell(service.load("Aqua"), TUESDAYS[0]) == AVAILABLE
+
+    _, reserved, skipped = service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], LAST_DAY, "Alice", skip_conflicts=True)
+    assert (reserved, skipped) == (1, [(FEBRUARY, "Matin", "B1")])
+
+def test_add_rule_is_removed_when_its_reservations_fail(service, monkeypatch):
+    def overtaken(*args, **kwargs):
+        raise ConcurrentModificationError("The grid kept changing.")
+
+    monkeypatch.setattr(service, "book_cells", overtaken)
+    with pytest.raises(ConcurrentModificationError):
+        service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], LAST_DAY, "Alice")
+    assert service.list_rules("Aqua") == []
+
+def test_materialize_rules_reserves_the_new_days(service):
+    rule, _, _ = service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], TUESDAYS[-1], "Alice")
+    roll(service, weeks=2)
+    book(service.store, TUESDAYS[2], name="Bob")
+
+    assert service.materialize_rules("Aqua", TUESDAYS[-1]) == {rule["id"]: [(TUESDAYS[2], "Matin", "B1")]}
+    df = service.load("Aqua")
+    assert [cell(df, day) for day in TUESDAYS] == ["Alice", "Alice", "Bob", "Alice"]
+    assert service.list_rules("Aqua")[0]["until"] == TUESDAYS[-1].isoformat()
+    # Every day is reserved already: nothing is expanded again
+    assert service.materialize_rules("Aqua", TUESDAYS[-1]) == {}
+
+def test_delete_rule_only_frees_its_own_cells(service):
+    rule, _, _ = service.add_rule("Aqua", "B1", [1], "Matin", WEEK[0], TUESDAYS[-1], "Alice")
+    roll(service, weeks=2)
+    book(service.store, TUESDAYS[2], name="Bob")
+    service.materialize_rules("Aqua", TUESDAYS[-1])
+
+    assert service.delete_rule("Aqua", rule["id"], FEBRUARY) == 2
+    df = service.load("Aqua")
+    assert [cell(df, day) for day in TUESDAYS] == ["Alice", AVAILABLE, "Bob", AVAILABLE]
+    assert service.list_rules("Aqua") == []
+    with pytest.raises(ReservationError):
+        service.delete_rule("Aqua", rule["id"], FEBRUARY)
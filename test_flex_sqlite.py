@@ -0,0 +1,104 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import pandas as pd
+import pytest
+
+from conftest import FEBRUARY, FILE_NAME, OFFICES, WEEK, book, cell
+from flex_events import BOOK, CANCEL, fold_events
+from flex_grid import AVAILABLE, ReservationError, book_slots
+from flex_partitions import PartitionedFrameStore
+from flex_sqlite import SQLiteStore
+from flex_storage import FrameStore
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def store(tmp_path, grid):
+    store = SQLiteStore(str(tmp_path / "flexoffice.db"))
+    store.save(grid, FILE_NAME)
+    return store
+
+
+#####################################################################
+# ========================== CHANGE FEED ========================== #
+#####################################################################
+
+def test_triggers_record_bookings_and_cancellations(store):
+    since = store.version(FILE_NAME)
+    store.book_slots(FILE_NAME, WEEK[1], "Journée", "B1", "Alice")
+    store.release_cells(FILE_NAME, [(WEEK[1], "Après-midi", "B1")], "Alice")
+
+    events, version = store.changes(FILE_NAME, since)
+    assert version == str(int(since) + 2)
+    assert [(event["action"], event["slot"], event["name"]) for event in events] == [
+        (BOOK, "Matin", "Alice"), (BOOK, "Après-midi", "Alice"), (CANCEL, "Après-midi", "Alice")]
+    assert all(event["date"] == "2025-01-28" and event["office"] == "B1" for event in events)
+    assert store.changes(FILE_NAME, version) == ([], version)
+
+def test_changes_bring_a_client_up_to_date(store):
+    client, since = store.load_versioned(FILE_NAME)
+    store.update(FILE_NAME, lambda df: book_slots(df, WEEK[1], "Matin", "B2", "Bob"))
+    store.release_slots(FILE_NAME, WEEK[1], "Matin", "B2", reassign={"Matin": "Carol"})
+
+    events, _ = store.changes(FILE_NAME, since)
+    fold_events(client, events)
+    assert cell(client, WEEK[1], "B2") == "Carol"
+    # The categories of the names may differ, not the cells
+    assert client[OFFICES].astype(str).equals(store.load(FILE_NAME)[OFFICES].astype(str))
+
+def test_changes_before_a_save_are_unknown(store, grid):
+    since = store.version(FILE_NAME)
+    store.book_slots(FILE_NAME, WEEK[1], "Matin", "B1", "Alice")
+    store.save(grid, FILE_NAME)
+
+    events, version = store.changes(FILE_NAME, since)
+    assert events is None
+    assert version == store.version(FILE_NAME)
+
+def test_refused_booking_records_nothing(store):
+    store.book_slots(FILE_NAME, WEEK[1], "Après-midi", "B1", "Bob")
+    since = store.version(FILE_NAME)
+
+    with pytest.raises(ReservationError):
+        store.book_slots(FILE_NAME, WEEK[1], "Journée", "B1", "Alice")
+    assert store.changes(FILE_NAME, since) == ([], since)
+    assert cell(store.load(FILE_NAME), WEEK[1], "B1") == AVAILABLE
+
+
+#####################################################################
+# ============================ SHARING ============================ #
+#####################################################################
+
+def test_two_stores_share_the_database(store):
+    other = SQLiteStore(store.path)  # Another process on the same database
+    since = other.version(FILE_NAME)
+    store.book_slots(FILE_NAME, WEEK[1], "Matin", "B1", "Alice")
+
+    events, _ = other.changes(FILE_NAME, since)
+    assert [(event["action"], event["name"]) for event in events] == [(BOOK, "Alice")]
+    with pytest.raises(ReservationError):
+        other.book_slots(FILE_NAME, WEEK[1], "Matin", "B1", "Bob")
+
+def test_grid_is_imported_from_the_seed(tmp_path, backend):
+    seed = FrameStore(backend)
+    book(seed, WEEK[1], office="B2", name="Bob")
+
+    store = SQLiteStore(str(tmp_path / "flexoffice.db"), seed=seed)
+    assert cell(store.load(FILE_NAME), WEEK[1], "B2") == "Bob"
+    with pytest.raises(FileNotFoundError):
+        SQLiteStore(str(tmp_path / "other.db")).load(FILE_NAME)
+
+def test_archived_months_are_not_imported(tmp_path, backend):
+    seed = PartitionedFrameStore(backend)
+    book(seed, WEEK[1])
+    seed.archive(FILE_NAME, FEBRUARY.replace(day=1))
+
+    store = SQLiteStore(str(tmp_path / "flexoffice.db"), seed=seed)
+    df = store.load(FILE_NAME)
+    assert df['Date'].min() == pd.Timestamp(FEBRUARY.replace(day=3))
+    assert store.load_range(FILE_NAME, WEEK[0], WEEK[-1])[0].empty
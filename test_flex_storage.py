@@ -0,0 +1,136 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import pytest
+
+from conftest import FILE_NAME, OFFICES, WEEK, book, cell
+from flex_grid import AVAILABLE, book_slots, decode_grid
+from flex_storage import (FORMATS, ConcurrentModificationError, FrameStore, LocalBackend, MemoryBackend, S3Backend,
+                          deserialize_frame, serialize_frame, storage_key)
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture(params=["memory", "local", "s3"])
+def storage_backend(request, tmp_path):
+    # Every kind of backend, empty
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "local":
+        yield LocalBackend(str(tmp_path))
+    else:
+        boto3 = pytest.importorskip("boto3")
+        moto = pytest.importorskip("moto")
+        with moto.mock_aws():
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket="bucketflextest")
+            yield S3Backend(client, "bucketflextest")
+
+
+#####################################################################
+# ============================ BACKENDS =========================== #
+#####################################################################
+
+def test_read_of_a_missing_file(storage_backend):
+    with pytest.raises(FileNotFoundError):
+        storage_backend.read("missing.bin")
+    with pytest.raises(FileNotFoundError):
+        storage_backend.head("missing.bin")
+    assert not storage_backend.exists("missing.bin")
+
+def test_write_returns_the_version_read(storage_backend):
+    version = storage_backend.write("FlexTest.parquet", b"grid")
+    assert storage_backend.read("FlexTest.parquet") == (b"grid", version)
+    assert storage_backend.head("FlexTest.parquet") == version
+
+def test_list_keys_under_a_prefix(storage_backend):
+    storage_backend.write_many([(f"events/FlexTest/{i:012d}.json", b"[]", "application/json") for i in (1, 2, 3)])
+    storage_backend.write("events/FlexTest.snapshot.json", b"{}")
+
+    keys = storage_backend.list_keys("events/FlexTest/")
+    assert keys == [f"events/FlexTest/{i:012d}.json" for i in (1, 2, 3)]
+    assert storage_backend.list_keys("events/FlexTest/", start_after=keys[0]) == keys[1:]
+    assert {key: data for key, (data, _) in storage_backend.read_many(keys).items()} == dict.fromkeys(keys, b"[]")
+
+
+#####################################################################
+# ============================ FORMATS ============================ #
+#####################################################################
+
+@pytest.mark.parametrize("fmt", list(FORMATS))
+def test_formats_round_trip(grid, fmt):
+    book_slots(grid, WEEK[0], "Journée", "B2", "Alice")
+    df = deserialize_frame(serialize_frame(grid, fmt), fmt)
+    assert list(df.columns) == ['Date', 'Créneau'] + OFFICES
+    assert df.astype(str).equals(decode_grid(grid).astype(str))
+
+def test_legacy_workbook_is_migrated_on_first_load(grid):
+    book_slots(grid, WEEK[0], "Matin", "B1", "Alice")
+    backend = MemoryBackend({"FlexTest.xlsx": serialize_frame(grid, "xlsx")})
+
+    df = FrameStore(backend).load(FILE_NAME)
+    assert cell(df, WEEK[0]) == "Alice"
+    assert cell(df, WEEK[1]) == AVAILABLE
+    assert backend.exists(storage_key(FILE_NAME, "parquet"))
+
+
+#####################################################################
+# ====================== CONDITIONAL WRITES ======================= #
+#####################################################################
+
+def test_write_if_match_rejects_a_stale_version(storage_backend):
+    stale = storage_backend.write("FlexTest.parquet", b"1")
+    current = storage_backend.write("FlexTest.parquet", b"2", if_match=stale)
+    with pytest.raises(ConcurrentModificationError):
+        storage_backend.write("FlexTest.parquet", b"3", if_match=stale)
+    assert storage_backend.read("FlexTest.parquet") == (b"2", current)
+
+def test_write_if_none_match_only_creates(storage_backend):
+    version = storage_backend.write("FlexTest.parquet", b"1", if_none_match=True)
+    with pytest.raises(ConcurrentModificationError):
+        storage_backend.write("FlexTest.parquet", b"2", if_none_match=True)
+    assert storage_backend.read("FlexTest.parquet") == (b"1", version)
+
+
+#####################################################################
+# ======================= COMPARE AND SWAP ======================== #
+#####################################################################
+
+def test_update_retries_on_the_fresh_grid(storage_backend, grid):
+    store = FrameStore(storage_backend)
+    store.save(grid, FILE_NAME)
+    other = FrameStore(storage_backend)  # Another server, with its own cache
+    attempts = []
+
+    def mutate(df):
+        if not attempts:
+            # Someone else books between the load and the save of the first attempt
+            book(other, WEEK[0], office="B2", name="Bob")
+        attempts.append(df)
+        book_slots(df, WEEK[0], "Matin", "B1", "Alice")
+
+    store.update(FILE_NAME, mutate)
+
+    assert len(attempts) == 2
+    df = FrameStore(storage_backend).load(FILE_NAME)
+    assert (cell(df, WEEK[0]), cell(df, WEEK[0], "B2")) == ("Alice", "Bob")
+
+def test_update_gives_up_when_the_file_keeps_changing(storage_backend, grid):
+    store = FrameStore(storage_backend)
+    store.save(grid, FILE_NAME)
+    other = FrameStore(storage_backend)
+    attempts = []
+
+    def mutate(df):
+        # Every attempt is overtaken by a booking of someone else, on another day
+        book(other, WEEK[len(attempts)], office="B2", name="Bob")
+        attempts.append(df)
+        book_slots(df, WEEK[0], "Matin", "B1", "Alice")
+
+    with pytest.raises(ConcurrentModificationError):
+        store.update(FILE_NAME, mutate, retries=1)
+    assert len(attempts) == 2
+    assert (FrameStore(storage_backend).load(FILE_NAME)['B1'] == AVAILABLE).all()
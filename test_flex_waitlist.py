@@ -0,0 +1,83 @@
+#####################################################################
+# =========================== LIBRAIRIES ========================== #
+#####################################################################
+
+import pytest
+
+from conftest import WEEK
+from flex_waitlist import Waitlist
+
+
+#####################################################################
+# ============================ FIXTURES =========================== #
+#####################################################################
+
+@pytest.fixture
+def waitlist(tmp_path):
+    return Waitlist(str(tmp_path / "flexwaitlist.db"))
+
+def join(waitlist, name, slots=("Matin",)):
+    return waitlist.join("Aqua", "B1", WEEK[0], list(slots), name, f"{name.lower()}@example.com")
+
+def queue(waitlist, slot="Matin"):
+    return waitlist.queue("Aqua", "B1", WEEK[0], slot)
+
+
+#####################################################################
+# ============================= QUEUES ============================ #
+#####################################################################
+
+def test_join_keeps_the_place_of_a_person_already_waiting(waitlist):
+    assert join(waitlist, "Bob") == {"Matin": 1}
+    assert join(waitlist, "Carol", ["Matin", "Après-midi"]) == {"Matin": 2, "Après-midi": 1}
+    assert join(waitlist, "Bob") == {"Matin": 1}
+    assert queue(waitlist) == ["Bob", "Carol"]
+
+def test_claim_takes_the_first_person_of_each_queue(waitlist):
+    join(waitlist, "Bob")
+    join(waitlist, "Carol", ["Matin", "Après-midi"])
+
+    claimed = waitlist.claim("Aqua", "B1", WEEK[0], ["Matin", "Après-midi"])
+    assert {slot: waiter[1:3] for slot, waiter in claimed.items()} == {
+        "Matin": ("Bob", "bob@example.com"), "Après-midi": ("Carol", "carol@example.com")}
+    assert (queue(waitlist), queue(waitlist, "Après-midi")) == (["Carol"], [])
+    # Once claimed, leaving the queue finds nothing
+    assert waitlist.leave("Aqua", "B1", WEEK[0], ["Matin"], "Bob") == []
+
+def test_restore_puts_people_back_at_their_place(waitlist):
+    join(waitlist, "Bob")
+    claimed = waitlist.claim("Aqua", "B1", WEEK[0], ["Matin"])
+    join(waitlist, "Carol")
+
+    waitlist.restore("Aqua", "B1", WEEK[0], claimed)
+    assert queue(waitlist) == ["Bob", "Carol"]
+
+def test_restore_keeps_the_new_place_of_a_person_who_queued_again(waitlist):
+    join(waitlist, "Bob")
+    claimed = waitlist.claim("Aqua", "B1", WEEK[0], ["Matin"])
+    join(waitlist, "Carol")
+    join(waitlist, "Bob")
+
+    waitlist.restore("Aqua", "B1", WEEK[0], claimed)
+    assert queue(waitlist) == ["Carol", "Bob"]
+
+
+#####################################################################
+# ============================= OUTBOX ============================ #
+#####################################################################
+
+def test_a_failed_delivery_stays_pending(waitlist):
+    join(waitlist, "Bob", ["Matin", "Après-midi"])
+    waitlist.assigned("Aqua", "B1", WEEK[0], waitlist.claim("Aqua", "B1", WEEK[0], ["Matin", "Après-midi"]))
+    sent = []
+
+    def send(notification):
+        if sent:
+            raise ConnectionError("The mail server is down.")
+        sent.append(notification["slot"])
+
+    with pytest.raises(ConnectionError):
+        waitlist.deliver(send)
+    assert [notification["slot"] for notification in waitlist.pending()] == ["Après-midi"]
+    assert waitlist.deliver(lambda notification: None) == 1
+    assert waitlist.pending() == []